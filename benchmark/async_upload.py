@@ -0,0 +1,55 @@
+import io
+import time
+import asyncio
+import click
+
+from subir import Uploader, Session, SessionPool
+from subir.cache import ColumnTypeCache
+from subir.trace import Tracer
+from data_layer import Redshift as SQL
+from .generate import upload_frame
+from .layer import FakeLayer
+from typing import Dict, List
+
+async def heartbeat(interval: float, lags: List[float], stop: asyncio.Event):
+  while not stop.is_set():
+    start = time.perf_counter()
+    await asyncio.sleep(interval)
+    lags.append(time.perf_counter() - start - interval)
+
+async def run_uploads(uploader: Uploader, pool: SessionPool, upload_csv: str, uploads: int, chunk_size: int) -> Dict[str, float]:
+  lags = []
+  stop = asyncio.Event()
+  monitor = asyncio.create_task(heartbeat(interval=0.01, lags=lags, stop=stop))
+  start = time.perf_counter()
+  await asyncio.gather(*(
+    uploader.upload_async(pool=pool, schema_name='benchmark', table_name='benchmark_upload', merge_column_names=[], csv_stream=io.StringIO(upload_csv), chunk_size=chunk_size)
+    for _ in range(uploads)
+  ))
+  seconds = time.perf_counter() - start
+  stop.set()
+  await monitor
+  return {
+    'seconds': seconds,
+    'max_lag': max(lags) if lags else 0,
+  }
+
+@click.command()
+@click.option('-r', '--rows', 'rows', type=int, default=50000)
+@click.option('-c', '--columns', 'columns', type=int, default=20)
+@click.option('--chunk-size', 'chunk_size', type=int, default=10000)
+@click.option('-u', '--uploads', 'upload_counts', type=int, multiple=True, default=[1, 4, 16])
+@click.option('-p', '--pool-size', 'pool_size', type=click.IntRange(min=1), default=4)
+def benchmark(rows: int, columns: int, chunk_size: int, upload_counts: List[int], pool_size: int):
+  data_frame = upload_frame(rows=rows, columns=columns)
+  upload_csv = data_frame.to_csv(index=False)
+  cache = ColumnTypeCache()
+  cache.set(database=SQL.Layer.connection_options.database, schema='benchmark', table='benchmark_upload', column_types={c: 'character varying(256)' for c in data_frame.columns})
+  uploader = Uploader(column_type_cache=cache, tracer=Tracer())
+  with SessionPool(size=pool_size, session_factory=lambda: Session(layer=FakeLayer())) as pool:
+    for uploads in upload_counts:
+      result = asyncio.run(run_uploads(uploader=uploader, pool=pool, upload_csv=upload_csv, uploads=uploads, chunk_size=chunk_size))
+      print(f'{uploads:>4} concurrent uploads of {rows} rows {result["seconds"]:>9.3f}s {uploads * rows / result["seconds"]:>12.0f} rows/s  max event loop lag {result["max_lag"] * 1000:.1f}ms')
+
+if __name__ == '__main__':
+  benchmark()
@@ -0,0 +1,46 @@
+import re
+import time
+import click
+import pandas as pd
+
+from subir.base import ColumnType
+from .generate import upload_frame
+
+def legacy_from_pd_column(pd_column: pd.Series) -> ColumnType:
+  type_name = str(pd_column.dtype)
+  if type_name != 'object':
+    return ColumnType.from_pd_column(pd_column)
+  length = pd_column.apply(str).apply(len).max()
+  if length > 2048:
+    return ColumnType.long_text
+  if length < 64:
+    empty = True
+    for value in pd_column:
+      if not value or pd.isna(value):
+        continue
+      empty = False
+      if not re.match(r'[0-9]{1,2}[/-][0-9]{1,2}[/-][0-9]{2,4}', value) and not re.match(r'[0-9]{2,4}[/-][0-9]{1,2}[/-][0-9]{1,2}', value):
+        return ColumnType.short_text
+    return ColumnType.short_text if empty else ColumnType.date
+  return ColumnType.medium_text
+
+def time_inference(df: pd.DataFrame, infer: any):
+  start = time.perf_counter()
+  types = {c: infer(df[c]) for c in df}
+  return types, time.perf_counter() - start
+
+@click.command()
+@click.option('-r', '--rows', 'row_counts', type=int, multiple=True, default=[100000, 1000000])
+@click.option('-c', '--columns', 'column_counts', type=int, multiple=True, default=[10, 100])
+def benchmark(row_counts: list, column_counts: list):
+  for rows in row_counts:
+    for columns in column_counts:
+      df = upload_frame(rows=rows, columns=columns)
+      legacy_types, legacy_seconds = time_inference(df, legacy_from_pd_column)
+      types, seconds = time_inference(df, ColumnType.from_pd_column)
+      if types != legacy_types:
+        raise ValueError('Column type mismatch', {c: (legacy_types[c], types[c]) for c in types if types[c] != legacy_types[c]})
+      print(f'{rows} rows x {columns} columns: legacy {legacy_seconds:.3f}s, vectorized {seconds:.3f}s ({legacy_seconds / seconds:.1f}x)')
+
+if __name__ == '__main__':
+  benchmark()
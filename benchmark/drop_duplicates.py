@@ -0,0 +1,82 @@
+import os
+import json
+import time
+import tempfile
+import tracemalloc
+import click
+import pandas as pd
+
+from subir import tag
+from subir.tag import EntityType, Tagger
+from .generate import tag_frame
+
+def legacy_drop_duplicates(df: pd.DataFrame, original_df: pd.DataFrame, entity: EntityType, outputs: dict, resolution: str):
+  df.drop_duplicates(subset=list(entity.identifier_columns.keys()) + entity.tag_column_names, inplace=True)
+  duplicated_series = df.duplicated(subset=entity.identifier_columns.keys(), keep=False)
+  duplicate_rows = pd.DataFrame(df[duplicated_series.values])
+  if not len(duplicate_rows):
+    return
+  if original_df is None:
+    df.drop_duplicates(subset=list(entity.identifier_columns.keys()), keep='last', inplace=True)
+    return
+  duplicate_rows[entity.id_column_names[0]] = duplicate_rows[entity.id_column_names[0]].apply(json.dumps)
+  duplicate_rows['is_duplicate'] = True
+  original_duplicates = original_df.sort_values(list(entity.identifier_columns.keys())).join(
+    duplicate_rows[[*entity.identifier_columns.keys(), 'is_duplicate']].drop_duplicates(subset=list(entity.identifier_columns.keys())).set_index(list(entity.identifier_columns.keys())),
+    on=list(entity.identifier_columns.keys())
+  )
+  outputs['conflicting'] = original_duplicates[original_duplicates.is_duplicate == True].drop('is_duplicate', axis=1)
+  outputs['non_conflicting'] = original_duplicates[original_duplicates.is_duplicate != True].drop('is_duplicate', axis=1)
+  keep_map = {
+    'f': 'first',
+    'l': 'last',
+    's': False,
+  }
+  df.drop_duplicates(subset=list(entity.identifier_columns.keys()), keep=keep_map[resolution], inplace=True)
+
+def hashed_drop_duplicates(df: pd.DataFrame, original_df: pd.DataFrame, entity: EntityType, outputs: dict, resolution: str):
+  write_output, prompt = tag.write_output, tag.click.prompt
+  tag.write_output = lambda df, file_name, description: outputs.__setitem__('non_conflicting' if 'non_conflicting' in file_name else 'conflicting', df)
+  tag.click.prompt = lambda *args, **kwargs: resolution
+  try:
+    tag.drop_duplicates(df=df, original_df=original_df, entity=entity, output_prefix='benchmark', interactive=original_df is not None)
+  finally:
+    tag.write_output, tag.click.prompt = write_output, prompt
+
+def prepared_tags(rows: int, entity: EntityType, seed: int=0) -> tuple:
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'benchmark_tags.csv')
+    tag_frame(rows=rows, entity=entity, seed=seed).to_csv(path, index=False)
+    _, df, original_df = Tagger().read_tags(csv_stream=path, entity_name=entity.value, interactive=True)
+  return df, original_df
+
+def run_engine(engine: any, df: pd.DataFrame, original_df: pd.DataFrame, entity: EntityType, resolution: str, trace_memory: bool=False) -> tuple:
+  df = df.copy()
+  outputs = {}
+  if trace_memory:
+    tracemalloc.start()
+  start = time.perf_counter()
+  engine(df=df, original_df=original_df, entity=entity, outputs=outputs, resolution=resolution)
+  seconds = time.perf_counter() - start
+  peak = 0
+  if trace_memory:
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+  return df, outputs, seconds, peak
+
+@click.command()
+@click.option('-r', '--rows', 'row_counts', type=int, multiple=True, default=[1000000, 10000000])
+@click.option('-e', '--entity', 'entity_name', type=click.Choice([e.value for e in EntityType]), default='ad')
+def benchmark(row_counts: list, entity_name: str):
+  entity = EntityType(entity_name)
+  for rows in row_counts:
+    df, original_df = prepared_tags(rows=rows, entity=entity)
+    for mode, mode_original_df in [('interactive', original_df), ('batch', None)]:
+      _, _, legacy_seconds, _ = run_engine(legacy_drop_duplicates, df, mode_original_df, entity, 'l')
+      _, _, seconds, _ = run_engine(hashed_drop_duplicates, df, mode_original_df, entity, 'l')
+      _, _, _, legacy_peak = run_engine(legacy_drop_duplicates, df, mode_original_df, entity, 'l', trace_memory=True)
+      _, _, _, peak = run_engine(hashed_drop_duplicates, df, mode_original_df, entity, 'l', trace_memory=True)
+      print(f'{rows} rows {mode}: legacy {legacy_seconds:.3f}s peak {legacy_peak / 1048576:.1f} MB, hashed {seconds:.3f}s peak {peak / 1048576:.1f} MB ({legacy_seconds / seconds:.1f}x)')
+
+if __name__ == '__main__':
+  benchmark()
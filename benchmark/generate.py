@@ -0,0 +1,74 @@
+import os
+import click
+import numpy as np
+import pandas as pd
+
+from subir.tag import EntityType
+
+def upload_frame(rows: int, columns: int, seed: int=0) -> pd.DataFrame:
+  random = np.random.default_rng(seed)
+  dates = pd.Series(pd.date_range('2019-01-01', periods=1000).strftime('%Y-%m-%d'))
+  frame = {}
+  for index in range(columns):
+    kind = index % 5
+    if kind == 0:
+      frame[f'integer_{index}'] = random.integers(0, 1000000, rows)
+    elif kind == 1:
+      frame[f'decimal_{index}'] = random.random(rows)
+    elif kind == 2:
+      frame[f'date_{index}'] = dates.sample(rows, replace=True, random_state=index).values
+    elif kind == 3:
+      frame[f'text_{index}'] = pd.Series(random.integers(0, 100000, rows)).astype(str).radd('campaign ').values
+    else:
+      values = pd.Series(random.integers(0, 100000, rows)).astype(str).radd('ad-').astype(object)
+      values[random.random(rows) < 0.1] = np.nan
+      frame[f'nullable_text_{index}'] = values.values
+  return pd.DataFrame(frame)
+
+def tag_frame(rows: int, entity: EntityType=EntityType.ad, duplicate_rate: float=0.05, conflict_rate: float=0.01, empty_rate: float=0.02, seed: int=0) -> pd.DataFrame:
+  random = np.random.default_rng(seed)
+  unique_rows = max(1, int(rows * (1 - duplicate_rate - conflict_rate)))
+  ids = pd.Series(random.choice(10 ** 12, unique_rows, replace=False) + 10 ** 12).astype(str)
+  quoted = random.random(unique_rows) < 0.5
+  ids[quoted] = '"' + ids[quoted] + '"'
+  tags = pd.Series(random.integers(0, 200, unique_rows)).astype(str).radd('tag ').astype(object)
+  tags[random.random(unique_rows) < empty_rate] = np.nan
+  subtags = pd.Series(random.integers(0, 20, unique_rows)).astype(str).radd(' subtag ').astype(object)
+  subtags[random.random(unique_rows) < 0.3] = np.nan
+  df = pd.DataFrame({
+    'company': 'company',
+    'app': pd.Series(random.integers(0, 5, unique_rows)).astype(str).radd('app '),
+    'channel': random.choice(['Facebook', 'Google', 'Apple Search Ads', 'Snapchat'], unique_rows),
+    f'{entity.value}_id': ids,
+    f'{entity.value}_tag': tags,
+    f'{entity.value}_subtag': subtags,
+  })
+  duplicates = df.sample(int(rows * duplicate_rate), replace=True, random_state=seed)
+  conflicts = df.sample(rows - len(df) - len(duplicates), replace=True, random_state=seed + 1).copy()
+  conflicts[f'{entity.value}_tag'] = conflicts[f'{entity.value}_tag'].fillna('tag').astype(str) + ' conflict'
+  return pd.concat([df, duplicates, conflicts]).sample(frac=1, random_state=seed).reset_index(drop=True)
+
+@click.group()
+def generate():
+  pass
+
+@generate.command()
+@click.option('-r', '--rows', 'rows', type=int, default=100000)
+@click.option('-e', '--entity', 'entity_name', type=click.Choice([e.value for e in EntityType]), default='ad')
+@click.option('--seed', 'seed', type=int, default=0)
+@click.argument('path', type=click.Path(dir_okay=False))
+def tags(rows: int, entity_name: str, seed: int, path: str):
+  tag_frame(rows=rows, entity=EntityType(entity_name), seed=seed).to_csv(path, index=False)
+  print(f'{rows} {entity_name} tag rows written to {path} ({os.path.getsize(path)} bytes)')
+
+@generate.command()
+@click.option('-r', '--rows', 'rows', type=int, default=100000)
+@click.option('-c', '--columns', 'columns', type=int, default=20)
+@click.option('--seed', 'seed', type=int, default=0)
+@click.argument('path', type=click.Path(dir_okay=False))
+def upload(rows: int, columns: int, seed: int, path: str):
+  upload_frame(rows=rows, columns=columns, seed=seed).to_csv(path, index=False)
+  print(f'{rows} x {columns} upload rows written to {path} ({os.path.getsize(path)} bytes)')
+
+if __name__ == '__main__':
+  generate()
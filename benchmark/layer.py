@@ -0,0 +1,63 @@
+from data_layer import Redshift as SQL
+from typing import Optional, List
+
+class FakeCursor:
+  connection: any
+
+  def __init__(self, connection: any):
+    self.connection = connection
+
+  def execute(self, query: str, parameters: Optional[any]=None):
+    self.connection.statements.append(query)
+
+  def fetchone(self):
+    return (0,)
+
+  def fetchall(self):
+    return []
+
+  def copy_expert(self, query: str, stream: any):
+    self.connection.statements.append(query)
+    self.connection.copied_bytes += len(stream.read())
+
+class FakeConnection:
+  autocommit: bool
+  statements: List[str]
+  copied_bytes: int
+
+  def __init__(self):
+    self.autocommit = False
+    self.statements = []
+    self.copied_bytes = 0
+
+  def cursor(self) -> FakeCursor:
+    return FakeCursor(connection=self)
+
+  def commit(self):
+    pass
+
+  def rollback(self):
+    pass
+
+  def close(self):
+    pass
+
+class FakeLayer(SQL.Layer):
+  inserted_rows: int
+
+  def __init__(self):
+    super().__init__()
+    self.connection = None
+    self.inserted_rows = 0
+
+  def connect(self):
+    self.connection = FakeConnection()
+
+  def disconnect(self):
+    self.connection = None
+
+  def commit(self):
+    self.connection.commit()
+
+  def insert_data_frame(self, data_frame: any, **kwargs):
+    self.inserted_rows += len(data_frame)
@@ -0,0 +1,59 @@
+import os
+import re
+import sys
+import subprocess
+import click
+
+from typing import Dict, Iterable, List, Tuple
+
+run_path = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'run.py')
+subcommands = ['', 'create', 'upload', 'batch-upload', 'tag', 'restore']
+heavy_packages = ['pandas', 'numpy', 'pyarrow', 'sqlalchemy', 'data_layer', 'config']
+import_time_pattern = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+def import_lines(subcommand: str) -> List[Tuple[str, int, int]]:
+  arguments = [sys.executable, '-X', 'importtime', run_path, *([subcommand] if subcommand else []), '--help']
+  process = subprocess.run(arguments, capture_output=True, text=True)
+  if process.returncode != 0:
+    raise click.ClickException(f'{" ".join(arguments)} failed\n{process.stderr}')
+  lines = []
+  for line in process.stderr.splitlines():
+    match = import_time_pattern.match(line)
+    if match:
+      lines.append((match.group(4), int(match.group(2)), len(match.group(3)) // 2))
+  return lines
+
+def import_times(subcommand: str) -> List[Tuple[str, int]]:
+  return [(m, t) for m, t, depth in import_lines(subcommand=subcommand) if not depth]
+
+def heavy_imports(modules: Iterable[str]) -> List[str]:
+  return sorted({m.split('.')[0] for m in modules} & set(heavy_packages))
+
+def measure_startup(subcommand: str, repeat: int) -> Dict[str, any]:
+  runs = [import_lines(subcommand=subcommand) for _ in range(repeat)]
+  return {
+    'subcommand': subcommand or '(group)',
+    'microseconds': min(sum(t for _, t, depth in r if not depth) for r in runs),
+    'slowest': sorted([(m, t) for m, t, depth in runs[-1] if not depth], key=lambda m: m[1], reverse=True)[:3],
+    'heavy': heavy_imports(modules=(m for r in runs for m, _, _ in r)),
+  }
+
+@click.command()
+@click.option('-b', '--budget-ms', 'budget_ms', type=click.FloatRange(min=0), default=300)
+@click.option('-r', '--repeat', 'repeat', type=click.IntRange(min=1), default=3)
+def benchmark(budget_ms: float, repeat: int):
+  failures = []
+  for subcommand in subcommands:
+    result = measure_startup(subcommand=subcommand, repeat=repeat)
+    milliseconds = result['microseconds'] / 1000
+    slowest = ', '.join(f'{m} {t / 1000:.1f}ms' for m, t in result['slowest'])
+    print(f'{result["subcommand"]:<14} {milliseconds:>8.1f}ms imports  slowest: {slowest}')
+    if result['heavy']:
+      failures.append(f'{result["subcommand"]} imports {", ".join(result["heavy"])} before running')
+    if milliseconds > budget_ms:
+      failures.append(f'{result["subcommand"]} import time {milliseconds:.1f}ms exceeds the {budget_ms:.0f}ms budget')
+  if failures:
+    raise click.ClickException('\n'.join(failures))
+
+if __name__ == '__main__':
+  benchmark()
@@ -0,0 +1,109 @@
+import io
+import os
+import sys
+import json
+import time
+import click
+
+from subir import Uploader, Tagger, Session
+from subir.cache import ColumnTypeCache
+from subir.trace import Tracer, SummarySink, peak_rss
+from data_layer import Redshift as SQL
+from .generate import upload_frame, tag_frame
+from .layer import FakeLayer
+from typing import Optional, Callable, Dict, List, Tuple
+
+default_output_path = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'output', 'benchmark.json')
+
+def measure(case: str, rows: int, operation: Callable[[], any]) -> Dict[str, any]:
+  start = time.perf_counter()
+  operation()
+  seconds = time.perf_counter() - start
+  result = {
+    'case': case,
+    'rows': rows,
+    'seconds': seconds,
+    'rows_per_second': rows / seconds if seconds else None,
+    'peak_rss': peak_rss(),
+  }
+  print(f'{case:<28} {rows:>10} rows {seconds:>9.3f}s {result["rows_per_second"] or 0:>12.0f} rows/s', file=sys.stderr)
+  return result
+
+def session_for(database_name: Optional[str]) -> Session:
+  return Session() if database_name else Session(layer=FakeLayer())
+
+def run_cases(rows: int, columns: int, chunk_size: int, schema_name: str, database_name: Optional[str], tracer: Tracer) -> List[Dict[str, any]]:
+  results = []
+  upload_csv = upload_frame(rows=rows, columns=columns).to_csv(index=False)
+  tag_csv = tag_frame(rows=rows).to_csv(index=False)
+  table_name = 'benchmark_upload'
+
+  with session_for(database_name) as session:
+    cache = ColumnTypeCache()
+    uploader = Uploader(session=session, column_type_cache=cache, tracer=tracer)
+    column_types = {}
+    results.append(measure('get_table_structure', rows, lambda: column_types.update(uploader.get_table_structure(csv_stream=io.StringIO(upload_csv)))))
+    results.append(measure('get_table_structure_chunked', rows, lambda: uploader.get_table_structure(csv_stream=io.StringIO(upload_csv), chunk_size=chunk_size)))
+
+    if database_name:
+      if uploader.get_column_types_result(schema_name=schema_name, table_name=table_name):
+        uploader.delete_table(schema_name=schema_name, table_name=table_name)
+      uploader.create_table(schema_name=schema_name, table_name=table_name, column_types=column_types)
+    else:
+      cache.set(database=SQL.Layer.connection_options.database, schema=schema_name, table=table_name, column_types=column_types)
+
+    results.append(measure('upload', rows, lambda: uploader.upload(schema_name=schema_name, table_name=table_name, merge_column_names=[], csv_stream=io.StringIO(upload_csv), replace=True)))
+    results.append(measure('upload_chunked', rows, lambda: uploader.upload(schema_name=schema_name, table_name=table_name, merge_column_names=[], csv_stream=io.StringIO(upload_csv), replace=True, chunk_size=chunk_size)))
+    results.append(measure('upload_pipelined', rows, lambda: uploader.upload(schema_name=schema_name, table_name=table_name, merge_column_names=[], csv_stream=io.StringIO(upload_csv), replace=True, chunk_size=chunk_size, pipeline_depth=2)))
+    results.append(measure('upload_typed', rows, lambda: uploader.upload(schema_name=schema_name, table_name=table_name, merge_column_names=[], csv_stream=io.StringIO(upload_csv), replace=True, chunk_size=chunk_size, typed_read=True)))
+
+    tagger = Tagger(session=session, tracer=tracer)
+    results.append(measure('apply_tags', rows, lambda: tagger.apply_tags(schema_name=schema_name, entity_name='auto', should_drop=False, should_purge=True, csv_stream=io.StringIO(tag_csv), file_name='benchmark_tags.csv')))
+  return results
+
+def compare(results: List[Dict[str, any]], baseline: List[Dict[str, any]], tolerance: float) -> bool:
+  baseline_seconds = {(r['case'], r['rows']): r['seconds'] for r in baseline}
+  passed = True
+  for result in results:
+    key = (result['case'], result['rows'])
+    if key not in baseline_seconds:
+      continue
+    ratio = result['seconds'] / baseline_seconds[key] if baseline_seconds[key] else 1
+    regressed = ratio > tolerance
+    passed = passed and not regressed
+    print(f'{key[0]:<28} {key[1]:>10} rows {ratio:>6.2f}x baseline{" REGRESSION" if regressed else ""}', file=sys.stderr)
+  return passed
+
+@click.command()
+@click.option('-r', '--rows', 'row_counts', type=int, multiple=True, default=[10000, 100000])
+@click.option('-c', '--columns', 'columns', type=int, default=20)
+@click.option('--chunk-size', 'chunk_size', type=int, default=50000)
+@click.option('-s', '--schema', 'schema_name', type=str, default='benchmark')
+@click.option('-db', '--database', 'database_name', type=str)
+@click.option('-o', '--output', 'output_path', type=click.Path(dir_okay=False), default=default_output_path)
+@click.option('-b', '--baseline', 'baseline_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--tolerance', 'tolerance', type=float, default=1.25)
+@click.option('-p', '--profile', 'profile', is_flag=True)
+def suite(row_counts: Tuple[int], columns: int, chunk_size: int, schema_name: str, database_name: Optional[str], output_path: str, baseline_path: Optional[str], tolerance: float, profile: bool):
+  if database_name:
+    from config import sql_config
+    SQL.Layer.configure_connection(sql_config[database_name])
+
+  tracer = Tracer(sinks=[SummarySink()] if profile else [])
+  results = []
+  for rows in row_counts:
+    results += run_cases(rows=rows, columns=columns, chunk_size=chunk_size, schema_name=schema_name, database_name=database_name, tracer=tracer)
+  tracer.close()
+
+  with open(output_path, 'w') as output_file:
+    json.dump({'database': database_name or 'fake', 'columns': columns, 'results': results}, output_file, indent=2)
+  print(f'{len(results)} benchmark results written to {output_path}', file=sys.stderr)
+
+  if baseline_path:
+    with open(baseline_path, 'r') as baseline_file:
+      baseline = json.load(baseline_file)['results']
+    if not compare(results=results, baseline=baseline, tolerance=tolerance):
+      raise SystemExit(1)
+
+if __name__ == '__main__':
+  suite()
@@ -0,0 +1,85 @@
+import os
+import sys
+import json
+import tempfile
+import subprocess
+import click
+import pandas as pd
+
+from subir import Tagger, Session
+from subir.load import Loader
+from subir.tag import EntityType, convert_id_columns, strip_empty_tags, drop_duplicates
+from subir.trace import peak_rss
+from .generate import tag_frame
+from .layer import FakeLayer
+
+class RetainingLoader(Loader):
+  def load(self, layer: any, data_frame: pd.DataFrame, **kwargs):
+    self.data_frame = data_frame
+
+def legacy_prepare_tags(path: str) -> pd.DataFrame:
+  original_df = pd.read_csv(path, dtype='object')
+  df = original_df.copy()
+  df.rename(columns={'company': 'company_identifier'}, inplace=True)
+  entity = EntityType.from_tag_data(tags=df)
+  df = pd.DataFrame(df, columns=list(entity.columns.keys()))
+  convert_id_columns(df, entity.id_column_names)
+  strip_empty_tags(df, entity.tag_column_names)
+  drop_duplicates(df=df, original_df=original_df, entity=entity, output_prefix='legacy')
+  df['upload_group'] = os.path.basename(path)
+  return df
+
+def prepare_tags(path: str) -> pd.DataFrame:
+  loader = RetainingLoader()
+  with Session(layer=FakeLayer()) as session:
+    Tagger(loader=loader, session=session).apply_tags(
+      schema_name='benchmark',
+      entity_name='auto',
+      should_drop=False,
+      should_purge=True,
+      csv_stream=path,
+      file_name=path
+    )
+  return loader.data_frame
+
+def measure_mode(mode: str, path: str) -> dict:
+  baseline = peak_rss()
+  df = legacy_prepare_tags(path) if mode == 'legacy' else prepare_tags(path)
+  return {
+    'mode': mode,
+    'rows': len(df),
+    'frame_bytes': int(df.memory_usage(index=False, deep=True).sum()),
+    'peak_rss_delta': peak_rss() - baseline,
+  }
+
+@click.command()
+@click.option('-r', '--rows', 'row_counts', type=int, multiple=True, default=[100000, 1000000])
+@click.option('--mode', 'mode', type=click.Choice(['generate', 'legacy', 'compact']), hidden=True)
+@click.option('--path', 'path', type=click.Path(dir_okay=False), hidden=True)
+def benchmark(row_counts: list, mode: str, path: str):
+  if mode == 'generate':
+    tag_frame(rows=row_counts[0]).to_csv(path, index=False)
+    return
+  if mode:
+    print(json.dumps(measure_mode(mode=mode, path=path)))
+    return
+
+  def run_mode(mode: str, path: str, rows: int) -> str:
+    return subprocess.run(
+      [sys.executable, '-m', 'benchmark.tag_memory', '--mode', mode, '--path', path, '--rows', str(rows)],
+      check=True,
+      capture_output=True,
+      text=True
+    ).stdout
+
+  for rows in row_counts:
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, 'benchmark_tags.csv')
+      # Each mode runs in a fresh process so that peak RSS is not inherited from the generator or the other mode
+      run_mode(mode='generate', path=path, rows=rows)
+      results = {m: json.loads(run_mode(mode=m, path=path, rows=rows).strip().splitlines()[-1]) for m in ['legacy', 'compact']}
+    legacy, compact = results['legacy'], results['compact']
+    print(f'{rows} rows: legacy peak +{legacy["peak_rss_delta"] / 1048576:.1f} MB, frame {legacy["frame_bytes"] / 1048576:.1f} MB; compact peak +{compact["peak_rss_delta"] / 1048576:.1f} MB, frame {compact["frame_bytes"] / 1048576:.1f} MB ({legacy["peak_rss_delta"] / max(compact["peak_rss_delta"], 1):.1f}x)')
+
+if __name__ == '__main__':
+  benchmark()
@@ -0,0 +1,37 @@
+import json
+import time
+import click
+import pandas as pd
+
+from subir.tag import EntityType, convert_id_columns, strip_empty_tags
+from .generate import tag_frame
+
+def legacy_convert_id_columns(df: pd.DataFrame, col_names: list):
+  for name in col_names:
+    df[name] = df[name].apply(lambda id: json.loads(id) if type(id) is str else None)
+    df.drop(df.index[df[name].isna()], inplace=True)
+
+def legacy_strip_empty_tags(df: pd.DataFrame, col_names: list):
+  df[col_names] = df[col_names].fillna(value='')
+  for name in col_names:
+    df[name] = df[name].apply(lambda s: s.strip())
+
+def time_pipeline(df: pd.DataFrame, entity: EntityType, convert: any, strip: any) -> float:
+  df = df.copy()
+  start = time.perf_counter()
+  convert(df, entity.id_column_names)
+  strip(df, entity.tag_column_names)
+  return time.perf_counter() - start
+
+@click.command()
+@click.option('-r', '--rows', 'row_counts', type=int, multiple=True, default=[100000, 1000000])
+def benchmark(row_counts: list):
+  entity = EntityType.ad
+  for rows in row_counts:
+    df = tag_frame(rows=rows, entity=entity)
+    legacy_seconds = time_pipeline(df, entity, legacy_convert_id_columns, legacy_strip_empty_tags)
+    seconds = time_pipeline(df, entity, convert_id_columns, strip_empty_tags)
+    print(f'{rows} rows: legacy {legacy_seconds:.3f}s, vectorized {seconds:.3f}s ({legacy_seconds / seconds:.1f}x)')
+
+if __name__ == '__main__':
+  benchmark()
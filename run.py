@@ -1,40 +1,117 @@
+from __future__ import annotations
+
 import os
 import io
+import sys
 import re
+import glob
 import click
 
-from config import sql_config
-from data_layer import Redshift as SQL
-from subir import Uploader, EntityType, Tagger
-from typing import Tuple
+from subir.entity import EntityType, BackupStrategy
+from subir.trace import Tracer, SummarySink, JSONLinesSink
+from typing import TYPE_CHECKING, Optional, Tuple
+
+if TYPE_CHECKING:
+  from subir.load import Loader
+  from subir.session import Session
+  from subir.cache import ColumnTypeCache
+  from subir.source import InputSource
+  from subir.state import TagStateIndex
 
-all_database_values = sql_config.keys()
+def database_config(database_name: str) -> any:
+  from config import sql_config
+  if database_name not in sql_config:
+    raise click.BadParameter(f'{database_name} is not one of {", ".join(sql_config.keys())}', param_hint='--database')
+  return sql_config[database_name]
 
 class Subir:
   database_name: str
+  loader_name: str
+  metadata_cache_directory: Optional[str]
+  metadata_ttl: Optional[float]
+  tracer: Tracer
   
-  def __init__(self, database_name: str):
+  def __init__(self, database_name: str, loader_name: str='insert', metadata_cache_directory: Optional[str]=None, metadata_ttl: Optional[float]=3600, tracer: Optional[Tracer]=None):
     self.database_name = database_name
+    self.loader_name = loader_name
+    self.metadata_cache_directory = metadata_cache_directory
+    self.metadata_ttl = metadata_ttl
+    self.tracer = tracer if tracer is not None else Tracer()
+    self._connection_configured = False
+    self._session = None
+    self._column_type_cache = None
+
+  def close(self):
+    if self._session is not None:
+      self._session.close()
+    self.tracer.close()
+
+  def configure_connection(self):
+    if not self._connection_configured:
+      from data_layer import Redshift as SQL
+      SQL.Layer.configure_connection(database_config(self.database_name))
+      self._connection_configured = True
+
+  @property
+  def session(self) -> Session:
+    if self._session is None:
+      from subir.session import Session
+      self.configure_connection()
+      self._session = Session()
+    return self._session
+
+  @property
+  def column_type_cache(self) -> ColumnTypeCache:
+    if self._column_type_cache is None:
+      from subir.cache import ColumnTypeCache
+      self._column_type_cache = ColumnTypeCache(ttl=self.metadata_ttl, directory=self.metadata_cache_directory)
+    return self._column_type_cache
+
+  @property
+  def loader(self) -> Loader:
+    from subir.load import InsertLoader, CopyLoader
+    if self.loader_name == 'copy':
+      return CopyLoader()
+    return InsertLoader()
 
   def path_to_table_name(self, path: str) -> str:
-    return re.sub(r'[^a-zA-Z0-9]', '_', os.path.splitext(os.path.basename(path))[0]).lower()
+    from subir.source import source_stem
+    return re.sub(r'[^a-zA-Z0-9]', '_', source_stem(path)).lower()
+
+  def input_source(self, path: str) -> InputSource:
+    from subir.source import InputSource, CSVSource
+    return CSVSource(sys.stdin) if path == '-' else InputSource.from_path(path)
 
 @click.group()
-@click.option('-db', '--database', 'database_name', type=click.Choice(all_database_values), default='stage_01')
+@click.option('-db', '--database', 'database_name', type=str, default='stage_01')
+@click.option('-l', '--loader', 'loader_name', type=click.Choice(['insert', 'copy']), default='insert')
+@click.option('--metadata-cache', 'metadata_cache_directory', type=click.Path(file_okay=False))
+@click.option('--metadata-ttl', 'metadata_ttl', type=click.FloatRange(min=0), default=3600)
+@click.option('-p', '--profile', 'profile', is_flag=True)
+@click.option('--profile-output', 'profile_output_path', type=click.Path(dir_okay=False))
 @click.pass_context
-def run(ctx: any, database_name: str):
-  ctx.obj = Subir(database_name=database_name)
-  SQL.Layer.configure_connection(sql_config[ctx.obj.database_name])
+def run(ctx: any, database_name: str, loader_name: str, metadata_cache_directory: Optional[str], metadata_ttl: float, profile: bool, profile_output_path: Optional[str]):
+  sinks = []
+  if profile:
+    sinks.append(SummarySink())
+  if profile_output_path:
+    sinks.append(JSONLinesSink(path=profile_output_path))
+  ctx.obj = Subir(database_name=database_name, loader_name=loader_name, metadata_cache_directory=metadata_cache_directory, metadata_ttl=metadata_ttl, tracer=Tracer(sinks=sinks))
+  ctx.call_on_close(ctx.obj.close)
 
 @run.command()
 @click.option('-s', '--schema', 'schema_name', type=str, required=True)
 @click.option('-t', '--table', 'table_name', type=str)
+@click.option('-c', '--chunk-size', 'chunk_size', type=click.IntRange(min=1))
+@click.option('-n', '--sample-rows', 'sample_rows', type=click.IntRange(min=1))
 @click.argument('csv_file', type=click.File('r'))
 @click.pass_obj
-def create(subir: Subir, schema_name: str, table_name: str, csv_file: io.TextIOWrapper):
+def create(subir: Subir, schema_name: str, table_name: str, chunk_size: Optional[int], sample_rows: Optional[int], csv_file: io.TextIOWrapper):
+  from data_layer import Redshift as SQL
+  from subir.upload import Uploader
   table = table_name if table_name else subir.path_to_table_name(csv_file.name)
-  uploader = Uploader()
-  query_text = uploader.create_table_query_text_from_stream(schema_name=schema_name, table_name=table, csv_stream=csv_file)
+  uploader = Uploader(session=subir.session, column_type_cache=subir.column_type_cache)
+  query_text = uploader.create_table_query_text_from_stream(schema_name=schema_name, table_name=table, csv_stream=csv_file, chunk_size=chunk_size, sample_rows=sample_rows)
   output_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'output', f'create_{table}.sql')
   edit = True
   while edit:
@@ -48,48 +125,178 @@ def create(subir: Subir, schema_name: str, table_name: str, csv_file: io.TextIOW
     else:
       edit = False
   query = SQL.Query(query_text.replace('%', '%%'))
-  layer = SQL.Layer()
-  layer.connect()
-  query.run(sql_layer=layer)
-  layer.commit()
-  layer.disconnect()
+  uploader.run_table_query(schema_name=schema_name, table_name=table, query=query)
 
 @run.command()
 @click.option('-s', '--schema', 'schema_name', type=str, required=True)
 @click.option('-t', '--table', 'table_name', type=str)
 @click.option('-m', '--merge', 'merge_column_names', type=str, multiple=True)
 @click.option('-d', '--drop', 'drop_existing', is_flag=True)
-@click.argument('csv_file', type=click.File('r'))
+@click.option('-c', '--chunk-size', 'chunk_size', type=click.IntRange(min=1))
+@click.option('--pipeline-depth', 'pipeline_depth', type=click.IntRange(min=0), default=0)
+@click.option('--merge-partitions', 'merge_partitions', type=click.IntRange(min=0, max=256), default=0)
+@click.option('--merge-checkpoint', 'merge_checkpoint_path', type=click.Path(dir_okay=False))
+@click.option('--typed-read', 'typed_read', is_flag=True)
+@click.option('--upload-checkpoint', 'upload_checkpoint_path', type=click.Path(dir_okay=False))
+@click.option('--dry-run', 'dry_run', is_flag=True)
+@click.argument('input_path', type=click.Path(exists=True, dir_okay=False, allow_dash=True))
 @click.pass_obj
-def upload(subir: Subir, schema_name: str, table_name: str, merge_column_names: Tuple[str], drop_existing: bool, csv_file: io.TextIOWrapper):
-  table = table_name if table_name else subir.path_to_table_name(csv_file.name)
-  uploader = Uploader()
+def upload(subir: Subir, schema_name: str, table_name: str, merge_column_names: Tuple[str], drop_existing: bool, chunk_size: Optional[int], pipeline_depth: int, merge_partitions: int, merge_checkpoint_path: Optional[str], typed_read: bool, upload_checkpoint_path: Optional[str], dry_run: bool, input_path: str):
+  from subir.upload import Uploader
+  table = table_name if table_name else subir.path_to_table_name(input_path)
+  source = subir.input_source(input_path)
+  uploader = Uploader(loader=subir.loader, session=subir.session, column_type_cache=subir.column_type_cache, tracer=subir.tracer)
+  if dry_run:
+    plan = uploader.plan_upload(
+      schema_name=schema_name,
+      table_name=table,
+      merge_column_names=[c.lower() for c in merge_column_names],
+      replace=drop_existing,
+      csv_stream=source,
+      chunk_size=chunk_size,
+      merge_partitions=merge_partitions,
+      merge_checkpoint_path=merge_checkpoint_path,
+      upload_checkpoint_path=upload_checkpoint_path
+    )
+    plan.write()
+    return
   uploader.upload(
     schema_name=schema_name,
     table_name=table,
     merge_column_names=[c.lower() for c in merge_column_names],
     replace=drop_existing,
-    csv_stream=csv_file
+    csv_stream=source,
+    chunk_size=chunk_size,
+    pipeline_depth=pipeline_depth,
+    merge_partitions=merge_partitions,
+    merge_checkpoint_path=merge_checkpoint_path,
+    typed_read=typed_read,
+    upload_checkpoint_path=upload_checkpoint_path
   )
 
+@run.command('batch-upload')
+@click.option('-s', '--schema', 'schema_name', type=str)
+@click.option('-m', '--merge', 'merge_column_names', type=str, multiple=True)
+@click.option('-d', '--drop', 'drop_existing', is_flag=True)
+@click.option('-c', '--chunk-size', 'chunk_size', type=click.IntRange(min=1))
+@click.option('-w', '--workers', 'workers', type=click.IntRange(min=1), default=4)
+@click.option('--pipeline-depth', 'pipeline_depth', type=click.IntRange(min=0), default=0)
+@click.option('--typed-read', 'typed_read', is_flag=True)
+@click.option('-f', '--manifest', 'manifest_path', type=click.Path(exists=True, dir_okay=False))
+@click.argument('sources', nargs=-1)
+@click.pass_obj
+def batch_upload(subir: Subir, schema_name: Optional[str], merge_column_names: Tuple[str], drop_existing: bool, chunk_size: Optional[int], workers: int, pipeline_depth: int, typed_read: bool, manifest_path: Optional[str], sources: Tuple[str]):
+  from subir.source import input_extensions
+  from subir.session import SessionPool
+  from subir.batch import BatchEntry, BatchUploader, read_manifest, print_summary
+  entries = read_manifest(path=manifest_path, path_to_table_name=subir.path_to_table_name, default_schema_name=schema_name) if manifest_path else []
+  for source in sources:
+    paths = sorted(p for e in input_extensions for p in glob.glob(os.path.join(source, f'*{e}'))) if os.path.isdir(source) else sorted(glob.glob(source))
+    if not paths:
+      raise click.BadParameter(f'No input files found for {source}', param_hint='sources')
+    if not schema_name:
+      raise click.BadParameter('A schema is required for files outside a manifest', param_hint='--schema')
+    entries += [
+      BatchEntry(
+        path=p,
+        schema_name=schema_name,
+        table_name=subir.path_to_table_name(p),
+        merge_column_names=[c.lower() for c in merge_column_names],
+        replace=drop_existing
+      )
+      for p in paths
+    ]
+  if not entries:
+    raise click.UsageError('No files to upload')
+
+  subir.configure_connection()
+  with SessionPool(size=workers) as pool:
+    batch_uploader = BatchUploader(pool=pool, loader=subir.loader, workers=workers, chunk_size=chunk_size, column_type_cache=subir.column_type_cache, tracer=subir.tracer, pipeline_depth=pipeline_depth, typed_read=typed_read)
+    results = batch_uploader.upload(entries=entries)
+  print_summary(results=results)
+  if any(r.status != 'ok' for r in results):
+    raise SystemExit(1)
+
 @run.command()
 @click.option('-s', '--schema', 'schema_name', type=str, required=True)
 @click.option('-e', '--entity', 'entity_name', type=click.Choice([e.value for e in EntityType] + ['auto']), default='auto')
 @click.option('-d', '--drop-existing', 'should_drop', is_flag=True)
 @click.option('--purge-empty/--no-purge-empty', 'should_purge', default=True)
-@click.argument('csv_file', type=click.File('r'))
+@click.option('-i', '--incremental', 'incremental', is_flag=True)
+@click.option('-b', '--backup', 'backup_name', type=click.Choice([s.value for s in BackupStrategy]), default=BackupStrategy.full.value)
+@click.option('--state-index', 'state_index_path', type=click.Path(dir_okay=False))
+@click.option('--refresh-state', 'refresh_state', is_flag=True)
+@click.option('--dry-run', 'dry_run', is_flag=True)
+@click.option('-w', '--workers', 'workers', type=click.IntRange(min=1), default=3)
+@click.argument('input_paths', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False, allow_dash=True))
 @click.pass_obj
-def tag(subir: Subir, schema_name: str, entity_name: str, should_drop: bool, should_purge: bool, csv_file: io.TextIOWrapper):
-  tagger = Tagger()
-  tagger.apply_tags(
-    schema_name=schema_name,
-    entity_name=entity_name,
-    should_drop=should_drop,
-    should_purge=should_purge,
-    csv_stream=csv_file,
-    file_name=csv_file.name,
-    interactive=True
-  )
+def tag(subir: Subir, schema_name: str, entity_name: str, should_drop: bool, should_purge: bool, incremental: bool, backup_name: str, state_index_path: Optional[str], refresh_state: bool, dry_run: bool, workers: int, input_paths: Tuple[str]):
+  if refresh_state and not state_index_path:
+    raise click.UsageError('--refresh-state requires --state-index')
+  if len(input_paths) > 1 and incremental:
+    raise click.UsageError('--incremental requires a single input file')
+  if len(input_paths) > 1 and '-' in input_paths:
+    raise click.UsageError('Standard input cannot be combined with other input files')
+  from subir.tag import Tagger, refresh_tag_state
+  from subir.state import TagStateIndex
+  state_index = TagStateIndex(path=state_index_path) if state_index_path else None
+  try:
+    if refresh_state:
+      refresh_entity = EntityType(entity_name) if entity_name != 'auto' else None
+      for entity in [refresh_entity] if refresh_entity else list(EntityType):
+        rows = refresh_tag_state(schema=schema_name, entity=entity, state_index=state_index, session=subir.session)
+        print(f'Refreshed {rows} {entity.value} tags in the local tag state index')
+    if len(input_paths) > 1:
+      tag_files(subir=subir, schema_name=schema_name, entity_name=entity_name, should_drop=should_drop, should_purge=should_purge, backup_name=backup_name, state_index=state_index, dry_run=dry_run, workers=workers, input_paths=input_paths)
+      return
+    input_path = input_paths[0]
+    tagger = Tagger(loader=subir.loader, session=subir.session, tracer=subir.tracer, state_index=state_index)
+    tagger.apply_tags(
+      schema_name=schema_name,
+      entity_name=entity_name,
+      should_drop=should_drop,
+      should_purge=should_purge,
+      csv_stream=subir.input_source(input_path),
+      file_name=input_path,
+      interactive=True,
+      incremental=incremental,
+      backup_strategy=BackupStrategy(backup_name),
+      dry_run=dry_run
+    )
+  finally:
+    if state_index is not None:
+      state_index.close()
+
+def tag_files(subir: Subir, schema_name: str, entity_name: str, should_drop: bool, should_purge: bool, backup_name: str, state_index: Optional[TagStateIndex], dry_run: bool, workers: int, input_paths: Tuple[str]):
+  from subir.session import SessionPool
+  from subir.batch import BatchTagger, print_summary
+  subir.configure_connection()
+  with SessionPool(size=min(workers, len(EntityType))) as pool:
+    batch_tagger = BatchTagger(pool=pool, loader=subir.loader, workers=workers, tracer=subir.tracer, state_index=state_index)
+    results = batch_tagger.tag(
+      schema_name=schema_name,
+      paths=list(input_paths),
+      entity_name=entity_name,
+      replace=should_drop,
+      purge=should_purge,
+      backup_strategy=BackupStrategy(backup_name),
+      dry_run=dry_run
+    )
+  print_summary(results=results)
+  if any(r.status != 'ok' for r in results):
+    raise SystemExit(1)
+
+@run.command()
+@click.option('-s', '--schema', 'schema_name', type=str, required=True)
+@click.option('-e', '--entity', 'entity_name', type=click.Choice([e.value for e in EntityType]), required=True)
+@click.pass_obj
+def restore(subir: Subir, schema_name: str, entity_name: str):
+  from subir.tag import restore_tags
+  entity = EntityType(entity_name)
+  if not click.confirm(f'Restore {schema_name}.{entity.table_name} from {schema_name}.{entity.restore_table_name}?'):
+    return
+  strategy = restore_tags(schema=schema_name, entity=entity, session=subir.session)
+  print(f'Restored {schema_name}.{entity.table_name} from {strategy.value} backup')
 
 if __name__ == '__main__':
   run()
\ No newline at end of file
@@ -1,3 +1,23 @@
-from .upload import Uploader
-from .base import ColumnType
-from .tag import EntityType, Tagger
\ No newline at end of file
+import importlib
+
+lazy_attributes = {
+  'Uploader': 'upload',
+  'ColumnType': 'base',
+  'EntityType': 'entity',
+  'Tagger': 'tag',
+  'BackupStrategy': 'entity',
+  'Session': 'session',
+  'SessionPool': 'session',
+}
+
+__all__ = list(lazy_attributes.keys())
+
+def __getattr__(name: str) -> any:
+  if name not in lazy_attributes:
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+  value = getattr(importlib.import_module(f'.{lazy_attributes[name]}', __name__), name)
+  globals()[name] = value
+  return value
+
+def __dir__() -> list:
+  return sorted(list(globals().keys()) + __all__)
@@ -4,7 +4,9 @@ import re
 import pandas as pd
 
 from enum import Enum
-from typing import Dict
+from typing import Optional, Dict, Set
+
+date_pattern = re.compile(r'[0-9]{1,2}[/-][0-9]{1,2}[/-][0-9]{2,4}|[0-9]{2,4}[/-][0-9]{1,2}[/-][0-9]{1,2}')
 
 class ColumnType(Enum):
   integer = 'bigint'
@@ -25,11 +27,12 @@ class ColumnType(Enum):
     elif type_name == 'bool':
       return cls.boolean
     elif type_name == 'object':
-      length = pd_column.apply(str).apply(len).max()
+      values = pd.Series(pd_column.unique(), dtype='object')
+      length = values.astype(str).str.len().max()
       if length > 2048:
         return cls.long_text
       if length < 64:
-        if cls._pd_column_is_date(pd_column):
+        if cls._pd_column_is_date(values):
           return cls.date
         return cls.short_text
       return cls.medium_text
@@ -52,13 +55,15 @@ class ColumnType(Enum):
       raise e
 
   @classmethod
-  def _pd_column_is_date(self, pd_column: any) -> bool:
+  def _pd_column_is_date(self, pd_column: any, block_size: int=1000) -> bool:
     empty = True
-    for value in pd_column:
-      if not value or pd.isna(value):
+    for start in range(0, len(pd_column), block_size):
+      values = pd_column.iloc[start:start + block_size].dropna()
+      values = values[values.astype(bool)]
+      if values.empty:
         continue
       empty = False
-      if not re.match(r'[0-9]{1,2}[/-][0-9]{1,2}[/-][0-9]{2,4}', value) and not re.match(r'[0-9]{2,4}[/-][0-9]{1,2}[/-][0-9]{1,2}', value):
+      if pd.api.types.infer_dtype(values, skipna=True) not in ['string', 'mixed'] or not values.str.match(date_pattern).fillna(False).all():
         return False
     return not empty
 
@@ -75,6 +80,54 @@ class ColumnType(Enum):
     else:
       return 'object'
 
+class ColumnStatistics:
+  type_names: Set[str]
+  max_length: Optional[int]
+  has_values: bool
+  is_date: bool
+
+  def __init__(self):
+    self.type_names = set()
+    self.max_length = None
+    self.has_values = False
+    self.is_date = True
+
+  def update(self, pd_column: any) -> ColumnStatistics:
+    type_name = str(pd_column.dtype)
+    self.type_names.add(type_name)
+
+    values = pd.Series(pd_column.unique(), dtype='object')
+    length = values.astype(str).str.len().max()
+    if not pd.isna(length):
+      self.max_length = length if self.max_length is None else max(self.max_length, length)
+
+    present_values = values.dropna()
+    present_values = present_values[present_values.astype(bool)]
+    if not present_values.empty:
+      self.has_values = True
+      if self.is_date:
+        self.is_date = type_name == 'object' and ColumnType._pd_column_is_date(present_values)
+    return self
+
+  @property
+  def column_type(self) -> ColumnType:
+    numeric_names = {'int64', 'float64'}
+    if self.type_names - numeric_names - {'bool', 'object'}:
+      return ColumnType.long_text
+    if 'object' in self.type_names or not self.type_names or ('bool' in self.type_names and self.type_names & numeric_names):
+      if self.max_length is not None and self.max_length > 2048:
+        return ColumnType.long_text
+      if self.max_length is not None and self.max_length < 64:
+        if self.is_date and self.has_values:
+          return ColumnType.date
+        return ColumnType.short_text
+      return ColumnType.medium_text
+    if 'float64' in self.type_names:
+      return ColumnType.decimal
+    if 'int64' in self.type_names:
+      return ColumnType.integer
+    return ColumnType.boolean
+
 def sanitized_relation_name(name: str) -> str:
   return re.sub(r'[^a-z0-9_]', '_', name.lower())
 
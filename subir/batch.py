@@ -0,0 +1,258 @@
+import os
+import csv
+import json
+import time
+import pandas as pd
+
+from concurrent.futures import ThreadPoolExecutor
+from .entity import EntityType, BackupStrategy
+from .load import Loader
+from .cache import ColumnTypeCache
+from .trace import Tracer
+from .session import Session, SessionPool
+from .upload import Uploader
+from .tag import Tagger, concat_tags, drop_duplicates, upload_group_values, upload_tags, upload_tags_plan, tag_state, tag_state_scope
+from .state import TagStateIndex
+from .source import InputSource
+from typing import Optional, Callable, Dict, List, Tuple
+
+class BatchEntry:
+  path: str
+  schema_name: str
+  table_name: str
+  merge_column_names: List[str]
+  replace: bool
+
+  def __init__(self, path: str, schema_name: str, table_name: str, merge_column_names: List[str]=[], replace: bool=False):
+    self.path = path
+    self.schema_name = schema_name
+    self.table_name = table_name
+    self.merge_column_names = merge_column_names
+    self.replace = replace
+
+  @property
+  def table_key(self) -> Tuple[str, str]:
+    return (self.schema_name, self.table_name)
+
+class BatchResult:
+  entry: BatchEntry
+  rows: int
+  bytes: int
+  seconds: float
+  error: Optional[Exception]
+  skipped: bool
+
+  def __init__(self, entry: BatchEntry, rows: int=0, bytes: int=0, seconds: float=0, error: Optional[Exception]=None, skipped: bool=False):
+    self.entry = entry
+    self.rows = rows
+    self.bytes = bytes
+    self.seconds = seconds
+    self.error = error
+    self.skipped = skipped
+
+  @property
+  def status(self) -> str:
+    if self.skipped:
+      return 'skipped'
+    return 'failed' if self.error else 'ok'
+
+def read_manifest(path: str, path_to_table_name: Callable[[str], str], default_schema_name: Optional[str]=None) -> List[BatchEntry]:
+  with open(path, 'r') as manifest_file:
+    if os.path.splitext(path)[1].lower() == '.json':
+      rows = json.load(manifest_file)
+    else:
+      rows = list(csv.DictReader(manifest_file))
+  manifest_directory = os.path.dirname(os.path.abspath(path))
+  entries = []
+  for row in rows:
+    merge_column_names = row.get('merge') or []
+    if isinstance(merge_column_names, str):
+      merge_column_names = merge_column_names.split()
+    entry_path = os.path.join(manifest_directory, row['file'])
+    schema_name = row.get('schema') or default_schema_name
+    if not schema_name:
+      raise ValueError('Manifest entry has no schema', row['file'])
+    entries.append(BatchEntry(
+      path=entry_path,
+      schema_name=schema_name,
+      table_name=row.get('table') or path_to_table_name(entry_path),
+      merge_column_names=[c.lower() for c in merge_column_names],
+      replace=str(row.get('replace', '')).lower() in ['1', 'true', 'yes', 'y']
+    ))
+  return entries
+
+class BatchUploader:
+  pool: SessionPool
+  loader: Optional[Loader]
+  workers: int
+  chunk_size: Optional[int]
+  column_type_cache: ColumnTypeCache
+  tracer: Tracer
+  pipeline_depth: int
+  typed_read: bool
+
+  def __init__(self, pool: SessionPool, loader: Optional[Loader]=None, workers: int=4, chunk_size: Optional[int]=None, column_type_cache: Optional[ColumnTypeCache]=None, tracer: Optional[Tracer]=None, pipeline_depth: int=0, typed_read: bool=False):
+    self.pool = pool
+    self.loader = loader
+    self.workers = workers
+    self.chunk_size = chunk_size
+    self.column_type_cache = column_type_cache if column_type_cache is not None else ColumnTypeCache()
+    self.tracer = tracer if tracer is not None else Tracer()
+    self.pipeline_depth = pipeline_depth
+    self.typed_read = typed_read
+
+  def uploader(self, session: Session) -> Uploader:
+    return Uploader(loader=self.loader, session=session, column_type_cache=self.column_type_cache, tracer=self.tracer)
+
+  def upload_entry(self, entry: BatchEntry) -> BatchResult:
+    start = time.perf_counter()
+    result = BatchResult(entry=entry)
+    try:
+      result.bytes = os.path.getsize(entry.path)
+      with self.pool.session() as session:
+        uploader = self.uploader(session=session)
+        result.rows = uploader.upload(
+          schema_name=entry.schema_name,
+          table_name=entry.table_name,
+          merge_column_names=entry.merge_column_names,
+          csv_stream=InputSource.from_path(entry.path),
+          replace=entry.replace,
+          chunk_size=self.chunk_size,
+          pipeline_depth=self.pipeline_depth,
+          typed_read=self.typed_read
+        )
+    except Exception as e:
+      result.error = e
+    result.seconds = time.perf_counter() - start
+    return result
+
+  def upload_table_entries(self, entries: List[BatchEntry]) -> List[BatchResult]:
+    results = []
+    for entry in entries:
+      if results and results[-1].status != 'ok':
+        results.append(BatchResult(entry=entry, skipped=True))
+        continue
+      results.append(self.upload_entry(entry=entry))
+    return results
+
+  def upload(self, entries: List[BatchEntry]) -> List[BatchResult]:
+    with self.pool.session() as session:
+      uploader = self.uploader(session=session)
+      for schema_name in sorted({e.schema_name for e in entries}):
+        uploader.prefetch_column_types(schema_name=schema_name)
+
+    ordered_table_keys = {e.table_key for e in entries if e.replace or e.merge_column_names}
+    table_entries = {}
+    for entry in entries:
+      table_entries.setdefault(entry.table_key if entry.table_key in ordered_table_keys else id(entry), []).append(entry)
+
+    with ThreadPoolExecutor(max_workers=self.workers) as executor:
+      futures = [executor.submit(self.upload_table_entries, e) for e in table_entries.values()]
+      results = {id(r.entry): r for f in futures for r in f.result()}
+    return [results[id(e)] for e in entries]
+
+class BatchTagger:
+  pool: SessionPool
+  loader: Optional[Loader]
+  workers: int
+  tracer: Tracer
+  state_index: Optional[TagStateIndex]
+
+  def __init__(self, pool: SessionPool, loader: Optional[Loader]=None, workers: int=3, tracer: Optional[Tracer]=None, state_index: Optional[TagStateIndex]=None):
+    self.pool = pool
+    self.loader = loader
+    self.workers = workers
+    self.tracer = tracer if tracer is not None else Tracer()
+    self.state_index = state_index
+
+  def read_path(self, path: str, entity_name: str) -> Tuple[EntityType, pd.DataFrame]:
+    tagger = Tagger(loader=self.loader, tracer=self.tracer)
+    entity, df, _ = tagger.read_tags(csv_stream=InputSource.from_path(path), entity_name=entity_name)
+    df['upload_group'] = upload_group_values(upload_group=os.path.basename(path), rows=len(df))
+    return entity, df
+
+  def tag_entity(self, schema_name: str, entity: EntityType, results: List[BatchResult], data_frames: List[pd.DataFrame], replace: bool, purge: bool, backup_strategy: BackupStrategy, dry_run: bool):
+    start = time.perf_counter()
+    try:
+      tags = concat_tags(data_frames)
+      drop_duplicates(df=tags, original_df=None, entity=entity, output_prefix=f'{schema_name}_{entity.table_name}')
+      group_rows = tags.upload_group.value_counts()
+      for result in results:
+        result.rows = int(group_rows.get(os.path.basename(result.entry.path), 0))
+      if dry_run:
+        upload_tags_plan(schema=schema_name, entity=entity, tags=tags, replace=replace, purge=purge, loader=self.loader, tracer=self.tracer, backup_strategy=backup_strategy).write()
+      elif not tags.empty:
+        with self.pool.session() as session:
+          upload_tags(schema=schema_name, entity=entity, tags=tags, replace=replace, purge=purge, loader=self.loader, session=session, tracer=self.tracer, backup_strategy=backup_strategy)
+        if self.state_index is not None:
+          with self.tracer.stage('tag.state_update', rows=len(tags)):
+            self.state_index.update(scope=tag_state_scope(schema=schema_name, entity=entity), state=tag_state(tags=tags, entity=entity), replace=replace, purge=purge)
+    except Exception as e:
+      for result in results:
+        result.error = e
+    seconds = time.perf_counter() - start
+    for result in results:
+      result.seconds += seconds
+
+  def tag(self, schema_name: str, paths: List[str], entity_name: str='auto', replace: bool=False, purge: bool=True, backup_strategy: BackupStrategy=BackupStrategy.full, dry_run: bool=False) -> List[BatchResult]:
+    with ThreadPoolExecutor(max_workers=self.workers) as executor:
+      futures = [executor.submit(self.read_path, p, entity_name) for p in paths]
+      reads = []
+      for path, future in zip(paths, futures):
+        try:
+          reads.append((path, *future.result(), None))
+        except Exception as e:
+          reads.append((path, None, None, e))
+
+    groups: Dict[EntityType, Tuple[List[BatchResult], List[pd.DataFrame]]] = {}
+    results = []
+    for path, entity, df, error in reads:
+      entry = BatchEntry(
+        path=path,
+        schema_name=schema_name,
+        table_name=entity.table_name if entity else '',
+        merge_column_names=list(entity.identifier_columns.keys()) if entity else [],
+        replace=replace
+      )
+      result = BatchResult(entry=entry, bytes=os.path.getsize(path) if error is None else 0, error=error)
+      results.append(result)
+      if entity:
+        group = groups.setdefault(entity, ([], []))
+        group[0].append(result)
+        group[1].append(df)
+    if any(r.error for r in results):
+      for result in results:
+        result.skipped = result.error is None
+      return results
+
+    with ThreadPoolExecutor(max_workers=min(self.workers, len(groups) or 1)) as executor:
+      futures = [
+        executor.submit(self.tag_entity, schema_name, e, r, d, replace, purge, backup_strategy, dry_run)
+        for e, (r, d) in groups.items()
+      ]
+      for future in futures:
+        future.result()
+    return results
+
+def print_summary(results: List[BatchResult]):
+  rows = [('file', 'table', 'rows', 'bytes', 'seconds', 'status')]
+  for result in results:
+    rows.append((
+      os.path.basename(result.entry.path),
+      f'{result.entry.schema_name}.{result.entry.table_name}',
+      str(result.rows),
+      str(result.bytes),
+      f'{result.seconds:.2f}',
+      result.status if not result.error else f'{result.status}: {result.error}',
+    ))
+  rows.append((
+    'total',
+    '',
+    str(sum(r.rows for r in results)),
+    str(sum(r.bytes for r in results)),
+    f'{sum(r.seconds for r in results):.2f}',
+    f'{sum(1 for r in results if r.status == "ok")}/{len(results)} ok',
+  ))
+  widths = [max(len(r[i]) for r in rows) for i in range(5)]
+  for row in rows:
+    print('  '.join(c.ljust(w) for c, w in zip(row, widths)) + '  ' + row[5])
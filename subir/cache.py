@@ -0,0 +1,81 @@
+import os
+import json
+import time
+import threading
+
+from collections import OrderedDict
+from typing import Optional, Dict, Tuple
+
+class ColumnTypeCache:
+  max_size: int
+  ttl: Optional[float]
+  directory: Optional[str]
+  entries: OrderedDict
+
+  def __init__(self, max_size: int=256, ttl: Optional[float]=3600, directory: Optional[str]=None):
+    self.max_size = max_size
+    self.ttl = ttl
+    self.directory = directory
+    self.entries = OrderedDict()
+    self._lock = threading.Lock()
+
+  def key(self, database: str, schema: str, table: str) -> Tuple[str, str, str]:
+    return (database, schema, table)
+
+  def path(self, database: str, schema: str, table: str) -> str:
+    return os.path.join(self.directory, database, schema, f'{table}.json')
+
+  def is_fresh(self, cached_at: float) -> bool:
+    return self.ttl is None or time.time() - cached_at < self.ttl
+
+  def get(self, database: str, schema: str, table: str) -> Optional[Dict[str, str]]:
+    key = self.key(database=database, schema=schema, table=table)
+    with self._lock:
+      if key in self.entries:
+        cached_at, column_types = self.entries[key]
+        if self.is_fresh(cached_at=cached_at):
+          self.entries.move_to_end(key)
+          return dict(column_types)
+        del self.entries[key]
+
+    if not self.directory:
+      return None
+    path = self.path(database=database, schema=schema, table=table)
+    try:
+      with open(path, 'r') as cache_file:
+        cached = json.load(cache_file)
+    except (OSError, ValueError):
+      return None
+    if not self.is_fresh(cached_at=cached['cached_at']):
+      return None
+    self.store(key=key, cached_at=cached['cached_at'], column_types=cached['column_types'])
+    return dict(cached['column_types'])
+
+  def set(self, database: str, schema: str, table: str, column_types: Dict[str, str]):
+    cached_at = time.time()
+    self.store(key=self.key(database=database, schema=schema, table=table), cached_at=cached_at, column_types=column_types)
+    if not self.directory:
+      return
+    path = self.path(database=database, schema=schema, table=table)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f'{path}.{os.getpid()}.{threading.get_ident()}'
+    with open(temporary_path, 'w') as cache_file:
+      json.dump({'cached_at': cached_at, 'column_types': column_types}, cache_file)
+    os.replace(temporary_path, path)
+
+  def store(self, key: Tuple[str, str, str], cached_at: float, column_types: Dict[str, str]):
+    with self._lock:
+      self.entries[key] = (cached_at, dict(column_types))
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.max_size:
+        self.entries.popitem(last=False)
+
+  def invalidate(self, database: str, schema: str, table: str):
+    with self._lock:
+      self.entries.pop(self.key(database=database, schema=schema, table=table), None)
+    if not self.directory:
+      return
+    try:
+      os.remove(self.path(database=database, schema=schema, table=table))
+    except FileNotFoundError:
+      pass
@@ -0,0 +1,149 @@
+import os
+import json
+import uuid
+import hashlib
+import pandas as pd
+
+from collections import deque
+from typing import Optional, Iterable, Set, Dict, List
+
+class MergeCheckpoint:
+  path: str
+  schema: str
+  table: str
+  partitions: int
+  staged_input: Optional[str]
+  completed: Set[int]
+
+  def __init__(self, path: str, schema: str, table: str, partitions: int, staged_input: Optional[str]=None):
+    self.path = path
+    self.schema = schema
+    self.table = table
+    self.partitions = partitions
+    self.staged_input = staged_input
+    self.completed = set()
+    if os.path.exists(path):
+      self.load()
+
+  @property
+  def dictionary(self) -> dict:
+    return {
+      'schema': self.schema,
+      'table': self.table,
+      'partitions': self.partitions,
+      'staged_input': self.staged_input,
+      'completed': sorted(self.completed),
+    }
+
+  def load(self):
+    with open(self.path, 'r') as checkpoint_file:
+      checkpoint = json.load(checkpoint_file)
+    if (checkpoint['schema'], checkpoint['table'], checkpoint['partitions']) != (self.schema, self.table, self.partitions):
+      raise ValueError('Merge checkpoint does not match upload', self.path, checkpoint['schema'], checkpoint['table'], checkpoint['partitions'])
+    if checkpoint.get('staged_input') != self.staged_input:
+      raise ValueError('Merge checkpoint was written for different staged data', self.path, checkpoint.get('staged_input'), self.staged_input)
+    self.completed = set(checkpoint['completed'])
+
+  def complete(self, partition: int):
+    self.completed.add(partition)
+    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+    temporary_path = f'{self.path}.tmp'
+    with open(temporary_path, 'w') as checkpoint_file:
+      json.dump(self.dictionary, checkpoint_file)
+    os.replace(temporary_path, self.path)
+
+  def clear(self):
+    self.completed = set()
+    if os.path.exists(self.path):
+      os.remove(self.path)
+
+def data_frame_checksum(data_frame: pd.DataFrame) -> str:
+  digest = hashlib.sha1(','.join(map(str, data_frame.columns)).encode('utf-8'))
+  digest.update(pd.util.hash_pandas_object(data_frame, index=False).to_numpy().tobytes())
+  return digest.hexdigest()
+
+class UploadCheckpoint:
+  path: str
+  schema: str
+  table: str
+  chunk_size: Optional[int]
+  run_id: str
+  chunks: List[Dict[str, any]]
+  pending: deque
+
+  def __init__(self, path: str, schema: str, table: str, chunk_size: Optional[int]=None):
+    self.path = path
+    self.schema = schema
+    self.table = table
+    self.chunk_size = chunk_size
+    self.run_id = uuid.uuid4().hex[:12]
+    self.chunks = []
+    self.pending = deque()
+    if os.path.exists(path):
+      self.load()
+
+  @property
+  def staging_table(self) -> str:
+    return f'{self.schema}.flx_upload_{self.table}_{self.run_id}'
+
+  @property
+  def input_rows(self) -> int:
+    return sum(c['rows'] for c in self.chunks)
+
+  @property
+  def loaded_rows(self) -> int:
+    return sum(c['loaded_rows'] for c in self.chunks)
+
+  @property
+  def dictionary(self) -> dict:
+    return {
+      'schema': self.schema,
+      'table': self.table,
+      'chunk_size': self.chunk_size,
+      'run_id': self.run_id,
+      'chunks': self.chunks,
+    }
+
+  def load(self):
+    with open(self.path, 'r') as checkpoint_file:
+      checkpoint = json.load(checkpoint_file)
+    if (checkpoint['schema'], checkpoint['table'], checkpoint['chunk_size']) != (self.schema, self.table, self.chunk_size):
+      raise ValueError('Upload checkpoint does not match upload', self.path, checkpoint['schema'], checkpoint['table'], checkpoint['chunk_size'])
+    self.run_id = checkpoint['run_id']
+    self.chunks = checkpoint['chunks']
+
+  def save(self):
+    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+    temporary_path = f'{self.path}.tmp'
+    with open(temporary_path, 'w') as checkpoint_file:
+      json.dump(self.dictionary, checkpoint_file)
+    os.replace(temporary_path, self.path)
+
+  def unloaded_data_frames(self, data_frames: Iterable[pd.DataFrame]) -> Iterable[pd.DataFrame]:
+    offset = 0
+    for position, data_frame in enumerate(data_frames):
+      chunk = {
+        'offset': offset,
+        'rows': len(data_frame),
+        'checksum': data_frame_checksum(data_frame),
+      }
+      offset += len(data_frame)
+      if position < len(self.chunks):
+        if any(self.chunks[position][k] != v for k, v in chunk.items()):
+          raise ValueError('Upload checkpoint does not match input', self.path, position)
+        print(f'Skipping chunk {position + 1} of {self.schema}.{self.table} ({chunk["rows"]} rows), loaded by a previous run')
+        continue
+      self.pending.append(chunk)
+      yield data_frame
+
+  def complete(self, loaded_rows: int):
+    chunk = self.pending.popleft()
+    chunk['loaded_rows'] = loaded_rows
+    self.chunks.append(chunk)
+    self.save()
+
+  def clear(self):
+    self.chunks = []
+    self.pending.clear()
+    if os.path.exists(self.path):
+      os.remove(self.path)
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from enum import Enum
+from typing import TYPE_CHECKING, Optional, Dict, List
+
+if TYPE_CHECKING:
+  import pandas as pd
+
+class EntityType(Enum):
+  ad = 'ad'
+  adset = 'adset'
+  campaign = 'campaign'
+
+  @classmethod
+  def from_tag_data(cls, tags: pd.DataFrame) -> EntityType:
+    return cls.ad if 'ad_id' in tags.columns else cls.adset if 'adset_tag' in tags.columns else cls.campaign
+
+  @property
+  def identifier_columns(self) -> Optional[Dict[str, any]]:
+    import sqlalchemy as alchemy
+    return {
+      'channel': alchemy.VARCHAR(127),
+      f'{self.value}_id': alchemy.VARCHAR(127),
+    }
+
+  @property
+  def columns(self) -> Optional[Dict[str, any]]:
+    import sqlalchemy as alchemy
+    return {
+      'company_identifier': alchemy.VARCHAR(127),
+      'app': alchemy.VARCHAR(127),
+      **self.identifier_columns,
+      f'{self.value}_tag': alchemy.VARCHAR(255),
+      f'{self.value}_subtag': alchemy.VARCHAR(255),
+    }
+
+  @property
+  def id_column_names(self) -> List[str]:
+    return [f'{self.value}_id']
+
+  @property
+  def tag_column_names(self) -> List[str]:
+    return [f'{self.value}_tag', f'{self.value}_subtag']
+
+  @property
+  def update_column_names(self) -> List[str]:
+    return self.tag_column_names + ['upload_group']
+
+  @property
+  def table_name(self) -> str:
+    if self is EntityType.ad:
+      return 'tag_ads'
+    elif self is EntityType.adset:
+      return 'tag_adsets'
+    elif self is EntityType.campaign:
+      return 'tag_campaigns'
+
+  @property
+  def upload_table_name(self) -> str:
+    return f'upload_{self.table_name}'
+
+  @property
+  def restore_table_name(self) -> str:
+    return f'restore_{self.table_name}'
+
+  @property
+  def restore_keys_table_name(self) -> str:
+    return f'restore_keys_{self.table_name}'
+
+class BackupStrategy(Enum):
+  full = 'full'
+  delta = 'delta'
+  none = 'none'
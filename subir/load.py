@@ -0,0 +1,119 @@
+import io
+import gzip
+import uuid
+import pandas as pd
+
+from data_layer import Redshift as SQL
+from .query import CopyFromStdinQuery, CopyFromS3Query
+from typing import Optional, Iterable, Dict
+
+class Loader:
+  def prepare(self, data_frame: pd.DataFrame, column_type_transform_dictionary: Optional[Dict[str, any]]=None, empty_as_null: bool=False) -> pd.DataFrame:
+    return data_frame
+
+  def load(self, layer: SQL.Layer, data_frame: pd.DataFrame, schema_name: Optional[str], table_name: str, column_type_transform_dictionary: Optional[Dict[str, any]]=None, accept_invalid_characters: bool=False, empty_as_null: bool=False, transform_data_frame: bool=False, prepared: bool=False):
+    raise NotImplementedError()
+
+class InsertLoader(Loader):
+  def load(self, layer: SQL.Layer, data_frame: pd.DataFrame, schema_name: Optional[str], table_name: str, column_type_transform_dictionary: Optional[Dict[str, any]]=None, accept_invalid_characters: bool=False, empty_as_null: bool=False, transform_data_frame: bool=False, prepared: bool=False):
+    layer.insert_data_frame(
+      data_frame=data_frame,
+      schema_name=schema_name,
+      table_name=table_name,
+      column_type_transform_dictionary=column_type_transform_dictionary,
+      accept_invalid_characters=accept_invalid_characters,
+      empty_as_null=empty_as_null,
+      transform_data_frame=transform_data_frame
+    )
+
+class CopyLoader(Loader):
+  segment_rows: int
+
+  def __init__(self, segment_rows: int=500000):
+    self.segment_rows = segment_rows
+
+  def typed_data_frame(self, data_frame: pd.DataFrame, column_type_transform_dictionary: Optional[Dict[str, any]], empty_as_null: bool) -> pd.DataFrame:
+    typed_df = data_frame
+    if column_type_transform_dictionary:
+      transforms = {
+        c: 'boolean' if t is bool else t
+        for c, t in column_type_transform_dictionary.items()
+        if c in data_frame.columns and t != 'object'
+      }
+      typed_df = typed_df.astype(transforms)
+    if empty_as_null:
+      typed_df = typed_df.replace({'': None})
+    return typed_df
+
+  def prepare(self, data_frame: pd.DataFrame, column_type_transform_dictionary: Optional[Dict[str, any]]=None, empty_as_null: bool=False) -> pd.DataFrame:
+    return self.typed_data_frame(
+      data_frame=data_frame,
+      column_type_transform_dictionary=column_type_transform_dictionary,
+      empty_as_null=empty_as_null
+    )
+
+  def segments(self, data_frame: pd.DataFrame) -> Iterable[pd.DataFrame]:
+    for start in range(0, len(data_frame), self.segment_rows):
+      yield data_frame.iloc[start:start + self.segment_rows]
+
+  def serialize(self, data_frame: pd.DataFrame) -> str:
+    return data_frame.to_csv(index=False, header=False, na_rep='\\N', date_format='%Y-%m-%d %H:%M:%S')
+
+  def load(self, layer: SQL.Layer, data_frame: pd.DataFrame, schema_name: Optional[str], table_name: str, column_type_transform_dictionary: Optional[Dict[str, any]]=None, accept_invalid_characters: bool=False, empty_as_null: bool=False, transform_data_frame: bool=False, prepared: bool=False):
+    typed_df = data_frame if prepared else self.prepare(
+      data_frame=data_frame,
+      column_type_transform_dictionary=column_type_transform_dictionary,
+      empty_as_null=empty_as_null
+    )
+    for segment in self.segments(data_frame=typed_df):
+      self.copy_segment(
+        layer=layer,
+        segment=segment,
+        schema_name=schema_name,
+        table_name=table_name,
+        accept_invalid_characters=accept_invalid_characters,
+        empty_as_null=empty_as_null
+      )
+
+  def copy_segment(self, layer: SQL.Layer, segment: pd.DataFrame, schema_name: Optional[str], table_name: str, accept_invalid_characters: bool, empty_as_null: bool):
+    copy_query = CopyFromStdinQuery(
+      schema=schema_name,
+      table=table_name,
+      column_names=list(segment.columns)
+    )
+    cursor = layer.connection.cursor()
+    cursor.copy_expert(copy_query.query, io.StringIO(self.serialize(data_frame=segment)))
+
+class S3CopyLoader(CopyLoader):
+  bucket: str
+  prefix: str
+  iam_role: str
+
+  def __init__(self, bucket: str, prefix: str, iam_role: str, segment_rows: int=500000):
+    self.bucket = bucket
+    self.prefix = prefix
+    self.iam_role = iam_role
+    super().__init__(segment_rows=segment_rows)
+
+  def copy_segment(self, layer: SQL.Layer, segment: pd.DataFrame, schema_name: Optional[str], table_name: str, accept_invalid_characters: bool, empty_as_null: bool):
+    import boto3
+    s3 = boto3.client('s3')
+    key = f'{self.prefix.rstrip("/")}/{table_name}_{uuid.uuid4().hex}.csv.gz'
+    s3.put_object(
+      Bucket=self.bucket,
+      Key=key,
+      Body=gzip.compress(self.serialize(data_frame=segment).encode())
+    )
+    try:
+      copy_query = CopyFromS3Query(
+        schema=schema_name,
+        table=table_name,
+        column_names=list(segment.columns),
+        s3_path=f's3://{self.bucket}/{key}',
+        iam_role=self.iam_role,
+        accept_invalid_characters=accept_invalid_characters,
+        empty_as_null=empty_as_null
+      )
+      copy_query.run(sql_layer=layer)
+    finally:
+      s3.delete_object(Bucket=self.bucket, Key=key)
@@ -0,0 +1,75 @@
+import threading
+
+from queue import Queue, Full
+from typing import Optional, Iterable, Iterator
+
+class PipelineFailure:
+  exception: BaseException
+
+  def __init__(self, exception: BaseException):
+    self.exception = exception
+
+class Pipeline:
+  iterable: Iterable[any]
+  depth: int
+  name: str
+  queue: Queue
+
+  def __init__(self, iterable: Iterable[any], depth: int=2, name: str='subir-pipeline'):
+    if depth < 1:
+      raise ValueError('Pipeline depth must be at least 1', depth)
+    self.iterable = iterable
+    self.depth = depth
+    self.name = name
+    self.queue = Queue(maxsize=depth)
+    self._done = object()
+    self._stopped = threading.Event()
+    self._thread: Optional[threading.Thread] = None
+
+  def put(self, item: any) -> bool:
+    while not self._stopped.is_set():
+      try:
+        self.queue.put(item, timeout=0.1)
+        return True
+      except Full:
+        continue
+    return False
+
+  def produce(self):
+    try:
+      for item in self.iterable:
+        if not self.put(item):
+          return
+    except BaseException as e:
+      self.put(PipelineFailure(exception=e))
+      return
+    self.put(self._done)
+
+  def start(self):
+    if self._thread is None:
+      self._thread = threading.Thread(target=self.produce, name=self.name, daemon=True)
+      self._thread.start()
+
+  def __iter__(self) -> Iterator[any]:
+    self.start()
+    try:
+      while True:
+        item = self.queue.get()
+        if item is self._done:
+          return
+        if isinstance(item, PipelineFailure):
+          raise item.exception
+        yield item
+    finally:
+      self.close()
+
+  def close(self):
+    self._stopped.set()
+    if self._thread is not None and self._thread is not threading.current_thread():
+      self._thread.join()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
@@ -0,0 +1,174 @@
+import os
+import json
+
+from data_layer import Redshift as SQL
+from .trace import Tracer
+from typing import Optional, Callable, Dict, List
+
+default_output_directory = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'output')
+
+class PlanStep:
+  name: str
+  rows: Optional[int]
+  result: any
+
+  def __init__(self, name: str, rows: Optional[int]=None):
+    self.name = name
+    self.rows = rows
+    self.result = None
+
+  @property
+  def foldable(self) -> bool:
+    return False
+
+  @property
+  def dictionary(self) -> Dict[str, any]:
+    return {
+      'step': self.name,
+      'rows': self.rows,
+    }
+
+  def run(self, layer: SQL.Layer):
+    raise NotImplementedError()
+
+class QueryStep(PlanStep):
+  query: SQL.Query
+
+  def __init__(self, name: str, query: SQL.Query, rows: Optional[int]=None):
+    self.query = query
+    super().__init__(name=name, rows=rows)
+
+  @property
+  def foldable(self) -> bool:
+    return True
+
+  @property
+  def dictionary(self) -> Dict[str, any]:
+    return {
+      **super().dictionary,
+      'query': self.query.query.strip(),
+      'parameters': list(self.query.substitution_parameters or ()),
+    }
+
+  def run(self, layer: SQL.Layer):
+    self.result = self.query.run(sql_layer=layer)
+
+class CallStep(PlanStep):
+  description: str
+  function: Callable[[SQL.Layer], any]
+
+  def __init__(self, name: str, description: str, function: Callable[[SQL.Layer], any], rows: Optional[int]=None):
+    self.description = description
+    self.function = function
+    super().__init__(name=name, rows=rows)
+
+  @property
+  def dictionary(self) -> Dict[str, any]:
+    return {
+      **super().dictionary,
+      'description': self.description,
+    }
+
+  def run(self, layer: SQL.Layer):
+    self.result = self.function(layer)
+
+def fold_queries(queries: List[SQL.Query]) -> SQL.Query:
+  parameters = tuple(p for q in queries for p in (q.substitution_parameters or ()))
+  texts = []
+  for query in queries:
+    text = query.query.strip()
+    if parameters and not query.substitution_parameters:
+      text = text.replace('%', '%%')
+    texts.append(text if text.endswith(';') else f'{text};')
+  return SQL.Query(query='\n'.join(texts), substitution_parameters=parameters)
+
+class Plan:
+  name: str
+  transaction: bool
+  steps: List[PlanStep]
+  cleanup_steps: List[PlanStep]
+
+  def __init__(self, name: str, transaction: bool=True):
+    self.name = name
+    self.transaction = transaction
+    self.steps = []
+    self.cleanup_steps = []
+
+  def add_query(self, name: str, query: SQL.Query, rows: Optional[int]=None) -> QueryStep:
+    step = QueryStep(name=name, query=query, rows=rows)
+    self.steps.append(step)
+    return step
+
+  def add_call(self, name: str, description: str, function: Callable[[SQL.Layer], any], rows: Optional[int]=None) -> CallStep:
+    step = CallStep(name=name, description=description, function=function, rows=rows)
+    self.steps.append(step)
+    return step
+
+  def add_cleanup_query(self, name: str, query: SQL.Query) -> QueryStep:
+    step = QueryStep(name=name, query=query)
+    self.cleanup_steps.append(step)
+    return step
+
+  def step(self, name: str) -> PlanStep:
+    return next(s for s in self.steps if s.name == name)
+
+  @property
+  def batches(self) -> List[List[PlanStep]]:
+    batches = []
+    for step in self.steps:
+      if batches and step.foldable and batches[-1][-1].foldable:
+        batches[-1].append(step)
+      else:
+        batches.append([step])
+    return batches
+
+  @property
+  def dictionary(self) -> Dict[str, any]:
+    return {
+      'plan': self.name,
+      'transaction': self.transaction,
+      'round_trips': len(self.batches),
+      'batches': [[s.name for s in b] for b in self.batches],
+      'steps': [s.dictionary for s in self.steps],
+      'cleanup_steps': [s.dictionary for s in self.cleanup_steps],
+    }
+
+  def write(self, directory: str=default_output_directory) -> str:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{self.name}_plan.json')
+    with open(path, 'w') as plan_file:
+      json.dump(self.dictionary, plan_file, indent=2, default=str)
+    print(f'Plan with {len(self.steps)} steps in {len(self.batches)} round trips written to {path}')
+    return path
+
+  def run_batch(self, layer: SQL.Layer, batch: List[PlanStep], tracer: Tracer):
+    if not batch[0].foldable:
+      batch[0].run(layer=layer)
+      return
+    rows = [s.rows for s in batch if s.rows is not None]
+    with tracer.stage('+'.join(s.name for s in batch), rows=max(rows) if rows else None):
+      if len(batch) == 1:
+        batch[0].run(layer=layer)
+      else:
+        fold_queries([s.query for s in batch]).run(sql_layer=layer)
+
+  def run(self, layer: SQL.Layer, tracer: Optional[Tracer]=None):
+    if tracer is None:
+      tracer = Tracer()
+    # Folded steps share one stage, so profiled runs send each query separately to keep per-step timings
+    batches = [[s] for s in self.steps] if tracer.sinks else self.batches
+    try:
+      for batch in batches:
+        self.run_batch(layer=layer, batch=batch, tracer=tracer)
+      if self.transaction:
+        layer.commit()
+    except BaseException:
+      if self.transaction:
+        layer.connection.rollback()
+      else:
+        SQL.Query('rollback;').run(sql_layer=layer)
+      for step in self.cleanup_steps:
+        self.run_batch(layer=layer, batch=[step], tracer=tracer)
+      if self.transaction and self.cleanup_steps:
+        layer.commit()
+      raise
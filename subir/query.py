@@ -33,6 +33,35 @@ and table_name = %s;
       for r in result
     }
 
+class SchemaColumnTypeQuery(SQL.GeneratedQuery, SQL.ResultQuery[Dict[str, Dict[str, str]]]):
+  database: str
+  schema: str
+
+  def __init__(self, database: str, schema: str):
+    self.database = database
+    self.schema = schema
+    super().__init__()
+
+  def generate_query(self):
+    self.query = '''
+select table_name, column_name, data_type, character_maximum_length
+from information_schema.columns
+where table_catalog = %s
+and table_schema = %s
+order by table_name, ordinal_position;
+    '''
+    self.substitution_parameters=(
+      self.database,
+      self.schema,
+    )
+
+  def cursor_to_result(self, cursor: any) -> Optional[Dict[str, Dict[str, str]]]:
+    result = cursor.fetchall()
+    tables = {}
+    for r in result:
+      tables.setdefault(r[0], {})[r[1]] = f'{r[2]}({r[3]})' if r[2] == 'character varying' else r[2]
+    return tables
+
 class CreateTableQuery(SQL.GeneratedQuery):
   schema: str
   table: str
@@ -71,32 +100,66 @@ class DropTableQuery(SQL.GeneratedQuery):
 class UploadQuery(SQL.GeneratedQuery):
   schema: str
   table: str
+  source_upload_table: Optional[str]
 
-  def __init__(self, schema: str, table: str):
+  def __init__(self, schema: str, table: str, upload_table: Optional[str]=None):
     self.schema = schema
     self.table = table
+    self.source_upload_table = upload_table
     super().__init__()
 
   @property
   def upload_table(self) -> str:
-    return f'flx_upload_{self.table}'
+    return self.source_upload_table if self.source_upload_table else f'flx_upload_{self.table}'
 
 class PrepareUploadTableQuery(UploadQuery):
   schema: str
   table: str
+  temporary: bool
+
+  def __init__(self, schema: str, table: str, upload_table: Optional[str]=None, temporary: bool=True):
+    self.temporary = temporary
+    super().__init__(schema=schema, table=table, upload_table=upload_table)
 
   def generate_query(self):
-    self.query = f'''
+    if self.temporary:
+      self.query = f'''
 create temporary table {self.upload_table} (like {self.schema}.{self.table} including defaults);
+      '''
+    else:
+      self.query = f'''
+create table if not exists {self.upload_table} (like {self.schema}.{self.table} including defaults);
+      '''
+
+class LockTableQuery(SQL.GeneratedQuery):
+  schema: str
+  table: str
+
+  def __init__(self, schema: str, table: str):
+    self.schema = schema
+    self.table = table
+    super().__init__()
+
+  def generate_query(self):
+    self.query = f'''
+begin;
+lock table {self.schema}.{self.table};
     '''
 
+class UploadRowCountQuery(UploadQuery, SQL.ResultQuery[int]):
+  def generate_query(self):
+    self.query = f'select count(*) from {self.upload_table};'
+
+  def cursor_to_result(self, cursor: any) -> int:
+    return cursor.fetchone()[0]
+
 class AppendUploadQuery(UploadQuery):
   def generate_query(self):
     self.query = f'insert into {self.schema}.{self.table} select * from {self.upload_table};'
 
 class ReplaceUploadQuery(UploadQuery):
   def generate_query(self):
-    append_query = AppendUploadQuery(schema=self.schema, table=self.table)
+    append_query = AppendUploadQuery(schema=self.schema, table=self.table, upload_table=self.source_upload_table)
     self.query = f'''
 truncate table {self.schema}.{self.table};
 {append_query.query}
@@ -106,10 +169,12 @@ truncate table {self.schema}.{self.table};
 class MergeUploadQuery(SQL.MergeQuery):
   schema: str
   table: str
+  source_upload_table: Optional[str]
 
-  def __init__(self, join_columns: List[str], update_columns: List[str], schema: str, table: str):
+  def __init__(self, join_columns: List[str], update_columns: List[str], schema: str, table: str, upload_table: Optional[str]=None):
     self.schema = schema
     self.table = table
+    self.source_upload_table = upload_table
 
     super().__init__(
       join_columns=join_columns,
@@ -122,15 +187,17 @@ class MergeUploadQuery(SQL.MergeQuery):
 
   @property
   def upload_table(self) -> str:
-    return f'flx_upload_{self.table}'
+    return self.source_upload_table if self.source_upload_table else f'flx_upload_{self.table}'
 
 class MergeReplaceUploadQuery(SQL.MergeReplaceQuery):
   schema: str
   table: str
+  source_upload_table: Optional[str]
 
-  def __init__(self, join_columns: List[str], schema: str, table: str):
+  def __init__(self, join_columns: List[str], schema: str, table: str, upload_table: Optional[str]=None):
     self.schema = schema
     self.table = table
+    self.source_upload_table = upload_table
 
     super().__init__(
       join_columns=join_columns,
@@ -142,4 +209,90 @@ class MergeReplaceUploadQuery(SQL.MergeReplaceQuery):
 
   @property
   def upload_table(self) -> str:
-    return f'flx_upload_{self.table}'
\ No newline at end of file
+    return self.source_upload_table if self.source_upload_table else f'flx_upload_{self.table}'
+
+class PartitionUploadTableQuery(UploadQuery):
+  partition_columns: List[str]
+  partition: int
+  partitions: int
+
+  def __init__(self, schema: str, table: str, partition_columns: List[str], partition: int, partitions: int, upload_table: Optional[str]=None):
+    self.partition_columns = partition_columns
+    self.partition = partition
+    self.partitions = partitions
+    super().__init__(schema=schema, table=table, upload_table=upload_table)
+
+  @property
+  def partition_table(self) -> str:
+    return self.upload_table.split('.')[-1].replace('flx_upload_', 'flx_partition_', 1)
+
+  @property
+  def partition_prefixes(self) -> List[str]:
+    return [f'{p:02x}' for p in range(256) if p % self.partitions == self.partition]
+
+  def generate_query(self):
+    key_text = " || chr(31) || ".join(f"coalesce(\"{c}\"::varchar, '')" for c in self.partition_columns)
+    self.query = f'''
+drop table if exists {self.partition_table};
+create temporary table {self.partition_table} as
+select * from {self.upload_table}
+where substring(md5({key_text}), 1, 2) in ({', '.join(['%s'] * len(self.partition_prefixes))});
+    '''
+    self.substitution_parameters = tuple(self.partition_prefixes)
+
+class CopyQuery(SQL.GeneratedQuery):
+  schema: Optional[str]
+  table: str
+  column_names: List[str]
+
+  def __init__(self, schema: Optional[str], table: str, column_names: List[str]):
+    self.schema = schema
+    self.table = table
+    self.column_names = column_names
+    super().__init__()
+
+  @property
+  def target_table(self) -> str:
+    return f'{self.schema}.{self.table}' if self.schema else self.table
+
+  @property
+  def columns_definition(self) -> str:
+    return ', '.join(f'"{c}"' for c in self.column_names)
+
+class CopyFromStdinQuery(CopyQuery):
+  def generate_query(self):
+    self.query = f'''
+copy {self.target_table} ({self.columns_definition})
+from stdin
+with (format csv, null '\\N');
+    '''
+
+class CopyFromS3Query(CopyQuery):
+  s3_path: str
+  iam_role: str
+  accept_invalid_characters: bool
+  empty_as_null: bool
+
+  def __init__(self, schema: Optional[str], table: str, column_names: List[str], s3_path: str, iam_role: str, accept_invalid_characters: bool=False, empty_as_null: bool=False):
+    self.s3_path = s3_path
+    self.iam_role = iam_role
+    self.accept_invalid_characters = accept_invalid_characters
+    self.empty_as_null = empty_as_null
+    super().__init__(schema=schema, table=table, column_names=column_names)
+
+  def generate_query(self):
+    options = ['csv', 'gzip', "null as '\\\\N'"]
+    if self.accept_invalid_characters:
+      options.append('acceptinvchars')
+    if self.empty_as_null:
+      options.append('emptyasnull')
+    self.query = f'''
+copy {self.target_table} ({self.columns_definition})
+from %s
+iam_role %s
+{' '.join(options)};
+    '''
+    self.substitution_parameters = (
+      self.s3_path,
+      self.iam_role,
+    )
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from queue import LifoQueue, Empty
+from contextlib import contextmanager
+from data_layer import Redshift as SQL
+from typing import Optional, Callable, Iterator, List, TypeVar
+
+T = TypeVar('T')
+
+class Session:
+  layer: SQL.Layer
+  connected: bool
+
+  def __init__(self, layer: Optional[SQL.Layer]=None):
+    self.layer = layer if layer is not None else SQL.Layer()
+    self.connected = False
+
+  def connect(self) -> SQL.Layer:
+    if not self.connected:
+      self.layer.connect()
+      self.connected = True
+    return self.layer
+
+  def reset(self):
+    if self.connected and not self.layer.connection.autocommit:
+      self.layer.connection.rollback()
+
+  def close(self):
+    if self.connected:
+      self.layer.disconnect()
+      self.connected = False
+
+  @contextmanager
+  def autocommit(self) -> Iterator[SQL.Layer]:
+    layer = self.connect()
+    previous_autocommit = layer.connection.autocommit
+    if not previous_autocommit:
+      layer.commit()
+    layer.connection.autocommit = True
+    try:
+      yield layer
+    finally:
+      if self.connected:
+        layer.connection.autocommit = previous_autocommit
+
+  def __enter__(self):
+    self.connect()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+class SessionPool:
+  size: int
+  session_factory: Callable[[], Session]
+  sessions: LifoQueue
+  all_sessions: List[Session]
+  executor: Optional[ThreadPoolExecutor]
+
+  def __init__(self, size: int=4, session_factory: Callable[[], Session]=Session):
+    self.size = size
+    self.session_factory = session_factory
+    self.sessions = LifoQueue()
+    self.all_sessions = []
+    self.executor = None
+    self._lock = threading.Lock()
+    self._available = threading.Semaphore(size)
+
+  def acquire(self) -> Session:
+    self._available.acquire()
+    try:
+      return self.sessions.get_nowait()
+    except Empty:
+      session = self.session_factory()
+      with self._lock:
+        self.all_sessions.append(session)
+      return session
+
+  def release(self, session: Session):
+    session.reset()
+    self.sessions.put(session)
+    self._available.release()
+
+  @contextmanager
+  def session(self) -> Iterator[Session]:
+    session = self.acquire()
+    try:
+      yield session
+    except BaseException:
+      session.close()
+      raise
+    finally:
+      self.release(session)
+
+  async def run_async(self, function: Callable[[Session], T]) -> T:
+    # One executor thread per session, so awaiting callers queue for a thread instead of piling onto the default executor
+    with self._lock:
+      if self.executor is None:
+        self.executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='subir-session')
+    def run() -> T:
+      with self.session() as session:
+        return function(session)
+    return await asyncio.get_running_loop().run_in_executor(self.executor, run)
+
+  def close(self):
+    with self._lock:
+      if self.executor is not None:
+        self.executor.shutdown(wait=True)
+        self.executor = None
+      for session in self.all_sessions:
+        session.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+@contextmanager
+def use_session(session: Optional[Session]=None) -> Iterator[Session]:
+  if session is None:
+    with Session() as own_session:
+      yield own_session
+    return
+  try:
+    yield session
+  except BaseException:
+    session.reset()
+    raise
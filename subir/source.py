@@ -0,0 +1,115 @@
+import os
+import pandas as pd
+
+from typing import Optional, Callable, Iterable, List
+
+compression_extensions = {
+  '.gz': 'gzip',
+  '.gzip': 'gzip',
+  '.zst': 'zstd',
+  '.zstd': 'zstd',
+}
+parquet_extensions = ['.parquet', '.pq']
+arrow_extensions = ['.arrow', '.feather', '.ipc']
+input_extensions = ['.csv', *[f'.csv{e}' for e in compression_extensions], *parquet_extensions, *arrow_extensions]
+
+def source_stem(path: str) -> str:
+  name = os.path.basename(path)
+  root, extension = os.path.splitext(name)
+  if extension.lower() in compression_extensions:
+    name = root
+  return os.path.splitext(name)[0]
+
+def input_source(csv_stream: any) -> any:
+  return csv_stream if isinstance(csv_stream, InputSource) else CSVSource(csv_stream)
+
+class InputSource:
+  path_or_buffer: any
+  typed: bool = False
+
+  def __init__(self, path_or_buffer: any):
+    self.path_or_buffer = path_or_buffer
+
+  @classmethod
+  def from_path(cls, path: str) -> any:
+    extension = os.path.splitext(path.lower())[1]
+    if extension in parquet_extensions:
+      return ParquetSource(path)
+    if extension in arrow_extensions:
+      return ArrowSource(path)
+    if extension in compression_extensions:
+      return CSVSource(path, compression=compression_extensions[extension])
+    return CSVSource(path)
+
+  @property
+  def name(self) -> str:
+    return self.path_or_buffer if isinstance(self.path_or_buffer, str) else getattr(self.path_or_buffer, 'name', '')
+
+  def read(self, column_filter: Optional[Callable[[str], bool]]=None, chunk_size: Optional[int]=None, dtype: Optional[any]=None) -> Iterable[pd.DataFrame]:
+    raise NotImplementedError()
+
+  def read_data_frame(self, column_filter: Optional[Callable[[str], bool]]=None, dtype: Optional[any]=None) -> pd.DataFrame:
+    return next(iter(self.read(column_filter=column_filter, dtype=dtype)))
+
+class CSVSource(InputSource):
+  compression: Optional[str]
+
+  def __init__(self, path_or_buffer: any, compression: Optional[str]=None):
+    self.compression = compression
+    super().__init__(path_or_buffer=path_or_buffer)
+
+  def column_names(self) -> Optional[List[str]]:
+    if not isinstance(self.path_or_buffer, str):
+      return None
+    return list(pd.read_csv(self.path_or_buffer, compression=self.compression, nrows=0).columns)
+
+  def read(self, column_filter: Optional[Callable[[str], bool]]=None, chunk_size: Optional[int]=None, dtype: Optional[any]=None) -> Iterable[pd.DataFrame]:
+    options = {
+      'usecols': column_filter,
+      'compression': self.compression,
+      'chunksize': chunk_size,
+      'thousands': ',',
+    }
+    if dtype is not None:
+      options['dtype'] = dtype
+    data_frames = pd.read_csv(self.path_or_buffer, **options)
+    return [data_frames] if chunk_size is None else data_frames
+
+class ArrowSource(InputSource):
+  typed = True
+
+  def column_names(self) -> List[str]:
+    import pyarrow as pa
+    with pa.memory_map(self.path_or_buffer) as arrow_file:
+      return pa.ipc.open_file(arrow_file).schema.names
+
+  def projected_columns(self, column_filter: Optional[Callable[[str], bool]]=None) -> Optional[List[str]]:
+    return [c for c in self.column_names() if column_filter(c)] if column_filter else None
+
+  def to_data_frame(self, data: any, dtype: Optional[any]=None) -> pd.DataFrame:
+    if dtype is None:
+      return data.to_pandas()
+    data_frame = data.to_pandas(integer_object_nulls=True)
+    if isinstance(dtype, dict):
+      return data_frame.astype({c: dtype[c] for c in data_frame.columns})
+    return data_frame.astype(dtype)
+
+  def read(self, column_filter: Optional[Callable[[str], bool]]=None, chunk_size: Optional[int]=None, dtype: Optional[any]=None) -> Iterable[pd.DataFrame]:
+    from pyarrow import feather
+    table = feather.read_table(self.path_or_buffer, columns=self.projected_columns(column_filter=column_filter), memory_map=True)
+    if chunk_size is None:
+      return [self.to_data_frame(data=table, dtype=dtype)]
+    return (self.to_data_frame(data=b, dtype=dtype) for b in table.to_batches(max_chunksize=chunk_size))
+
+class ParquetSource(ArrowSource):
+  def column_names(self) -> List[str]:
+    import pyarrow.parquet as pq
+    return pq.read_schema(self.path_or_buffer).names
+
+  def read(self, column_filter: Optional[Callable[[str], bool]]=None, chunk_size: Optional[int]=None, dtype: Optional[any]=None) -> Iterable[pd.DataFrame]:
+    import pyarrow.parquet as pq
+    columns = self.projected_columns(column_filter=column_filter)
+    if chunk_size is None:
+      return [self.to_data_frame(data=pq.read_table(self.path_or_buffer, columns=columns), dtype=dtype)]
+    parquet_file = pq.ParquetFile(self.path_or_buffer)
+    return (self.to_data_frame(data=b, dtype=dtype) for b in parquet_file.iter_batches(batch_size=chunk_size, columns=columns))
@@ -0,0 +1,127 @@
+import os
+import sqlite3
+import threading
+import pandas as pd
+
+from typing import Tuple, List
+
+class TagStateIndex:
+  path: str
+  batch_size: int
+  state_column_names: List[str] = ['channel', 'entity_id', 'tag', 'subtag', 'upload_group']
+
+  def __init__(self, path: str, batch_size: int=100000):
+    self.path = path
+    self.batch_size = batch_size
+    self._lock = threading.Lock()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    self.connection = sqlite3.connect(path, check_same_thread=False)
+    self.connection.executescript('''
+pragma journal_mode = wal;
+pragma synchronous = normal;
+create table if not exists tag_scope (
+  scope_id integer primary key,
+  database text not null,
+  schema text not null,
+  entity text not null,
+  unique (database, schema, entity)
+);
+create table if not exists tag_state (
+  scope_id integer not null,
+  channel text not null,
+  entity_id text not null,
+  tag text,
+  subtag text,
+  upload_group text,
+  primary key (scope_id, channel, entity_id)
+) without rowid;
+create temporary table lookup_keys (
+  position integer primary key,
+  channel text not null,
+  entity_id text not null
+);
+    ''')
+
+  def close(self):
+    self.connection.close()
+
+  def batches(self, rows: any) -> any:
+    iterator = iter(rows)
+    while True:
+      batch = [r for _, r in zip(range(self.batch_size), iterator)]
+      if not batch:
+        return
+      yield batch
+
+  def scope_id(self, scope: Tuple[str, str, str]) -> int:
+    self.connection.execute('insert or ignore into tag_scope (database, schema, entity) values (?, ?, ?)', scope)
+    return self.connection.execute(
+      'select scope_id from tag_scope where database = ? and schema = ? and entity = ?',
+      scope
+    ).fetchone()[0]
+
+  def count(self, scope: Tuple[str, str, str]) -> int:
+    with self._lock, self.connection:
+      return self.connection.execute('select count(*) from tag_state where scope_id = ?', (self.scope_id(scope),)).fetchone()[0]
+
+  def lookup(self, scope: Tuple[str, str, str], keys: pd.DataFrame) -> pd.DataFrame:
+    key_rows = zip(range(len(keys)), keys.channel.astype(str).to_numpy(), keys.entity_id.astype(str).to_numpy())
+    with self._lock, self.connection:
+      scope_id = self.scope_id(scope)
+      cursor = self.connection.cursor()
+      try:
+        for batch in self.batches(key_rows):
+          cursor.executemany('insert into lookup_keys values (?, ?, ?)', batch)
+        rows = cursor.execute('''
+select k.position, s.tag, s.subtag, s.upload_group
+from lookup_keys k
+cross join tag_state s
+where s.scope_id = ? and s.channel = k.channel and s.entity_id = k.entity_id;
+        ''', (scope_id,)).fetchall()
+      finally:
+        cursor.execute('delete from lookup_keys')
+    state = pd.DataFrame(rows, columns=['position', 'tag', 'subtag', 'upload_group'], dtype='object')
+    return state.set_index(state.position.astype('int64')).drop('position', axis=1)
+
+  def update(self, scope: Tuple[str, str, str], state: pd.DataFrame, replace: bool=False, purge: bool=False):
+    state = state[self.state_column_names].astype(object)
+    state = state.where(state.notna(), None)
+    with self._lock, self.connection:
+      scope_id = self.scope_id(scope)
+      self.update_scope(scope_id=scope_id, state=state, replace=replace, purge=purge)
+
+  def update_scope(self, scope_id: int, state: pd.DataFrame, replace: bool, purge: bool):
+    state_rows = zip(
+      [scope_id] * len(state),
+      state.channel.astype(str).to_numpy(),
+      state.entity_id.astype(str).to_numpy(),
+      state.tag.to_numpy(),
+      state.subtag.to_numpy(),
+      state.upload_group.to_numpy()
+    )
+    if replace:
+      self.connection.execute('delete from tag_state where scope_id = ?', (scope_id,))
+    for batch in self.batches(state_rows):
+      self.connection.executemany('''
+insert into tag_state values (?, ?, ?, ?, ?, ?)
+on conflict (scope_id, channel, entity_id) do update set
+tag = excluded.tag,
+subtag = excluded.subtag,
+upload_group = excluded.upload_group;
+      ''', batch)
+    if purge:
+      self.connection.execute('''
+delete from tag_state
+where scope_id = ? and coalesce(tag, '') = '' and coalesce(subtag, '') = '';
+      ''', (scope_id,))
+      self.connection.execute('''
+update tag_state
+set subtag = null
+where scope_id = ? and subtag = '';
+      ''', (scope_id,))
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
@@ -1,124 +1,162 @@
 import os
 import json
+import uuid
+import hashlib
 import click
+import numpy as np
 import pandas as pd
-import sqlalchemy as alchemy
 
+try:
+  import pyarrow as pa
+  import pyarrow.compute as pc
+except ImportError:
+  pa = None
+
+from pandas.api.types import union_categoricals
 from data_layer import Redshift as SQL
-from typing import Optional, Dict, List, Tuple
-from enum import Enum
-
-class EntityType(Enum):
-  ad = 'ad'
-  adset = 'adset'
-  campaign = 'campaign'
-
-  @classmethod
-  def from_tag_data(cls, tags: pd.DataFrame) -> any:
-    return cls.ad if 'ad_id' in tags.columns else cls.adset if 'adset_tag' in tags.columns else cls.campaign
-
-  @property
-  def identifier_columns(self) -> Optional[Dict[str, any]]:
-    return {
-      'channel': alchemy.VARCHAR(127),
-      f'{self.value}_id': alchemy.VARCHAR(127),
-    }
-
-  @property
-  def columns(self) -> Optional[Dict[str, any]]:
-    return {
-      'company_identifier': alchemy.VARCHAR(127),
-      'app': alchemy.VARCHAR(127),
-      **self.identifier_columns,
-      f'{self.value}_tag': alchemy.VARCHAR(255),
-      f'{self.value}_subtag': alchemy.VARCHAR(255),
-    }
-
-  @property
-  def id_column_names(self) -> List[str]:
-    return [f'{self.value}_id']
-
-  @property
-  def tag_column_names(self) -> List[str]:
-    return [f'{self.value}_tag', f'{self.value}_subtag']
-
-  @property
-  def update_column_names(self) -> List[str]:
-    return self.tag_column_names + ['upload_group']
-
-  @property
-  def table_name(self) -> str:
-    if self is EntityType.ad:
-      return 'tag_ads'
-    elif self is EntityType.adset:
-      return 'tag_adsets'
-    elif self is EntityType.campaign:
-      return 'tag_campaigns'
-
-  @property
-  def upload_table_name(self) -> str:
-    return f'upload_{self.table_name}'
-
-  @property
-  def restore_table_name(self) -> str:
-    return f'restore_{self.table_name}'
+from .entity import EntityType, BackupStrategy
+from .load import Loader, InsertLoader
+from .session import Session, SessionPool, use_session
+from .trace import Tracer, data_frame_bytes
+from .state import TagStateIndex
+from .plan import Plan, default_output_directory
+from .source import input_source
+from typing import Optional, List, Tuple
+from collections import defaultdict
+
+tag_input_column_names = {'company', *(c for e in EntityType for c in e.columns.keys())}
+tag_input_dtypes = defaultdict(lambda: 'object', {
+  c: 'category'
+  for c in tag_input_column_names
+  if c in ['company', 'company_identifier', 'app', 'channel'] or c.endswith('_tag') or c.endswith('_subtag')
+})
+
+json_string_id_pattern = r'^"[^"\\\x00-\x1f]*"$'
+json_integer_id_pattern = r'^-?(?:0|[1-9][0-9]{0,17})$'
+
+def convert_id_value(id: any) -> any:
+  return json.loads(id) if type(id) is str else None
+
+def convert_id_values(ids: pd.Series) -> pd.Series:
+  if pa is None or pd.api.types.infer_dtype(ids, skipna=True) not in ['string', 'empty']:
+    return ids.apply(convert_id_value)
+
+  strings = pa.array(ids.to_numpy(dtype='object'), type=pa.string(), from_pandas=True)
+  is_quoted = pc.match_substring_regex(strings, json_string_id_pattern).fill_null(False)
+  is_integer = pc.match_substring_regex(strings, json_integer_id_pattern).fill_null(False)
+  is_other = pc.and_not(pc.is_valid(strings), pc.or_(is_quoted, is_integer))
+
+  converted = np.full(len(ids), None, dtype='object')
+  converted[is_quoted.to_numpy(zero_copy_only=False)] = pc.utf8_slice_codeunits(strings.filter(is_quoted), 1, -1).to_numpy(zero_copy_only=False)
+  converted[is_integer.to_numpy(zero_copy_only=False)] = pc.cast(strings.filter(is_integer), pa.int64()).to_numpy().astype('object')
+  for position, id in zip(np.flatnonzero(is_other.to_numpy(zero_copy_only=False)), strings.filter(is_other).to_pylist()):
+    converted[position] = json.loads(id)
+  return pd.Series(converted, index=ids.index).infer_objects()
 
 def convert_id_columns(df: pd.DataFrame, col_names: List[str]):
   for name in col_names:
-    df[name] = df[name].apply(lambda id: json.loads(id) if type(id) is str else None)
+    df[name] = convert_id_values(df[name])
+    df.drop(df.index[df[name].isna()], inplace=True)
+
+def drop_missing_id_rows(df: pd.DataFrame, col_names: List[str]):
+  for name in col_names:
     df.drop(df.index[df[name].isna()], inplace=True)
 
 def strip_empty_tags(df: pd.DataFrame, col_names: List[str], verbose: bool=False):
   if not col_names:
     return
-  df[col_names] = df[col_names].fillna(value='')
-  for name in col_names:
-    df[name] = df[name].apply(lambda s: s.strip())
-  stripped_df = df
+  is_empty = np.ones(len(df), dtype=bool)
   for name in col_names:
-    stripped_df = stripped_df[stripped_df[name] == '']
-  if not stripped_df.empty and verbose:
-    print(f'Found {len(stripped_df)} empty tag rows')
-
-def write_output(df: pd.DataFrame, file_name: str, description: str):
-  dirname = os.path.dirname(__file__)
-  path = os.path.join(dirname, 'output', file_name)
+    is_categorical = isinstance(df[name].dtype, pd.CategoricalDtype)
+    if is_categorical:
+      codes, uniques = df[name].cat.codes.to_numpy(), df[name].cat.categories
+    else:
+      codes, uniques = pd.factorize(df[name])
+    stripped = np.array([t.strip() for t in uniques] + [''], dtype='object')
+    if is_categorical:
+      stripped_codes, stripped_uniques = pd.factorize(stripped)
+      df[name] = pd.Categorical.from_codes(stripped_codes[codes], categories=stripped_uniques)
+    else:
+      df[name] = stripped[codes]
+    is_empty &= (stripped == '')[codes]
+  empty_rows = int(is_empty.sum())
+  if empty_rows and verbose:
+    print(f'Found {empty_rows} empty tag rows')
+
+def write_output(df: pd.DataFrame, file_name: str, description: str, directory: str=default_output_directory):
+  os.makedirs(directory, exist_ok=True)
+  path = os.path.join(directory, file_name)
   df.to_csv(path, index=False)
   print(f'{len(df)} {description} written to {path}')
 
-def drop_duplicates(df: pd.DataFrame, original_df: pd.DataFrame, entity: EntityType, output_prefix: str, interactive: bool=False):
-  starting_rows = len(df)
-  df.drop_duplicates(subset=list(entity.identifier_columns.keys()) + entity.tag_column_names, inplace=True)
-  dropped_rows = starting_rows - len(df)
+def column_codes(values: pd.Series) -> Tuple[np.ndarray, int]:
+  if isinstance(values.dtype, pd.CategoricalDtype):
+    codes, code_count = values.cat.codes.to_numpy().astype('int64'), len(values.cat.categories)
+  else:
+    codes, uniques = pd.factorize(values)
+    codes, code_count = codes.astype('int64', copy=False), len(uniques)
+  codes += 1
+  return codes, code_count + 1
+
+def row_keys(df: pd.DataFrame, col_names: List[str], keys: Optional[np.ndarray]=None, key_count: int=1) -> Tuple[np.ndarray, int]:
+  keys = np.zeros(len(df), dtype='int64') if keys is None else keys.copy()
+  for name in col_names:
+    codes, code_count = column_codes(df[name])
+    if key_count * code_count >= 2 ** 62:
+      keys, uniques = pd.factorize(keys)
+      key_count = len(uniques)
+    keys *= code_count
+    keys += codes
+    key_count *= code_count
+  return keys, key_count
+
+def duplicated_keys(keys: np.ndarray, keep: any='first') -> np.ndarray:
+  return pd.Series(keys, copy=False).duplicated(keep=keep).to_numpy()
+
+def sorted_rows(df: pd.DataFrame, is_selected: np.ndarray, col_names: List[str]) -> pd.DataFrame:
+  positions = np.flatnonzero(is_selected)
+  order = df[col_names].iloc[positions].reset_index(drop=True).sort_values(col_names).index.to_numpy()
+  return df.iloc[positions[order]]
+
+def write_conflicts(df: pd.DataFrame, original_df: Optional[pd.DataFrame], is_conflicting: np.ndarray, entity: EntityType, output_prefix: str):
+  if original_df is None:
+    original_df = df
+    is_conflicting_original = is_conflicting
+  else:
+    is_conflicting_original = original_df.index.isin(df.index[is_conflicting])
+  identifier_column_names = list(entity.identifier_columns.keys())
+  write_output(
+    df=sorted_rows(df=original_df, is_selected=is_conflicting_original, col_names=identifier_column_names),
+    file_name=f'{output_prefix}_conflicting_tags.csv',
+    description='conflicting tag rows'
+  )
+  write_output(
+    df=sorted_rows(df=original_df, is_selected=~is_conflicting_original, col_names=identifier_column_names),
+    file_name=f'{output_prefix}_non_conflicting_tags.csv',
+    description='non conflicting tag rows'
+  )
+
+def drop_duplicates(df: pd.DataFrame, original_df: Optional[pd.DataFrame], entity: EntityType, output_prefix: str, interactive: bool=False):
+  identifier_keys, identifier_key_count = row_keys(df, list(entity.identifier_columns.keys()))
+  tag_keys, _ = row_keys(df, entity.tag_column_names, keys=identifier_keys, key_count=identifier_key_count)
+  keep = ~duplicated_keys(tag_keys)
+  dropped_rows = len(df) - int(keep.sum())
   if dropped_rows > 0 and interactive:
     print(f'Dropped {dropped_rows} duplicate rows with identical tags.')
 
-  duplicated_series = df.duplicated(subset=entity.identifier_columns.keys(), keep=False)
-  duplicate_rows = pd.DataFrame(df[duplicated_series.values])
-  if not len(duplicate_rows):
+  unique_identifier_keys = identifier_keys[keep]
+  is_conflicting = duplicated_keys(unique_identifier_keys, keep=False)
+  if not is_conflicting.any():
+    if dropped_rows:
+      df.drop(df.index[~keep], inplace=True)
     return True
-  
+
   if interactive:
-    duplicate_rows.ad_id = duplicate_rows.ad_id.apply(json.dumps)
-    duplicate_rows['is_duplicate'] = True
-    original_duplicates = original_df.sort_values(list(entity.identifier_columns.keys())).join(
-      duplicate_rows[[*entity.identifier_columns.keys(), 'is_duplicate']].drop_duplicates(subset=list(entity.identifier_columns.keys())).set_index(list(entity.identifier_columns.keys())), 
-      on=list(entity.identifier_columns.keys())
-    )
-    duplicates = original_duplicates[original_duplicates.is_duplicate == True]
-    non_duplicates = original_duplicates[original_duplicates.is_duplicate != True]
-    write_output(
-      df=duplicates.drop('is_duplicate', axis=1),
-      file_name=f'{output_prefix}_conflicting_tags.csv',
-      description='conflicting tag rows'
-    )
-    write_output(
-      df=non_duplicates.drop('is_duplicate', axis=1),
-      file_name=f'{output_prefix}_non_conflicting_tags.csv',
-      description='non conflicting tag rows'
-    )
+    conflicting_keys = pd.Series(identifier_keys, copy=False).isin(unique_identifier_keys[is_conflicting]).to_numpy()
+    write_conflicts(df=df, original_df=original_df, is_conflicting=conflicting_keys, entity=entity, output_prefix=output_prefix)
     resolution = click.prompt('Resolve conflicting tag rows by taking (f)irst, (l)ast, (s)kip or (a)bort', type=click.Choice(['f', 'l', 's', 'a']))
     if resolution == 'a':
+      df.drop(df.index[~keep], inplace=True)
       return False
   else:
     resolution = 'l'
@@ -128,130 +166,433 @@ def drop_duplicates(df: pd.DataFrame, original_df: pd.DataFrame, entity: EntityT
     'l': 'last',
     's': False,
   }
-  df.drop_duplicates(subset=list(entity.identifier_columns.keys()), keep=keep_map[resolution], inplace=True)
+  keep[keep] = ~duplicated_keys(unique_identifier_keys, keep=keep_map[resolution])
+  df.drop(df.index[~keep], inplace=True)
   return True
 
-def count_tags(schema: str, entity: EntityType):
-  layer = SQL.Layer()
-  layer.connect()
-  count_query = SQL.Query(f'select count(*) from {schema}.{entity.table_name};')
-  result = count_query.run(sql_layer=layer).fetchone()
-  layer.disconnect()
+def upload_group_values(upload_group: str, rows: int) -> pd.Categorical:
+  return pd.Categorical.from_codes(np.zeros(rows, dtype='int8'), categories=[upload_group])
+
+def concat_tags(frames: List[pd.DataFrame]) -> pd.DataFrame:
+  if len(frames) == 1:
+    return frames[0]
+  columns = {}
+  for name in frames[0].columns:
+    values = [f[name] for f in frames]
+    if all(isinstance(v.dtype, pd.CategoricalDtype) for v in values):
+      columns[name] = union_categoricals(values)
+    else:
+      columns[name] = pd.concat(values, ignore_index=True)
+  return pd.DataFrame(columns, index=pd.RangeIndex(sum(len(f) for f in frames)))
+
+def count_tags(schema: str, entity: EntityType, session: Optional[Session]=None):
+  with use_session(session) as session:
+    count_query = SQL.Query(f'select count(*) from {schema}.{entity.table_name};')
+    result = count_query.run(sql_layer=session.connect()).fetchone()
   return result[0]
 
-def upload_tags(schema: str, entity: EntityType, tags: pd.DataFrame, replace: bool=False, purge: bool=False):
-  print(f'Uploading {len(tags)} tags to schema {schema}')
-  layer = SQL.Layer()
-
-  layer.connect()
-  prepare_upload_query = SQL.Query(f"""
-drop table if exists {schema}.{entity.upload_table_name};
-create table {schema}.{entity.upload_table_name} (like {schema}.{entity.table_name});
-  """)
-  prepare_upload_query.run(sql_layer=layer)
-  layer.commit()
-  layer.disconnect()
-
-  layer.insert_data_frame(
-    data_frame=tags,
-    schema_name=schema,
-    table_name=entity.upload_table_name,
-    column_type_transform_dictionary=None,
+def tag_hash_values(tags: pd.DataFrame, entity: EntityType) -> pd.Series:
+  tag_values = [tags[c].fillna('').astype(str) for c in entity.tag_column_names]
+  codes, uniques = pd.factorize(tag_values[0].str.cat(tag_values[1:], sep='\x1f'))
+  hashes = np.array([hashlib.md5(p.encode()).hexdigest() for p in uniques], dtype='object')
+  return pd.Series(hashes[codes], index=tags.index, dtype='object')
+
+def fetch_tag_hashes(schema: str, entity: EntityType, session: Optional[Session]=None) -> pd.DataFrame:
+  identifier_column_names = list(entity.identifier_columns.keys())
+  tag_text = " || chr(31) || ".join(f"coalesce({c}, '')" for c in entity.tag_column_names)
+  hash_query = SQL.Query(f'''
+select {', '.join(identifier_column_names)}, md5({tag_text})
+from {schema}.{entity.table_name};
+  ''')
+  with use_session(session) as session:
+    rows = hash_query.run(sql_layer=session.connect()).fetchall()
+  return pd.DataFrame(rows, columns=identifier_column_names + ['tag_hash'], dtype='object')
+
+def identifier_keys(df: pd.DataFrame, entity: EntityType) -> pd.Index:
+  key_values = [df[c].astype(str) for c in entity.identifier_columns.keys()]
+  return pd.Index(key_values[0].str.cat(key_values[1:], sep='\x1f'))
+
+def changed_tags(tags: pd.DataFrame, existing_hashes: pd.DataFrame, entity: EntityType, purge: bool=True) -> pd.DataFrame:
+  existing_index = identifier_keys(df=existing_hashes, entity=entity)
+  is_unique_existing = ~existing_index.duplicated()
+  existing_index = existing_index[is_unique_existing]
+  existing_tag_hashes = np.append(existing_hashes.tag_hash.to_numpy()[is_unique_existing], None)
+
+  positions = existing_index.get_indexer(identifier_keys(df=tags, entity=entity))
+  is_new = positions < 0
+  positions[is_new] = len(existing_index)
+  is_changed = is_new | (existing_tag_hashes[positions] != tag_hash_values(tags=tags, entity=entity).to_numpy())
+  if purge:
+    # New rows with empty tags would be purged right after the merge, so there is nothing to upload for them
+    is_empty = (tags[entity.tag_column_names].fillna('') == '').all(axis=1).to_numpy()
+    is_changed &= ~(is_new & is_empty)
+  return tags[is_changed]
+
+def empty_tags_condition_query(entity: EntityType, alias: Optional[str]=None) -> SQL.Query:
+  prefix = f'{alias}.' if alias else ''
+  condition_queries = [
+    SQL.Query(f'({prefix}"{c}" = %s or {prefix}"{c}" is null)', substitution_parameters=('',)) 
+    for c in entity.tag_column_names
+  ]
+  return SQL.Query(
+    query='and '.join(q.query for q in condition_queries),
+    substitution_parameters=tuple(p for q in condition_queries for p in q.substitution_parameters)
   )
 
-  layer.connect()
-  count_query = SQL.Query(f'select count(*) from {schema}.{entity.table_name};')
-  count = count_query.run(sql_layer=layer).fetchone()[0]
-
-  if count:
-    backup_query = SQL.Query(f"""
-drop table if exists {schema}.{entity.restore_table_name};
-create table {schema}.{entity.restore_table_name} (like {schema}.{entity.table_name});
+def identifier_join_condition(entity: EntityType, left_alias: str, right_alias: str) -> str:
+  return ' and '.join(f'{left_alias}."{c}" = {right_alias}."{c}"' for c in entity.identifier_columns.keys())
+
+def backup_tags_query(schema: str, entity: EntityType, strategy: BackupStrategy, purge: bool=False, upload_table_name: Optional[str]=None) -> SQL.Query:
+  if upload_table_name is None:
+    upload_table_name = entity.upload_table_name
+  drop_query_text = f'''
+drop table if exists {schema}.{entity.restore_keys_table_name};
+drop table if exists {schema}.{entity.restore_table_name};'''
+  if strategy is BackupStrategy.none:
+    return SQL.Query(drop_query_text)
+
+  create_query_text = f'''
+create table {schema}.{entity.restore_table_name} (like {schema}.{entity.table_name});'''
+  if strategy is BackupStrategy.full:
+    return SQL.Query(f'''{drop_query_text}{create_query_text}
 insert into {schema}.{entity.restore_table_name} select * from {schema}.{entity.table_name};
-    """)
-    backup_query.run(sql_layer=layer)
+    ''')
 
-    if replace:
-      truncate_query = SQL.Query(f'truncate table {schema}.{entity.table_name}')
-      truncate_query.run(sql_layer=layer)
+  touched_query = SQL.Query(f'''exists (
+  select 1 from {schema}.{upload_table_name} u
+  where {identifier_join_condition(entity=entity, left_alias='u', right_alias='t')}
+)''')
+  if purge:
+    empty_query = empty_tags_condition_query(entity=entity, alias='t')
+    touched_query = SQL.Query(
+      query=f'{touched_query.query}\nor ({empty_query.query})\nor t."{entity.value}_subtag" = %s',
+      substitution_parameters=(*empty_query.substitution_parameters, '')
+    )
+  identifier_column_names = ', '.join(f'"{c}"' for c in entity.identifier_columns.keys())
+  return SQL.Query(
+    query=f'''{drop_query_text}{create_query_text}
+insert into {schema}.{entity.restore_table_name}
+select t.* from {schema}.{entity.table_name} t
+where {touched_query.query};
+create table {schema}.{entity.restore_keys_table_name} as
+select {identifier_column_names} from {schema}.{upload_table_name};
+    ''',
+    substitution_parameters=touched_query.substitution_parameters
+  )
+
+def restore_tags(schema: str, entity: EntityType, session: Optional[Session]=None) -> BackupStrategy:
+  with use_session(session) as session:
+    layer = session.connect()
+    SQL.Query(f'lock table {schema}.{entity.table_name};').run(sql_layer=layer)
+    tables_query = SQL.Query(
+      query='''
+select table_name
+from information_schema.tables
+where table_schema = %s
+and table_name in (%s, %s);
+      ''',
+      substitution_parameters=(schema, entity.restore_table_name, entity.restore_keys_table_name)
+    )
+    backup_tables = {r[0] for r in tables_query.run(sql_layer=layer).fetchall()}
+    if entity.restore_table_name not in backup_tables:
+      raise ValueError('No tag backup found', f'{schema}.{entity.restore_table_name}')
+
+    if entity.restore_keys_table_name in backup_tables:
+      strategy = BackupStrategy.delta
+      delete_query_text = f'''
+delete from {schema}.{entity.table_name} t
+using {schema}.{entity.restore_keys_table_name} k
+where {identifier_join_condition(entity=entity, left_alias='t', right_alias='k')};
+delete from {schema}.{entity.table_name} t
+using {schema}.{entity.restore_table_name} r
+where {identifier_join_condition(entity=entity, left_alias='t', right_alias='r')};
+      '''
+    else:
+      strategy = BackupStrategy.full
+      delete_query_text = f'''
+delete from {schema}.{entity.table_name};
+      '''
+    restore_query = SQL.Query(f'''{delete_query_text}
+insert into {schema}.{entity.table_name} select * from {schema}.{entity.restore_table_name};
+    ''')
+    restore_query.run(sql_layer=layer)
+    layer.commit()
+  return strategy
+
+def tag_state_scope(schema: str, entity: EntityType) -> Tuple[str, str, str]:
+  return (SQL.Layer.connection_options.database, schema, entity.value)
+
+def tag_state(tags: pd.DataFrame, entity: EntityType) -> pd.DataFrame:
+  tag_name, subtag_name = entity.tag_column_names
+  return pd.DataFrame({
+    'channel': tags.channel.to_numpy(),
+    'entity_id': tags[f'{entity.value}_id'].to_numpy(),
+    'tag': tags[tag_name].to_numpy(),
+    'subtag': tags[subtag_name].to_numpy(),
+    'upload_group': tags.upload_group.to_numpy() if 'upload_group' in tags.columns else None,
+  })
+
+def refresh_tag_state(schema: str, entity: EntityType, state_index: TagStateIndex, session: Optional[Session]=None) -> int:
+  column_names = list(entity.identifier_columns.keys()) + entity.update_column_names
+  state_query = SQL.Query(f'''
+select {', '.join(f'"{c}"' for c in column_names)}
+from {schema}.{entity.table_name};
+  ''')
+  with use_session(session) as session:
+    rows = state_query.run(sql_layer=session.connect()).fetchall()
+  tags = pd.DataFrame(rows, columns=column_names, dtype='object')
+  state_index.update(scope=tag_state_scope(schema=schema, entity=entity), state=tag_state(tags=tags, entity=entity), replace=True)
+  return len(tags)
+
+def tag_state_changes(tags: pd.DataFrame, entity: EntityType, state_index: TagStateIndex, scope: Tuple[str, str, str]) -> pd.DataFrame:
+  tag_name, subtag_name = entity.tag_column_names
+  existing = state_index.lookup(scope=scope, keys=tag_state(tags=tags, entity=entity))
+  changes = pd.DataFrame({
+    'channel': tags.channel.to_numpy(),
+    f'{entity.value}_id': tags[f'{entity.value}_id'].to_numpy(),
+    tag_name: tags[tag_name].to_numpy(),
+    subtag_name: tags[subtag_name].to_numpy(),
+    f'existing_{tag_name}': None,
+    f'existing_{subtag_name}': None,
+    'existing_upload_group': None,
+    'change': 'insert',
+  })
+  positions = existing.index.to_numpy()
+  changes.loc[positions, f'existing_{tag_name}'] = existing.tag.to_numpy()
+  changes.loc[positions, f'existing_{subtag_name}'] = existing.subtag.to_numpy()
+  changes.loc[positions, 'existing_upload_group'] = existing.upload_group.to_numpy()
+
+  is_existing = np.zeros(len(changes), dtype=bool)
+  is_existing[positions] = True
+  is_same = np.ones(len(changes), dtype=bool)
+  for name in entity.tag_column_names:
+    is_same &= (changes[name].fillna('') == changes[f'existing_{name}'].fillna('')).to_numpy()
+  changes.loc[is_existing & is_same, 'change'] = 'unchanged'
+  changes.loc[is_existing & ~is_same, 'change'] = 'update'
+  return changes
+
+def report_tag_state_changes(changes: pd.DataFrame, upload_group: str, output_prefix: str, interactive: bool=False):
+  if not interactive:
+    return
+  change_counts = changes.change.value_counts()
+  is_update = changes.change == 'update'
+  is_conflict = is_update & changes.existing_upload_group.notna() & (changes.existing_upload_group != upload_group)
+  print(f'{change_counts.get("insert", 0)} new, {change_counts.get("update", 0)} changed and {change_counts.get("unchanged", 0)} unchanged tag rows according to the local tag state index')
+  id_column_name = next(c for c in changes.columns if c.endswith('_id'))
+  output_changes = changes[is_update].drop('change', axis=1)
+  output_changes[id_column_name] = output_changes[id_column_name].apply(json.dumps)
+  if len(output_changes):
+    write_output(
+      df=output_changes,
+      file_name=f'{output_prefix}_changed_tags.csv',
+      description='changed tag rows'
+    )
+  if is_conflict.any():
+    write_output(
+      df=output_changes[is_conflict[is_update]],
+      file_name=f'{output_prefix}_cross_file_conflicting_tags.csv',
+      description='tag rows conflicting with other upload groups'
+    )
+
+def upload_tags_plan(schema: str, entity: EntityType, tags: pd.DataFrame, replace: bool=False, purge: bool=False, loader: Optional[Loader]=None, tracer: Optional[Tracer]=None, backup_strategy: BackupStrategy=BackupStrategy.full) -> Plan:
+  if loader is None:
+    loader = InsertLoader()
+  if tracer is None:
+    tracer = Tracer()
+
+  upload_table_name = f'{entity.upload_table_name}_{uuid.uuid4().hex[:12]}'
+  plan = Plan(name=f'{schema}_{entity.table_name}')
+  plan.add_query('tag.prepare', SQL.Query(f"""
+create table {schema}.{upload_table_name} (like {schema}.{entity.table_name});
+  """))
+
+  def load(layer: SQL.Layer):
+    with tracer.stage('tag.load', rows=len(tags), bytes=data_frame_bytes(tags)):
+      loader.load(
+        layer=layer,
+        data_frame=tags,
+        schema_name=schema,
+        table_name=upload_table_name,
+        column_type_transform_dictionary=None,
+      )
+  plan.add_call('tag.load', f'load {len(tags)} tag rows into {schema}.{upload_table_name}', load, rows=len(tags))
+
+  plan.add_query('tag.lock', SQL.Query(f'lock table {schema}.{entity.table_name};'))
+  plan.add_query('tag.backup', backup_tags_query(
+    schema=schema,
+    entity=entity,
+    strategy=BackupStrategy.full if replace and backup_strategy is BackupStrategy.delta else backup_strategy,
+    purge=purge,
+    upload_table_name=upload_table_name
+  ))
+  if replace:
+    plan.add_query('tag.delete', SQL.Query(f'delete from {schema}.{entity.table_name};'))
 
   merge_query = SQL.MergeQuery(
     join_columns=list(entity.identifier_columns.keys()),
     update_columns=entity.update_column_names,
-    source_table = entity.upload_table_name,
+    source_table = upload_table_name,
     target_table = entity.table_name,
     source_schema = schema,
     target_schema = schema
   )
-  merge_query.run(sql_layer=layer)
+  plan.add_query('tag.merge', merge_query, rows=len(tags))
 
   if purge:
-    condition_queries = [
-      SQL.Query(f'("{c}" = %s or "{c}" is null)', substitution_parameters=('',)) 
-      for c in entity.tag_column_names
-    ]
-    conditions_query_text = 'and '.join(q.query for q in condition_queries)
-    purge_query = SQL.Query(
+    conditions_query = empty_tags_condition_query(entity=entity)
+    plan.add_query('tag.purge', SQL.Query(
       query=f'''
 delete from {schema}.{entity.table_name}
-where {conditions_query_text};
+where {conditions_query.query};
       ''',
-      substitution_parameters=tuple(p for q in condition_queries for p in q.substitution_parameters)
-    )
-    purge_query.run(sql_layer=layer)
-
-    convert_empty_query = SQL.Query(f'''
+      substitution_parameters=conditions_query.substitution_parameters
+    ))
+    plan.add_query('tag.convert_empty', SQL.Query(f'''
 update {schema}.{entity.table_name}
 set {entity.value}_subtag = null
 where {entity.value}_subtag = '';
-    ''')
-    convert_empty_query.run(sql_layer=layer)
+    '''))
 
-  drop_upload_query = SQL.Query(f'drop table if exists {schema}.{entity.upload_table_name};')
-  drop_upload_query.run(sql_layer=layer)
-  layer.commit()
+  plan.add_query('tag.drop_upload', SQL.Query(f'drop table if exists {schema}.{upload_table_name};'))
+  plan.add_cleanup_query('tag.drop_upload', SQL.Query(f'drop table if exists {schema}.{upload_table_name};'))
+  return plan
+
+def upload_tags(schema: str, entity: EntityType, tags: pd.DataFrame, replace: bool=False, purge: bool=False, loader: Optional[Loader]=None, session: Optional[Session]=None, tracer: Optional[Tracer]=None, backup_strategy: BackupStrategy=BackupStrategy.full):
+  print(f'Uploading {len(tags)} tags to schema {schema}')
+  plan = upload_tags_plan(schema=schema, entity=entity, tags=tags, replace=replace, purge=purge, loader=loader, tracer=tracer, backup_strategy=backup_strategy)
+  with use_session(session) as session:
+    plan.run(layer=session.connect(), tracer=tracer)
 
 class Tagger:
-  def apply_tags(self, schema_name: str, entity_name: str, should_drop: bool, should_purge: bool, csv_stream: any, file_name: str, interactive: bool=False):
-    original_df = pd.read_csv(csv_stream, dtype='object')
-    original_df.rename(columns={'Unnamed: 0': ''}, inplace=True)
+  loader: Loader
+  session: Optional[Session]
+  tracer: Tracer
+  state_index: Optional[TagStateIndex]
+
+  def __init__(self, loader: Optional[Loader]=None, session: Optional[Session]=None, tracer: Optional[Tracer]=None, state_index: Optional[TagStateIndex]=None):
+    self.loader = loader if loader is not None else InsertLoader()
+    self.session = session
+    self.tracer = tracer if tracer is not None else Tracer()
+    self.state_index = state_index
+
+  def read_tags(self, csv_stream: any, entity_name: str, interactive: bool=False) -> Tuple[EntityType, pd.DataFrame, Optional[pd.DataFrame]]:
+    source = input_source(csv_stream)
+    with self.tracer.stage('tag.parse') as record:
+      if interactive:
+        original_df = source.read_data_frame(dtype=tag_input_dtypes)
+        original_df.rename(columns={'Unnamed: 0': ''}, inplace=True)
+        df = original_df[[c for c in original_df.columns if c in tag_input_column_names]].copy()
+      else:
+        original_df = None
+        df = source.read_data_frame(column_filter=lambda c: c in tag_input_column_names, dtype=tag_input_dtypes)
+      record.rows = len(df)
+      record.bytes = data_frame_bytes(df)
     if interactive:
-      print(f'Imported {len(original_df)} tag rows from stream {csv_stream}')
-    df = original_df.copy()
+      print(f'Imported {len(df)} tag rows from stream {csv_stream}')
     df.rename(columns={'company': 'company_identifier'}, inplace=True)
 
     entity = EntityType.from_tag_data(tags=df) if entity_name == 'auto' else EntityType(entity_name)
-    df = pd.DataFrame(df, columns=list(entity.columns.keys()))
-    convert_id_columns(df, entity.id_column_names)
-    strip_empty_tags(df, entity.tag_column_names, verbose=interactive)
-    if not drop_duplicates(
-      df=df, 
-      original_df=original_df, 
-      entity=entity,
-      output_prefix=os.path.splitext(os.path.basename(file_name))[0],
-      interactive=interactive
-    ):
-      return 0
+    df = df.reindex(columns=list(entity.columns.keys()), copy=False)
+    with self.tracer.stage('tag.convert_ids', rows=len(df)):
+      if source.typed:
+        drop_missing_id_rows(df, entity.id_column_names)
+      else:
+        convert_id_columns(df, entity.id_column_names)
+    with self.tracer.stage('tag.strip_empty', rows=len(df)):
+      strip_empty_tags(df, entity.tag_column_names, verbose=interactive)
+    return entity, df, original_df
+
+  def apply_tags(self, schema_name: str, entity_name: str, should_drop: bool, should_purge: bool, csv_stream: any, file_name: str, interactive: bool=False, incremental: bool=False, backup_strategy: BackupStrategy=BackupStrategy.full, dry_run: bool=False):
+    if incremental and should_drop:
+      raise ValueError('Incremental tag uploads cannot drop existing tags')
+    if incremental and dry_run:
+      raise ValueError('Incremental tag uploads cannot be planned without reading existing tags')
+    entity, df, original_df = self.read_tags(csv_stream=csv_stream, entity_name=entity_name, interactive=interactive)
+    with self.tracer.stage('tag.drop_duplicates', rows=len(df)):
+      if not drop_duplicates(
+        df=df, 
+        original_df=original_df, 
+        entity=entity,
+        output_prefix=os.path.splitext(os.path.basename(file_name))[0],
+        interactive=interactive
+      ):
+        return 0
 
     if df.empty:
       if interactive:
         print('No tags found in data')
       return 0
 
-    df['upload_group'] = os.path.basename(file_name)
+    if incremental:
+      with self.tracer.stage('tag.fetch_hashes') as record:
+        existing_hashes = fetch_tag_hashes(schema=schema_name, entity=entity, session=self.session)
+        record.rows = len(existing_hashes)
+      with self.tracer.stage('tag.diff', rows=len(df)):
+        unchanged_rows = len(df)
+        df = changed_tags(tags=df, existing_hashes=existing_hashes, entity=entity, purge=should_purge)
+        unchanged_rows -= len(df)
+      if interactive:
+        print(f'Skipping {unchanged_rows} unchanged tag rows')
+      if df.empty:
+        if interactive:
+          print('No tag changes found in data')
+        return 0
+
+    upload_group = os.path.basename(file_name)
+    df['upload_group'] = upload_group_values(upload_group=upload_group, rows=len(df))
+    if self.state_index is not None:
+      state_scope = tag_state_scope(schema=schema_name, entity=entity)
+      with self.tracer.stage('tag.state_lookup', rows=len(df)):
+        changes = tag_state_changes(tags=df, entity=entity, state_index=self.state_index, scope=state_scope)
+      report_tag_state_changes(
+        changes=changes,
+        upload_group=upload_group,
+        output_prefix=os.path.splitext(upload_group)[0],
+        interactive=interactive
+      )
+
+    if dry_run:
+      plan = upload_tags_plan(schema=schema_name, entity=entity, tags=df, replace=should_drop, purge=should_purge, loader=self.loader, tracer=self.tracer, backup_strategy=backup_strategy)
+      plan.write()
+      return len(df)
       
     if interactive:
       print(df.head())
-      count = count_tags(schema=schema_name, entity=entity)
+      if self.state_index is not None:
+        count = self.state_index.count(scope=state_scope)
+      else:
+        count = count_tags(schema=schema_name, entity=entity, session=self.session)
     if interactive:
       verb = 'Replace' if should_drop else 'Merge'
       confirmation = click.prompt(f'{verb} {count} existing {entity.value} tags with {len(df)} new tags for {schema_name}', type=click.Choice(['y', 'n']))
       if confirmation.lower() != 'y':
         return 0
     
-    upload_tags(schema=schema_name, entity=entity, tags=df, replace=should_drop, purge=should_purge)
+    upload_tags(schema=schema_name, entity=entity, tags=df, replace=should_drop, purge=should_purge, loader=self.loader, session=self.session, tracer=self.tracer, backup_strategy=backup_strategy)
+    if self.state_index is not None:
+      with self.tracer.stage('tag.state_update', rows=len(df)):
+        self.state_index.update(scope=state_scope, state=tag_state(tags=df, entity=entity), replace=should_drop, purge=should_purge)
     if interactive:
-      final_count = count_tags(schema=schema_name, entity=entity)
+      if self.state_index is not None:
+        final_count = self.state_index.count(scope=state_scope)
+      else:
+        final_count = count_tags(schema=schema_name, entity=entity, session=self.session)
       print(f'{final_count} {entity.value} tags for {schema_name} exist after upload')
 
-    return len(df)
\ No newline at end of file
+    return len(df)
+
+  def pooled_tagger(self, session: Session) -> any:
+    return Tagger(loader=self.loader, session=session, tracer=self.tracer, state_index=self.state_index)
+
+  async def apply_tags_async(self, pool: SessionPool, schema_name: str, entity_name: str, should_drop: bool, should_purge: bool, csv_stream: any, file_name: str, incremental: bool=False, backup_strategy: BackupStrategy=BackupStrategy.full, dry_run: bool=False) -> int:
+    return await pool.run_async(lambda session: self.pooled_tagger(session=session).apply_tags(
+      schema_name=schema_name,
+      entity_name=entity_name,
+      should_drop=should_drop,
+      should_purge=should_purge,
+      csv_stream=csv_stream,
+      file_name=file_name,
+      incremental=incremental,
+      backup_strategy=backup_strategy,
+      dry_run=dry_run
+    ))
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import sys
+import json
+import time
+import resource
+import threading
+
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Optional, Iterable, Iterator, Dict, List
+
+if TYPE_CHECKING:
+  import pandas as pd
+
+def peak_rss() -> int:
+  usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return usage if sys.platform == 'darwin' else usage * 1024
+
+def current_rss() -> Optional[int]:
+  try:
+    with open('/proc/self/statm', 'r') as statm_file:
+      return int(statm_file.read().split()[1]) * resource.getpagesize()
+  except (OSError, ValueError, IndexError):
+    return None
+
+def data_frame_bytes(data_frame: pd.DataFrame) -> int:
+  return int(data_frame.memory_usage(index=False).sum())
+
+class StageRecord:
+  name: str
+  started_at: float
+  seconds: Optional[float]
+  rows: Optional[int]
+  bytes: Optional[int]
+  start_rss: Optional[int]
+  rss_delta: Optional[int]
+  process_peak_rss: Optional[int]
+
+  def __init__(self, name: str, rows: Optional[int]=None, bytes: Optional[int]=None, start_rss: Optional[int]=None):
+    self.name = name
+    self.started_at = time.time()
+    self.seconds = None
+    self.rows = rows
+    self.bytes = bytes
+    self.start_rss = start_rss
+    self.rss_delta = None
+    self.process_peak_rss = None
+
+  @property
+  def dictionary(self) -> Dict[str, any]:
+    return {
+      'stage': self.name,
+      'started_at': self.started_at,
+      'seconds': self.seconds,
+      'rows': self.rows,
+      'bytes': self.bytes,
+      'rss_delta': self.rss_delta,
+      'process_peak_rss': self.process_peak_rss,
+    }
+
+class Sink:
+  def record(self, record: StageRecord):
+    pass
+
+  def close(self):
+    pass
+
+class JSONLinesSink(Sink):
+  path: str
+
+  def __init__(self, path: str):
+    self.path = path
+    self._file = open(path, 'a')
+    self._lock = threading.Lock()
+
+  def record(self, record: StageRecord):
+    with self._lock:
+      self._file.write(json.dumps(record.dictionary) + '\n')
+      self._file.flush()
+
+  def close(self):
+    self._file.close()
+
+class SummarySink(Sink):
+  stream: any
+  stages: Dict[str, Dict[str, any]]
+
+  def __init__(self, stream: any=None):
+    self.stream = stream if stream is not None else sys.stderr
+    self.stages = {}
+    self._lock = threading.Lock()
+
+  def record(self, record: StageRecord):
+    with self._lock:
+      stage = self.stages.setdefault(record.name, {'count': 0, 'seconds': 0.0, 'rows': 0, 'bytes': 0, 'rss_delta': None, 'process_peak_rss': 0})
+      stage['count'] += 1
+      stage['seconds'] += record.seconds or 0
+      stage['rows'] += record.rows or 0
+      stage['bytes'] += record.bytes or 0
+      if record.rss_delta is not None:
+        stage['rss_delta'] = record.rss_delta if stage['rss_delta'] is None else max(stage['rss_delta'], record.rss_delta)
+      stage['process_peak_rss'] = max(stage['process_peak_rss'], record.process_peak_rss or 0)
+
+  def close(self):
+    if not self.stages:
+      return
+    rows = [('stage', 'count', 'seconds', 'rows', 'rows/s', 'MB', 'max RSS change MB', 'process peak RSS MB')]
+    for name, stage in self.stages.items():
+      rows.append((
+        name,
+        str(stage['count']),
+        f'{stage["seconds"]:.3f}',
+        str(stage['rows']),
+        f'{stage["rows"] / stage["seconds"]:.0f}' if stage['rows'] and stage['seconds'] else '',
+        f'{stage["bytes"] / 1048576:.1f}' if stage['bytes'] else '',
+        f'{stage["rss_delta"] / 1048576:+.1f}' if stage['rss_delta'] is not None else '',
+        f'{stage["process_peak_rss"] / 1048576:.1f}',
+      ))
+    widths = [max(len(r[i]) for r in rows) for i in range(len(rows[0]))]
+    for row in rows:
+      print('  '.join(c.ljust(w) for c, w in zip(row, widths)).rstrip(), file=self.stream)
+
+class Tracer:
+  sinks: List[Sink]
+
+  def __init__(self, sinks: List[Sink]=[]):
+    self.sinks = list(sinks)
+
+  @contextmanager
+  def stage(self, name: str, rows: Optional[int]=None, bytes: Optional[int]=None) -> Iterator[StageRecord]:
+    record = StageRecord(name=name, rows=rows, bytes=bytes, start_rss=current_rss() if self.sinks else None)
+    start = time.perf_counter()
+    try:
+      yield record
+    finally:
+      self.emit(record=record, seconds=time.perf_counter() - start)
+
+  def iterate(self, name: str, data_frames: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+    iterator = iter(data_frames)
+    while True:
+      record = StageRecord(name=name, start_rss=current_rss() if self.sinks else None)
+      start = time.perf_counter()
+      try:
+        data_frame = next(iterator)
+      except StopIteration:
+        return
+      record.rows = len(data_frame)
+      record.bytes = data_frame_bytes(data_frame) if self.sinks else None
+      self.emit(record=record, seconds=time.perf_counter() - start)
+      yield data_frame
+
+  def emit(self, record: StageRecord, seconds: float):
+    record.seconds = seconds
+    if not self.sinks:
+      return
+    end_rss = current_rss()
+    if record.start_rss is not None and end_rss is not None:
+      record.rss_delta = end_rss - record.start_rss
+    record.process_peak_rss = peak_rss()
+    for sink in self.sinks:
+      sink.record(record)
+
+  def close(self):
+    for sink in self.sinks:
+      sink.close()
@@ -0,0 +1,190 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+
+try:
+  import pyarrow as pa
+  import pyarrow.compute as pc
+except ImportError:
+  pa = None
+
+from .base import ColumnType, sanitized_column_name
+from .plan import default_output_directory
+from typing import Optional, Dict, List, Tuple
+
+varchar_length_pattern = re.compile(r'^character varying\((\d+)\)$')
+integer_pattern = r'[+-]?[0-9]+'
+integer_bounds = {
+  'integer': 2 ** 31,
+  'bigint': 2 ** 63,
+}
+# Sanitized column names never contain '#', so these report columns cannot collide with table columns
+row_column = '#row'
+errors_column = '#errors'
+# pandas 2 infers one format from the first value unless told the values are mixed
+date_options = {'format': 'mixed'} if int(pd.__version__.split('.')[0]) >= 2 else {}
+true_values = ['true', 't', 'yes', 'y', '1']
+false_values = ['false', 'f', 'no', 'n', '0']
+
+class TypedColumn:
+  name: str
+  column_type: ColumnType
+  type_name: str
+  max_length: Optional[int]
+
+  def __init__(self, name: str, result: str):
+    self.name = name
+    self.column_type = ColumnType.from_query_result(result)
+    self.type_name = result
+    length_match = varchar_length_pattern.match(result)
+    self.max_length = int(length_match.group(1)) if length_match else None
+
+  @property
+  def read_dtype(self) -> Optional[str]:
+    return None if self.column_type in [ColumnType.decimal, ColumnType.boolean] else 'object'
+
+  def convert(self, values: pd.Series) -> Tuple[pd.Series, np.ndarray]:
+    if self.column_type is ColumnType.integer:
+      return self.convert_integers(values=values)
+    if self.column_type is ColumnType.decimal:
+      return self.convert_decimals(values=values)
+    if self.column_type is ColumnType.boolean:
+      return self.convert_booleans(values=values)
+    if self.column_type is ColumnType.date:
+      converted = pd.to_datetime(values, errors='coerce', **date_options)
+      return converted, (converted.isna() & values.notna()).to_numpy()
+    return values, self.invalid_lengths(values=values)
+
+  def numeric_text(self, values: pd.Series) -> pd.Series:
+    return values.str.replace(',', '', regex=False).str.strip()
+
+  def convert_integers(self, values: pd.Series) -> Tuple[pd.Series, np.ndarray]:
+    if values.dtype != 'object':
+      converted = values.astype('Int64')
+      return converted, (converted.isna() & values.notna()).to_numpy()
+    is_present = values.notna().to_numpy()
+    bound = integer_bounds.get(self.type_name, integer_bounds['bigint'])
+    try:
+      present_integers = values.to_numpy()[is_present].astype('int64')
+    except (ValueError, OverflowError, TypeError):
+      return self.parse_integers(values=values, bound=bound)
+    integers = np.zeros(len(values), dtype='int64')
+    integers[is_present] = present_integers
+    is_integer = is_present & (integers >= -bound) & (integers < bound)
+    converted = pd.Series(pd.arrays.IntegerArray(integers, ~is_integer), index=values.index)
+    return converted, ~is_integer & is_present
+
+  def parse_integers(self, values: pd.Series, bound: int) -> Tuple[pd.Series, np.ndarray]:
+    text = self.numeric_text(values=values)
+    is_integer = text.str.fullmatch(integer_pattern).fillna(False).to_numpy(dtype=bool)
+    is_long = is_integer & (text.str.len().to_numpy(dtype='float64', na_value=0) > 18)
+    is_short = is_integer & ~is_long
+    integers = np.zeros(len(values), dtype='int64')
+    integers[is_short] = text[is_short].astype('int64').to_numpy()
+    for position in np.flatnonzero(is_long):
+      integer = int(text.iat[position])
+      if -bound <= integer < bound:
+        integers[position] = integer
+      else:
+        is_integer[position] = False
+    is_integer[is_short] &= (integers[is_short] >= -bound) & (integers[is_short] < bound)
+    converted = pd.Series(pd.arrays.IntegerArray(integers, ~is_integer), index=values.index)
+    return converted, ~is_integer & values.notna().to_numpy()
+
+  def convert_decimals(self, values: pd.Series) -> Tuple[pd.Series, np.ndarray]:
+    if values.dtype != 'object':
+      converted = values.astype('float64')
+      return converted, (converted.isna() & values.notna()).to_numpy()
+    converted = pd.to_numeric(values, errors='coerce')
+    is_unparsed = (converted.isna() & values.notna()).to_numpy()
+    if is_unparsed.any():
+      converted[is_unparsed] = pd.to_numeric(self.numeric_text(values=values[is_unparsed]), errors='coerce').to_numpy()
+    return converted, (converted.isna() & values.notna()).to_numpy()
+
+  def convert_booleans(self, values: pd.Series) -> Tuple[pd.Series, np.ndarray]:
+    if values.dtype != 'object':
+      converted = values.astype('boolean')
+      return converted, (converted.isna() & values.notna()).to_numpy()
+    codes, uniques = pd.factorize(values)
+    text = pd.Series(uniques, dtype='object').astype(str).str.strip().str.lower()
+    unique_values = np.where(text.isin(true_values), True, np.where(text.isin(false_values), False, None))
+    converted = pd.Series(pd.array(np.append(unique_values, None)[codes], dtype='boolean'), index=values.index)
+    return converted, (converted.isna() & values.notna()).to_numpy()
+
+  def value_lengths(self, values: pd.Series) -> Tuple[np.ndarray, bool]:
+    if pa is not None:
+      try:
+        strings = pa.array(values.to_numpy(), type=pa.string(), from_pandas=True)
+        return pc.binary_length(strings).to_numpy(zero_copy_only=False).astype('float64'), True
+      except (pa.ArrowInvalid, pa.ArrowTypeError):
+        pass
+    return values.str.len().to_numpy(dtype='float64', na_value=0), False
+
+  def invalid_lengths(self, values: pd.Series) -> np.ndarray:
+    if self.max_length is None or values.dtype != 'object':
+      return np.zeros(len(values), dtype=bool)
+    lengths, are_byte_lengths = self.value_lengths(values=values)
+    is_invalid = lengths > self.max_length
+    if are_byte_lengths:
+      return is_invalid
+    # Lengths are limits in bytes, so only encode values whose character count does not settle the question
+    is_ambiguous = ~is_invalid & (lengths * 4 > self.max_length)
+    if is_ambiguous.any():
+      byte_lengths = values[is_ambiguous].str.encode('utf-8').str.len().to_numpy()
+      is_invalid[is_ambiguous] = byte_lengths > self.max_length
+    return is_invalid
+
+class TypedReader:
+  columns: Dict[str, TypedColumn]
+  bad_rows_path: str
+  rows: int
+  bad_rows: int
+
+  def __init__(self, column_results: Dict[str, str], bad_rows_path: str):
+    self.columns = {c: TypedColumn(name=c, result=t) for c, t in column_results.items()}
+    self.bad_rows_path = bad_rows_path
+    self.rows = 0
+    self.bad_rows = 0
+
+  @classmethod
+  def for_table(cls, column_results: Dict[str, str], schema_name: str, table_name: str, directory: str=default_output_directory) -> any:
+    return cls(column_results=column_results, bad_rows_path=os.path.join(directory, f'{schema_name}_{table_name}_bad_rows.csv'))
+
+  def read_dtype(self, column_names: Optional[List[str]]) -> any:
+    if column_names is None:
+      return 'object'
+    columns = {c: self.columns.get(sanitized_column_name(c)) for c in column_names}
+    return {c: t.read_dtype for c, t in columns.items() if t is not None and t.read_dtype is not None}
+
+  def convert(self, data_frame: pd.DataFrame) -> pd.DataFrame:
+    if not self.rows and os.path.exists(self.bad_rows_path):
+      os.remove(self.bad_rows_path)
+    is_bad = np.zeros(len(data_frame), dtype=bool)
+    errors: List[Tuple[str, np.ndarray]] = []
+    converted_columns = {}
+    for name in data_frame.columns:
+      converted, is_invalid = self.columns[name].convert(values=data_frame[name])
+      converted_columns[name] = converted
+      if is_invalid.any():
+        is_bad |= is_invalid
+        errors.append((name, is_invalid))
+    converted_df = pd.DataFrame(converted_columns, index=data_frame.index)
+    if is_bad.any():
+      self.write_bad_rows(data_frame=data_frame, is_bad=is_bad, errors=errors)
+      converted_df = converted_df[~is_bad]
+    self.rows += len(data_frame)
+    return converted_df
+
+  def write_bad_rows(self, data_frame: pd.DataFrame, is_bad: np.ndarray, errors: List[Tuple[str, np.ndarray]]):
+    bad_df = data_frame[is_bad].copy()
+    column_errors = pd.Series('', index=bad_df.index, dtype='object')
+    for name, is_invalid in errors:
+      column = self.columns[name]
+      description = f'{name} exceeds {column.type_name}' if column.max_length is not None else f'{name} is not a valid {column.type_name}'
+      column_errors[is_invalid[is_bad]] += description + '; '
+    bad_df.insert(0, row_column, np.flatnonzero(is_bad) + self.rows + 1)
+    bad_df[errors_column] = column_errors.str.rstrip('; ')
+    os.makedirs(os.path.dirname(self.bad_rows_path), exist_ok=True)
+    bad_df.to_csv(self.bad_rows_path, mode='a', header=not os.path.exists(self.bad_rows_path), index=False)
+    self.bad_rows += len(bad_df)
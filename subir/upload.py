@@ -1,20 +1,59 @@
 import io
 import re
+import uuid
+import hashlib
 import pandas as pd
 
 from . import base
 from data_layer import Redshift as SQL
-from .query import ColumnTypeQuery, CreateTableQuery, DropTableQuery, PrepareUploadTableQuery, AppendUploadQuery, ReplaceUploadQuery, MergeUploadQuery, MergeReplaceUploadQuery
-from typing import Dict, List
+from .load import Loader, InsertLoader
+from .session import Session, SessionPool, use_session
+from .cache import ColumnTypeCache
+from .trace import Tracer, data_frame_bytes
+from .pipeline import Pipeline
+from .plan import Plan, fold_queries
+from .source import CSVSource, input_source
+from .checkpoint import MergeCheckpoint, UploadCheckpoint, data_frame_checksum
+from .typed import TypedReader
+from .query import ColumnTypeQuery, SchemaColumnTypeQuery, CreateTableQuery, DropTableQuery, PrepareUploadTableQuery, AppendUploadQuery, ReplaceUploadQuery, MergeUploadQuery, MergeReplaceUploadQuery, PartitionUploadTableQuery, UploadRowCountQuery, LockTableQuery
+from typing import Optional, Iterable, Dict, List, Tuple
 
 class Uploader():
-  def get_table_structure(self, csv_stream: io.TextIOWrapper):
-    df = pd.read_csv(csv_stream, thousands=',')
+  loader: Loader
+  session: Optional[Session]
+  column_type_cache: Optional[ColumnTypeCache]
+  tracer: Tracer
+
+  def __init__(self, loader: Optional[Loader]=None, session: Optional[Session]=None, column_type_cache: Optional[ColumnTypeCache]=None, tracer: Optional[Tracer]=None):
+    self.loader = loader if loader is not None else InsertLoader()
+    self.session = session
+    self.column_type_cache = column_type_cache
+    self.tracer = tracer if tracer is not None else Tracer()
+
+  def get_table_structure(self, csv_stream: any, chunk_size: Optional[int]=None, sample_rows: Optional[int]=None):
+    source = input_source(csv_stream)
+    if chunk_size is None or sample_rows is not None:
+      df = next(iter(source.read(chunk_size=sample_rows)))
+      column_types = {
+        base.sanitized_column_name(c): base.ColumnType.from_pd_column(df[c]).value
+        for c in df
+      }
+      return column_types
+
+    return self.scan_table_structure(csv_stream=source, chunk_size=chunk_size)[0]
+
+  def scan_table_structure(self, csv_stream: any, chunk_size: Optional[int]=None) -> Tuple[Dict[str, str], int]:
+    rows = 0
+    column_statistics = {}
+    for df in input_source(csv_stream).read(chunk_size=chunk_size):
+      rows += len(df)
+      for c in df:
+        column_statistics.setdefault(c, base.ColumnStatistics()).update(df[c])
     column_types = {
-      base.sanitized_column_name(c): base.ColumnType.from_pd_column(df[c]).value
-      for c in df
+      base.sanitized_column_name(c): s.column_type.value
+      for c, s in column_statistics.items()
     }
-    return column_types
+    return column_types, rows
   
   def validate_column_types(self, column_types_dictionary: Dict[str, str]):
     column_type_values = [t.value for t in base.ColumnType]
@@ -24,8 +63,8 @@ class Uploader():
       if t not in column_type_values:
         raise ValueError('Invalid column type', t)
   
-  def create_table_query_text_from_stream(self, schema_name: str, table_name: str, csv_stream: io.TextIOWrapper):
-    column_types = self.get_table_structure(csv_stream=csv_stream)
+  def create_table_query_text_from_stream(self, schema_name: str, table_name: str, csv_stream: io.TextIOWrapper, chunk_size: Optional[int]=None, sample_rows: Optional[int]=None):
+    column_types = self.get_table_structure(csv_stream=csv_stream, chunk_size=chunk_size, sample_rows=sample_rows)
     return self.create_table_query(schema_name=schema_name, table_name=table_name,column_types=column_types).substituted_query
 
   def create_table_query(self, schema_name: str, table_name: str, column_types: Dict[str, str], read_only_groups: List[str]=[]) -> SQL.Query:
@@ -39,13 +78,52 @@ class Uploader():
       raise ValueError('Invalid table name', table_name)
     return DropTableQuery(schema=schema_name, table=table_name)
 
+  def run_table_query(self, schema_name: str, table_name: str, query: SQL.Query):
+    with use_session(self.session) as session:
+      layer = session.connect()
+      query.run(sql_layer=layer)
+      layer.commit()
+    self.invalidate_column_types(schema_name=schema_name, table_name=table_name)
+
+  def create_table(self, schema_name: str, table_name: str, column_types: Dict[str, str], read_only_groups: List[str]=[]):
+    query = self.create_table_query(schema_name=schema_name, table_name=table_name, column_types=column_types, read_only_groups=read_only_groups)
+    self.run_table_query(schema_name=schema_name, table_name=table_name, query=query)
+
+  def delete_table(self, schema_name: str, table_name: str):
+    query = self.delete_table_query(schema_name=schema_name, table_name=table_name)
+    self.run_table_query(schema_name=schema_name, table_name=table_name, query=query)
+
+  def invalidate_column_types(self, schema_name: str, table_name: str):
+    if self.column_type_cache is not None:
+      self.column_type_cache.invalidate(database=SQL.Layer.connection_options.database, schema=schema_name, table=table_name)
+
+  def prefetch_column_types(self, schema_name: str) -> Dict[str, Dict[str, str]]:
+    schema_query = SchemaColumnTypeQuery(
+      database=SQL.Layer.connection_options.database,
+      schema=schema_name
+    )
+    with use_session(self.session) as session:
+      tables = schema_query.cursor_to_result(schema_query.run(sql_layer=session.connect()))
+    if self.column_type_cache is not None:
+      for table_name, column_results in tables.items():
+        self.column_type_cache.set(database=schema_query.database, schema=schema_name, table=table_name, column_types=column_results)
+    return tables
+
   def get_column_types_result(self, schema_name: str, table_name: str) -> Dict[str, str]:
     column_type_query = ColumnTypeQuery(
       database=SQL.Layer.connection_options.database,
       schema=schema_name,
       table=table_name
     )
-    return column_type_query.get_result()
+    if self.column_type_cache is not None:
+      column_results = self.column_type_cache.get(database=column_type_query.database, schema=schema_name, table=table_name)
+      if column_results is not None:
+        return column_results
+    with use_session(self.session) as session:
+      column_results = column_type_query.cursor_to_result(column_type_query.run(sql_layer=session.connect()))
+    if self.column_type_cache is not None and column_results:
+      self.column_type_cache.set(database=column_type_query.database, schema=schema_name, table=table_name, column_types=column_results)
+    return column_results
 
   def get_column_types(self, schema_name: str, table_name: str) -> Dict[str, str]:
     if base.sanitized_relation_name(name=table_name) != table_name:
@@ -56,68 +134,344 @@ class Uploader():
       for c, t in column_results.items()
     }
 
-  def upload(self, schema_name: str, table_name: str, merge_column_names: List[str], csv_stream: io.TextIOWrapper, replace: bool=False, accept_invalid_characters: bool=False, empty_as_null: bool=False, transform_data_frame: bool=False, merge_replace: bool=False):
-    column_types = self.get_column_types(schema_name=schema_name, table_name=table_name)
-    type_transforms = {
-      c: t.pd_type
-      for c, t in column_types.items()
-    }
+  def read_data_frames(self, csv_stream: any, chunk_size: Optional[int]=None, column_names: Optional[List[str]]=None, dtype: Optional[any]=None) -> Iterable[pd.DataFrame]:
+    source = input_source(csv_stream)
+    if column_names is None:
+      return source.read(chunk_size=chunk_size, dtype=dtype)
+    projected_column_names = set(column_names)
+    return source.read(column_filter=lambda c: base.sanitized_column_name(c) in projected_column_names, chunk_size=chunk_size, dtype=dtype)
 
-    df = pd.read_csv(csv_stream, thousands=',')
-    df.rename(base.sanitized_column_name, axis='columns', inplace=True)
-    columns = list(filter(lambda s: s in type_transforms.keys(), df.columns))
-    missing_columns = set(type_transforms.keys()) - set(columns)
+  def table_data_frame(self, data_frame: pd.DataFrame, column_names: List[str]) -> pd.DataFrame:
+    data_frame.rename(base.sanitized_column_name, axis='columns', inplace=True)
+    columns = list(filter(lambda s: s in column_names, data_frame.columns))
+    missing_columns = set(column_names) - set(columns)
     if missing_columns:
       raise ValueError('CSV does not contain all table columns', sorted(missing_columns))
-    df = pd.DataFrame(df, columns=columns)
-    self.upload_data_frame(
+    return pd.DataFrame(data_frame, columns=columns)
+
+  def traced_table_data_frame(self, data_frame: pd.DataFrame, column_names: List[str]) -> pd.DataFrame:
+    with self.tracer.stage('upload.transform', rows=len(data_frame)) as record:
+      table_df = self.table_data_frame(data_frame=data_frame, column_names=column_names)
+      record.bytes = data_frame_bytes(table_df)
+    return table_df
+
+  def traced_typed_data_frame(self, data_frame: pd.DataFrame, typed_reader: TypedReader) -> pd.DataFrame:
+    with self.tracer.stage('upload.validate', rows=len(data_frame)) as record:
+      typed_df = typed_reader.convert(data_frame=data_frame)
+      record.bytes = data_frame_bytes(typed_df)
+    return typed_df
+
+  def traced_prepared_data_frame(self, data_frame: pd.DataFrame, column_type_transform_dictionary: Dict[str, any], empty_as_null: bool) -> pd.DataFrame:
+    with self.tracer.stage('upload.type', rows=len(data_frame)):
+      return self.loader.prepare(
+        data_frame=data_frame,
+        column_type_transform_dictionary=column_type_transform_dictionary,
+        empty_as_null=empty_as_null
+      )
+
+  def upload(self, schema_name: str, table_name: str, merge_column_names: List[str], csv_stream: any, replace: bool=False, accept_invalid_characters: bool=False, empty_as_null: bool=False, transform_data_frame: bool=False, merge_replace: bool=False, chunk_size: Optional[int]=None, pipeline_depth: int=0, merge_partitions: int=0, merge_checkpoint_path: Optional[str]=None, typed_read: bool=False, upload_checkpoint_path: Optional[str]=None) -> int:
+    with self.tracer.stage('upload.column_types'):
+      if base.sanitized_relation_name(name=table_name) != table_name:
+        raise ValueError('Invalid table name', table_name)
+      column_results = self.get_column_types_result(schema_name=schema_name, table_name=table_name)
+    type_transforms = {
+      c: base.ColumnType.from_query_result(t).pd_type
+      for c, t in column_results.items()
+    }
+
+    source = input_source(csv_stream)
+    typed_reader = TypedReader.for_table(column_results=column_results, schema_name=schema_name, table_name=table_name) if typed_read else None
+    read_dtype = typed_reader.read_dtype(column_names=source.column_names() if isinstance(source, CSVSource) else None) if typed_reader is not None and not source.typed else None
+    data_frames = self.tracer.iterate('upload.parse', self.read_data_frames(
+      csv_stream=source,
+      chunk_size=chunk_size,
+      column_names=list(type_transforms.keys()),
+      dtype=read_dtype
+    ))
+    checkpoint = UploadCheckpoint(path=upload_checkpoint_path, schema=schema_name, table=table_name, chunk_size=chunk_size) if upload_checkpoint_path else None
+    if checkpoint is not None:
+      checkpoint.save()
+      data_frames = checkpoint.unloaded_data_frames(data_frames=data_frames)
+      if typed_reader is not None:
+        typed_reader.rows = checkpoint.input_rows
+    data_frames = (self.traced_table_data_frame(data_frame=df, column_names=list(type_transforms.keys())) for df in data_frames)
+    if typed_reader is not None:
+      data_frames = (self.traced_typed_data_frame(data_frame=df, typed_reader=typed_reader) for df in data_frames)
+    try:
+      if not pipeline_depth:
+        return self.upload_data_frames(
+          schema_name=schema_name,
+          table_name=table_name,
+          merge_column_names=merge_column_names,
+          data_frames=data_frames,
+          column_type_transform_dictionary=type_transforms,
+          replace=replace,
+          accept_invalid_characters=accept_invalid_characters,
+          empty_as_null=empty_as_null,
+          transform_data_frame=transform_data_frame,
+          merge_replace=merge_replace,
+          merge_partitions=merge_partitions,
+          merge_checkpoint_path=merge_checkpoint_path,
+          upload_checkpoint=checkpoint
+        )
+
+      prepared_data_frames = (
+        self.traced_prepared_data_frame(data_frame=df, column_type_transform_dictionary=type_transforms, empty_as_null=empty_as_null)
+        for df in data_frames
+      )
+      with Pipeline(prepared_data_frames, depth=pipeline_depth, name=f'subir-upload-{table_name}') as pipeline:
+        return self.upload_data_frames(
+          schema_name=schema_name,
+          table_name=table_name,
+          merge_column_names=merge_column_names,
+          data_frames=pipeline,
+          column_type_transform_dictionary=type_transforms,
+          replace=replace,
+          accept_invalid_characters=accept_invalid_characters,
+          empty_as_null=empty_as_null,
+          transform_data_frame=transform_data_frame,
+          merge_replace=merge_replace,
+          merge_partitions=merge_partitions,
+          merge_checkpoint_path=merge_checkpoint_path,
+          upload_checkpoint=checkpoint,
+          prepared=True
+        )
+    finally:
+      if typed_reader is not None and typed_reader.bad_rows:
+        print(f'Skipped {typed_reader.bad_rows} of {typed_reader.rows} rows that do not fit {schema_name}.{table_name}, written to {typed_reader.bad_rows_path}')
+
+  def pooled_uploader(self, session: Session) -> any:
+    return Uploader(loader=self.loader, session=session, column_type_cache=self.column_type_cache, tracer=self.tracer)
+
+  async def upload_async(self, pool: SessionPool, schema_name: str, table_name: str, merge_column_names: List[str], csv_stream: any, replace: bool=False, accept_invalid_characters: bool=False, empty_as_null: bool=False, transform_data_frame: bool=False, merge_replace: bool=False, chunk_size: Optional[int]=None, pipeline_depth: int=0, merge_partitions: int=0, merge_checkpoint_path: Optional[str]=None, typed_read: bool=False, upload_checkpoint_path: Optional[str]=None) -> int:
+    return await pool.run_async(lambda session: self.pooled_uploader(session=session).upload(
       schema_name=schema_name,
       table_name=table_name,
       merge_column_names=merge_column_names,
-      data_frame=df,
-      column_type_transform_dictionary=type_transforms,
+      csv_stream=csv_stream,
+      replace=replace,
+      accept_invalid_characters=accept_invalid_characters,
+      empty_as_null=empty_as_null,
+      transform_data_frame=transform_data_frame,
+      merge_replace=merge_replace,
+      chunk_size=chunk_size,
+      pipeline_depth=pipeline_depth,
+      merge_partitions=merge_partitions,
+      merge_checkpoint_path=merge_checkpoint_path,
+      typed_read=typed_read,
+      upload_checkpoint_path=upload_checkpoint_path
+    ))
+
+  def upload_data_frame(self, schema_name: str, table_name: str, merge_column_names: List[str], data_frame: pd.DataFrame, column_type_transform_dictionary: Dict[str, any], replace: bool=False, accept_invalid_characters: bool=False, empty_as_null: bool=False, transform_data_frame: bool=False, merge_replace: bool=False, merge_partitions: int=0, merge_checkpoint_path: Optional[str]=None) -> int:
+    return self.upload_data_frames(
+      schema_name=schema_name,
+      table_name=table_name,
+      merge_column_names=merge_column_names,
+      data_frames=[data_frame],
+      column_type_transform_dictionary=column_type_transform_dictionary,
       replace=replace,
       accept_invalid_characters=accept_invalid_characters,
       empty_as_null=empty_as_null,
       transform_data_frame=transform_data_frame,
-      merge_replace=merge_replace
+      merge_replace=merge_replace,
+      merge_partitions=merge_partitions,
+      merge_checkpoint_path=merge_checkpoint_path
     )
 
-  def upload_data_frame(self, schema_name: str, table_name: str, merge_column_names: List[str], data_frame: pd.DataFrame, column_type_transform_dictionary: Dict[str, any], replace: bool=False, accept_invalid_characters: bool=False, empty_as_null: bool=False, transform_data_frame: bool=False, merge_replace: bool=False):
-    layer = SQL.Layer()
+  def combine_query(self, schema_name: str, table_name: str, merge_column_names: List[str], columns: List[str], replace: bool=False, merge_replace: bool=False, upload_table: Optional[str]=None) -> SQL.Query:
+    if replace:
+      return ReplaceUploadQuery(schema=schema_name, table=table_name, upload_table=upload_table)
+    elif merge_replace:
+      return MergeReplaceUploadQuery(join_columns=merge_column_names, schema=schema_name, table=table_name, upload_table=upload_table)
+    elif merge_column_names:
+      update_columns = [c for c in columns if c not in merge_column_names]
+      return MergeUploadQuery(join_columns=merge_column_names, update_columns=update_columns, schema=schema_name, table=table_name, upload_table=upload_table)
+    else:
+      return AppendUploadQuery(schema=schema_name, table=table_name, upload_table=upload_table)
 
+  def combine_partitions(self, layer: SQL.Layer, schema_name: str, table_name: str, merge_column_names: List[str], columns: List[str], merge_replace: bool, partitions: int, checkpoint_path: Optional[str]=None, upload_table: Optional[str]=None, staged_input: Optional[str]=None):
+    checkpoint = MergeCheckpoint(path=checkpoint_path, schema=schema_name, table=table_name, partitions=partitions, staged_input=staged_input) if checkpoint_path else None
+    partition_table = None
+    try:
+      for partition in range(partitions):
+        if checkpoint is not None and partition in checkpoint.completed:
+          print(f'Skipping partition {partition + 1}/{partitions} of {schema_name}.{table_name}, merged by a previous run')
+          continue
+        partition_query = PartitionUploadTableQuery(
+          schema=schema_name,
+          table=table_name,
+          partition_columns=merge_column_names,
+          partition=partition,
+          partitions=partitions,
+          upload_table=upload_table
+        )
+        partition_table = partition_query.partition_table
+        combine_query = self.combine_query(
+          schema_name=schema_name,
+          table_name=table_name,
+          merge_column_names=merge_column_names,
+          columns=columns,
+          merge_replace=merge_replace,
+          upload_table=partition_table
+        )
+        with self.tracer.stage('upload.combine_partition') as record:
+          fold_queries([
+            LockTableQuery(schema=schema_name, table=table_name),
+            partition_query,
+            combine_query,
+            SQL.Query('commit;'),
+          ]).run(sql_layer=layer)
+        if checkpoint is not None:
+          checkpoint.complete(partition=partition)
+        print(f'Merged partition {partition + 1}/{partitions} of {schema_name}.{table_name} in {record.seconds:.1f}s')
+    except BaseException:
+      SQL.Query('rollback;').run(sql_layer=layer)
+      raise
+    finally:
+      if partition_table is not None:
+        SQL.Query(f'drop table if exists {partition_table};').run(sql_layer=layer)
+    if checkpoint is not None:
+      checkpoint.clear()
+
+  def upload_plan(self, schema_name: str, table_name: str, merge_column_names: List[str], data_frames: Iterable[pd.DataFrame], column_type_transform_dictionary: Dict[str, any], replace: bool=False, accept_invalid_characters: bool=False, empty_as_null: bool=False, transform_data_frame: bool=False, merge_replace: bool=False, merge_partitions: int=0, merge_checkpoint_path: Optional[str]=None, upload_checkpoint: Optional[UploadCheckpoint]=None, prepared: bool=False, rows: Optional[int]=None) -> Plan:
+    if not 0 <= merge_partitions <= 256:
+      raise ValueError('Merge partitions must be between 0 and 256', merge_partitions)
     prepare_upload_query = PrepareUploadTableQuery(
       schema=schema_name,
-      table=table_name
+      table=table_name,
+      upload_table=upload_checkpoint.staging_table if upload_checkpoint is not None else f'flx_upload_{table_name}_{uuid.uuid4().hex[:12]}',
+      temporary=upload_checkpoint is None
     )
-    drop_upload_query = SQL.Query(f'drop table {prepare_upload_query.upload_table};')
+    upload_table = prepare_upload_query.upload_table
+    plan = Plan(name=f'{schema_name}_{table_name}', transaction=False)
+    plan.add_query('upload.prepare', prepare_upload_query)
 
-    layer.connect()
-    layer.connection.autocommit = True
-    prepare_upload_query.run(sql_layer=layer)
+    staged_digest = hashlib.sha1() if merge_checkpoint_path and upload_checkpoint is None else None
 
-    try:
-      layer.insert_data_frame(
-        data_frame=data_frame,
-        table_name=prepare_upload_query.upload_table,
-        schema_name=None,
-        column_type_transform_dictionary=column_type_transform_dictionary,
-        accept_invalid_characters=accept_invalid_characters,
-        empty_as_null=empty_as_null,
-        transform_data_frame=transform_data_frame
+    def load(layer: SQL.Layer) -> int:
+      row_count = upload_checkpoint.loaded_rows if upload_checkpoint is not None else 0
+      staged_rows = None
+      for data_frame in data_frames:
+        row_count += len(data_frame)
+        if upload_checkpoint is not None and staged_rows is None:
+          staged_rows = self.checkpointed_row_count(layer=layer, upload_checkpoint=upload_checkpoint, rows=len(data_frame))
+          if staged_rows > upload_checkpoint.loaded_rows:
+            upload_checkpoint.complete(loaded_rows=len(data_frame))
+            continue
+        with self.tracer.stage('upload.load', rows=len(data_frame), bytes=data_frame_bytes(data_frame)):
+          self.loader.load(
+            layer=layer,
+            data_frame=data_frame,
+            table_name=upload_table,
+            schema_name=None,
+            column_type_transform_dictionary=column_type_transform_dictionary,
+            accept_invalid_characters=accept_invalid_characters,
+            empty_as_null=empty_as_null,
+            transform_data_frame=transform_data_frame,
+            prepared=prepared
+          )
+        if upload_checkpoint is not None:
+          upload_checkpoint.complete(loaded_rows=len(data_frame))
+        if staged_digest is not None:
+          staged_digest.update(data_frame_checksum(data_frame).encode('utf-8'))
+      if upload_checkpoint is not None and staged_rows is None:
+        self.checkpointed_row_count(layer=layer, upload_checkpoint=upload_checkpoint, rows=0)
+      combine_step.rows = row_count
+      return row_count
+    plan.add_call('upload.load', f'load data frames into {upload_table}', load, rows=rows)
+
+    columns = list(data_frames[-1].columns) if isinstance(data_frames, list) and data_frames else list(column_type_transform_dictionary.keys())
+    partitioned = bool(merge_partitions and merge_column_names and not replace)
+    if partitioned:
+      def combine(layer: SQL.Layer):
+        staged_input = upload_checkpoint.staging_table if upload_checkpoint is not None else f'{combine_step.rows}:{staged_digest.hexdigest()}' if staged_digest is not None else None
+        with self.tracer.stage('upload.combine', rows=combine_step.rows):
+          self.combine_partitions(
+            layer=layer,
+            schema_name=schema_name,
+            table_name=table_name,
+            merge_column_names=merge_column_names,
+            columns=columns,
+            merge_replace=merge_replace,
+            partitions=merge_partitions,
+            checkpoint_path=merge_checkpoint_path,
+            upload_table=upload_table,
+            staged_input=staged_input
+          )
+      combine_step = plan.add_call('upload.combine', f'merge {upload_table} into {schema_name}.{table_name} in {merge_partitions} partitions', combine, rows=rows)
+      plan.add_query('upload.drop_staging', SQL.Query(f'drop table {upload_table};'))
+    else:
+      combine_query = self.combine_query(
+        schema_name=schema_name,
+        table_name=table_name,
+        merge_column_names=merge_column_names,
+        columns=columns,
+        replace=replace,
+        merge_replace=merge_replace,
+        upload_table=upload_table
       )
+      plan.add_query('upload.lock', LockTableQuery(schema=schema_name, table=table_name))
+      combine_step = plan.add_query('upload.combine', combine_query, rows=rows)
+      plan.add_query('upload.drop_staging', SQL.Query(f'drop table {upload_table};'))
+      plan.add_query('upload.unlock', SQL.Query('commit;'))
 
-      if replace:
-        combine_query = ReplaceUploadQuery(schema=schema_name, table=table_name)
-      elif merge_replace:
-        combine_query = MergeReplaceUploadQuery(join_columns=merge_column_names, schema=schema_name, table=table_name)
-      elif merge_column_names:
-        update_columns = [c for c in data_frame.columns if c not in merge_column_names]
-        combine_query = MergeUploadQuery(join_columns=merge_column_names, update_columns=update_columns, schema=schema_name, table=table_name)
-      else:
-        combine_query = AppendUploadQuery(schema=schema_name, table=table_name)
-
-      combine_query.run(sql_layer=layer)
-    finally:
-      drop_upload_query.run(sql_layer=layer)
-      layer.disconnect()
\ No newline at end of file
+    if upload_checkpoint is None:
+      plan.add_cleanup_query('upload.drop_staging', SQL.Query(f'drop table if exists {upload_table};'))
+    else:
+      plan.add_call('upload.clear_checkpoint', f'remove upload checkpoint {upload_checkpoint.path}', lambda layer: upload_checkpoint.clear())
+    return plan
+
+  def checkpointed_row_count(self, layer: SQL.Layer, upload_checkpoint: UploadCheckpoint, rows: int) -> int:
+    row_count_query = UploadRowCountQuery(schema=upload_checkpoint.schema, table=upload_checkpoint.table, upload_table=upload_checkpoint.staging_table)
+    staged_rows = row_count_query.cursor_to_result(row_count_query.run(sql_layer=layer))
+    if rows and staged_rows == upload_checkpoint.loaded_rows + rows:
+      print(f'Found chunk {len(upload_checkpoint.chunks) + 1} of {upload_checkpoint.schema}.{upload_checkpoint.table} ({rows} rows) in {upload_checkpoint.staging_table}, loaded by a previous run')
+    elif staged_rows != upload_checkpoint.loaded_rows:
+      raise ValueError('Staging table does not match upload checkpoint', upload_checkpoint.staging_table, staged_rows, upload_checkpoint.loaded_rows)
+    return staged_rows
+
+  def plan_upload(self, schema_name: str, table_name: str, merge_column_names: List[str], csv_stream: any, replace: bool=False, merge_replace: bool=False, chunk_size: Optional[int]=None, merge_partitions: int=0, merge_checkpoint_path: Optional[str]=None, upload_checkpoint_path: Optional[str]=None) -> Plan:
+    column_results = self.column_type_cache.get(database=SQL.Layer.connection_options.database, schema=schema_name, table=table_name) if self.column_type_cache is not None else None
+    rows = None
+    if column_results is None:
+      column_results, rows = self.scan_table_structure(csv_stream=csv_stream, chunk_size=chunk_size)
+    type_transforms = {
+      c: base.ColumnType.from_query_result(t).pd_type
+      for c, t in column_results.items()
+    }
+    if rows is None:
+      rows = sum(len(df) for df in self.read_data_frames(csv_stream=csv_stream, chunk_size=chunk_size, column_names=list(type_transforms.keys())))
+    return self.upload_plan(
+      schema_name=schema_name,
+      table_name=table_name,
+      merge_column_names=merge_column_names,
+      data_frames=[],
+      column_type_transform_dictionary=type_transforms,
+      replace=replace,
+      merge_replace=merge_replace,
+      merge_partitions=merge_partitions,
+      merge_checkpoint_path=merge_checkpoint_path,
+      upload_checkpoint=UploadCheckpoint(path=upload_checkpoint_path, schema=schema_name, table=table_name, chunk_size=chunk_size) if upload_checkpoint_path else None,
+      rows=rows
+    )
+
+  def upload_data_frames(self, schema_name: str, table_name: str, merge_column_names: List[str], data_frames: Iterable[pd.DataFrame], column_type_transform_dictionary: Dict[str, any], replace: bool=False, accept_invalid_characters: bool=False, empty_as_null: bool=False, transform_data_frame: bool=False, merge_replace: bool=False, merge_partitions: int=0, merge_checkpoint_path: Optional[str]=None, upload_checkpoint: Optional[UploadCheckpoint]=None, prepared: bool=False) -> int:
+    plan = self.upload_plan(
+      schema_name=schema_name,
+      table_name=table_name,
+      merge_column_names=merge_column_names,
+      data_frames=data_frames,
+      column_type_transform_dictionary=column_type_transform_dictionary,
+      replace=replace,
+      accept_invalid_characters=accept_invalid_characters,
+      empty_as_null=empty_as_null,
+      transform_data_frame=transform_data_frame,
+      merge_replace=merge_replace,
+      merge_partitions=merge_partitions,
+      merge_checkpoint_path=merge_checkpoint_path,
+      upload_checkpoint=upload_checkpoint,
+      prepared=prepared
+    )
+    with use_session(self.session) as session, session.autocommit() as layer:
+      plan.run(layer=layer, tracer=self.tracer)
+    return plan.step('upload.load').result
@@ -0,0 +1,108 @@
+import pytest
+import pandas as pd
+
+from data_layer import Redshift as SQL
+from subir.load import Loader
+from subir.session import Session
+from typing import Optional, List, Tuple
+
+class RecordingCursor:
+  rows: List[tuple]
+
+  def __init__(self, rows: List[tuple]):
+    self.rows = rows
+
+  def fetchone(self) -> Optional[tuple]:
+    return self.rows[0] if self.rows else None
+
+  def fetchall(self) -> List[tuple]:
+    return self.rows
+
+class RecordingConnection:
+  autocommit: bool
+  commits: int
+  rollbacks: int
+
+  def __init__(self):
+    self.autocommit = False
+    self.commits = 0
+    self.rollbacks = 0
+
+  def commit(self):
+    self.commits += 1
+
+  def rollback(self):
+    self.rollbacks += 1
+
+class RecordingDatabase:
+  statements: List[Tuple[str, tuple]]
+  responses: List[Tuple[str, List[tuple]]]
+  failures: List[List[any]]
+
+  def __init__(self):
+    self.statements = []
+    self.responses = []
+    self.failures = []
+
+  def respond(self, text: str, rows: List[tuple]):
+    self.responses.append((text, rows))
+
+  def fail(self, text: str, skip: int=0):
+    self.failures.append([text, skip])
+
+  def run(self, query: SQL.Query) -> RecordingCursor:
+    self.statements.append((query.query.strip(), tuple(query.substitution_parameters or ())))
+    failure = next((f for f in self.failures if f[0] in query.query), None)
+    if failure is not None:
+      if failure[1]:
+        failure[1] -= 1
+      else:
+        self.failures.remove(failure)
+        raise RuntimeError('Query failed', failure[0])
+    return RecordingCursor(rows=next((r for t, r in self.responses if t in query.query), []))
+
+  @property
+  def queries(self) -> List[str]:
+    return [q for q, _ in self.statements]
+
+class RecordingLayer(SQL.Layer):
+  def __init__(self):
+    super().__init__()
+    self.connection = None
+
+  def connect(self):
+    self.connection = RecordingConnection()
+
+  def disconnect(self):
+    self.connection = None
+
+  def commit(self):
+    self.connection.commit()
+
+class RecordingLoader(Loader):
+  loaded: List[pd.DataFrame]
+  failures: List[int]
+
+  def __init__(self):
+    self.loaded = []
+    self.failures = []
+
+  def load(self, layer: SQL.Layer, data_frame: pd.DataFrame, schema_name: Optional[str], table_name: str, **kwargs):
+    if len(self.loaded) in self.failures:
+      self.failures.remove(len(self.loaded))
+      raise RuntimeError('Load failed', table_name)
+    self.loaded.append(data_frame)
+
+@pytest.fixture
+def database(monkeypatch: any) -> RecordingDatabase:
+  database = RecordingDatabase()
+  monkeypatch.setattr(SQL.Query, 'run', lambda query, sql_layer: database.run(query=query))
+  return database
+
+@pytest.fixture
+def session() -> Session:
+  return Session(layer=RecordingLayer())
+
+@pytest.fixture
+def loader() -> RecordingLoader:
+  return RecordingLoader()
@@ -0,0 +1,141 @@
+import os
+import json
+import pytest
+import pandas as pd
+
+from subir.checkpoint import MergeCheckpoint, UploadCheckpoint
+from subir.upload import Uploader
+
+def merge_plan(uploader: Uploader, data_frame: pd.DataFrame, checkpoint_path: str) -> any:
+  return uploader.upload_plan(
+    schema_name='s',
+    table_name='t',
+    merge_column_names=['a'],
+    data_frames=[data_frame],
+    column_type_transform_dictionary={'a': 'int64', 'b': 'object'},
+    merge_partitions=2,
+    merge_checkpoint_path=checkpoint_path
+  )
+
+def test_merge_checkpoint_round_trip(tmp_path: any):
+  path = str(tmp_path / 'merge.json')
+  checkpoint = MergeCheckpoint(path=path, schema='s', table='t', partitions=4, staged_input='10:abc')
+  checkpoint.complete(partition=2)
+  assert MergeCheckpoint(path=path, schema='s', table='t', partitions=4, staged_input='10:abc').completed == {2}
+  checkpoint.clear()
+  assert not os.path.exists(path)
+
+@pytest.mark.parametrize('options', [
+  {'partitions': 8, 'staged_input': '10:abc'},
+  {'partitions': 4, 'staged_input': '10:def'},
+  {'partitions': 4, 'staged_input': None},
+])
+def test_merge_checkpoint_rejects_other_uploads(tmp_path: any, options: dict):
+  path = str(tmp_path / 'merge.json')
+  MergeCheckpoint(path=path, schema='s', table='t', partitions=4, staged_input='10:abc').complete(partition=0)
+  with pytest.raises(ValueError):
+    MergeCheckpoint(path=path, schema='s', table='t', **options)
+
+def test_partitioned_merge_resumes_only_for_the_same_staged_data(tmp_path: any, database: any, session: any, loader: any):
+  path = str(tmp_path / 'merge.json')
+  uploader = Uploader(loader=loader, session=session)
+  staged_df = pd.DataFrame({'a': [1, 2], 'b': ['x', 'y']})
+  database.fail('lock table s.t', skip=1)
+  with pytest.raises(RuntimeError):
+    merge_plan(uploader=uploader, data_frame=staged_df, checkpoint_path=path).run(layer=session.connect())
+  assert os.path.exists(path)
+
+  with pytest.raises(ValueError):
+    merge_plan(uploader=uploader, data_frame=pd.DataFrame({'a': [3, 4], 'b': ['x', 'y']}), checkpoint_path=path).run(layer=session.connect())
+
+  database.statements.clear()
+  merge_plan(uploader=uploader, data_frame=staged_df, checkpoint_path=path).run(layer=session.connect())
+  assert len([q for q in database.queries if 'lock table s.t' in q]) == 1
+  assert not os.path.exists(path)
+
+def test_failed_partition_merge_rolls_back_before_cleanup(tmp_path: any, database: any, session: any, loader: any):
+  uploader = Uploader(loader=loader, session=session)
+  database.fail('lock table s.t')
+  with pytest.raises(RuntimeError):
+    merge_plan(uploader=uploader, data_frame=pd.DataFrame({'a': [1], 'b': ['x']}), checkpoint_path=str(tmp_path / 'merge.json')).run(layer=session.connect())
+  failed = next(i for i, q in enumerate(database.queries) if 'lock table s.t' in q)
+  assert database.queries[failed + 1] == 'rollback;'
+  assert database.queries[failed + 2].startswith('drop table if exists flx_partition_t_')
+
+def test_upload_staging_tables_are_unique_per_run():
+  uploader = Uploader()
+  plans = [
+    uploader.upload_plan(schema_name='s', table_name='t', merge_column_names=['a'], data_frames=[], column_type_transform_dictionary={'a': 'int64'})
+    for _ in range(2)
+  ]
+  prepare_queries = [p.step('upload.prepare').query.query for p in plans]
+  assert prepare_queries[0] != prepare_queries[1]
+  assert [s.name for s in plans[0].batches[-1]] == ['upload.lock', 'upload.combine', 'upload.drop_staging', 'upload.unlock']
+
+def upload_with_checkpoint(uploader: Uploader, input_path: str, checkpoint_path: str) -> int:
+  return uploader.upload(schema_name='s', table_name='t', merge_column_names=[], csv_stream=input_path, chunk_size=3, upload_checkpoint_path=checkpoint_path)
+
+def staged_rows(database: any, rows: int):
+  database.responses = [r for r in database.responses if 'count(*)' not in r[0]]
+  database.respond('count(*)', [(rows,)])
+
+@pytest.fixture
+def upload_input(tmp_path: any, database: any) -> str:
+  path = str(tmp_path / 'input.csv')
+  pd.DataFrame({'a': range(10), 'b': list('abcdefghij')}).to_csv(path, index=False)
+  database.respond('information_schema.columns', [('a', 'bigint', None), ('b', 'character varying', 10)])
+  return path
+
+def test_upload_checkpoint_skips_loaded_chunks(tmp_path: any, upload_input: str, database: any, session: any, loader: any):
+  checkpoint_path = str(tmp_path / 'upload.json')
+  uploader = Uploader(loader=loader, session=session)
+  loader.failures.append(2)
+  staged_rows(database=database, rows=0)
+  with pytest.raises(RuntimeError):
+    upload_with_checkpoint(uploader=uploader, input_path=upload_input, checkpoint_path=checkpoint_path)
+  checkpoint = UploadCheckpoint(path=checkpoint_path, schema='s', table='t', chunk_size=3)
+  assert [(c['offset'], c['rows']) for c in checkpoint.chunks] == [(0, 3), (3, 3)]
+  assert not any(q.startswith('drop table') for q in database.queries)
+
+  staged_rows(database=database, rows=6)
+  assert upload_with_checkpoint(uploader=uploader, input_path=upload_input, checkpoint_path=checkpoint_path) == 10
+  assert [list(df.a) for df in loader.loaded] == [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]]
+  assert f'drop table {checkpoint.staging_table};' in ' '.join(database.queries)
+  assert not os.path.exists(checkpoint_path)
+
+def test_upload_checkpoint_finds_a_chunk_loaded_before_a_crash(tmp_path: any, upload_input: str, database: any, session: any, loader: any):
+  checkpoint_path = str(tmp_path / 'upload.json')
+  uploader = Uploader(loader=loader, session=session)
+  loader.failures.append(2)
+  staged_rows(database=database, rows=0)
+  with pytest.raises(RuntimeError):
+    upload_with_checkpoint(uploader=uploader, input_path=upload_input, checkpoint_path=checkpoint_path)
+  with open(checkpoint_path, 'r') as checkpoint_file:
+    checkpoint = json.load(checkpoint_file)
+  checkpoint['chunks'].pop()
+  with open(checkpoint_path, 'w') as checkpoint_file:
+    json.dump(checkpoint, checkpoint_file)
+
+  staged_rows(database=database, rows=6)
+  assert upload_with_checkpoint(uploader=uploader, input_path=upload_input, checkpoint_path=checkpoint_path) == 10
+  assert [list(df.a) for df in loader.loaded] == [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]]
+
+def test_upload_checkpoint_rejects_a_staging_table_that_does_not_match(tmp_path: any, upload_input: str, database: any, session: any, loader: any):
+  checkpoint_path = str(tmp_path / 'upload.json')
+  uploader = Uploader(loader=loader, session=session)
+  loader.failures.append(1)
+  staged_rows(database=database, rows=0)
+  with pytest.raises(RuntimeError):
+    upload_with_checkpoint(uploader=uploader, input_path=upload_input, checkpoint_path=checkpoint_path)
+  staged_rows(database=database, rows=5)
+  with pytest.raises(ValueError):
+    upload_with_checkpoint(uploader=uploader, input_path=upload_input, checkpoint_path=checkpoint_path)
+
+def test_upload_checkpoint_rejects_changed_input(tmp_path: any):
+  checkpoint = UploadCheckpoint(path=str(tmp_path / 'upload.json'), schema='s', table='t', chunk_size=2)
+  for _ in checkpoint.unloaded_data_frames(data_frames=[pd.DataFrame({'a': [1, 2]})]):
+    checkpoint.complete(loaded_rows=2)
+  with pytest.raises(ValueError):
+    list(checkpoint.unloaded_data_frames(data_frames=[pd.DataFrame({'a': [1, 3]})]))
+  with pytest.raises(ValueError):
+    UploadCheckpoint(path=checkpoint.path, schema='s', table='t', chunk_size=3)
@@ -0,0 +1,73 @@
+import pytest
+
+from data_layer import Redshift as SQL
+from subir.plan import Plan, fold_queries
+from subir.trace import Tracer, Sink, StageRecord
+from typing import List
+
+class RecordingSink(Sink):
+  records: List[StageRecord]
+
+  def __init__(self):
+    self.records = []
+
+  def record(self, record: StageRecord):
+    self.records.append(record)
+
+def call_plan(transaction: bool=True) -> Plan:
+  plan = Plan(name='p', transaction=transaction)
+  plan.add_query('first', SQL.Query('select 1'))
+  plan.add_query('second', SQL.Query('select %s;', substitution_parameters=(2,)))
+  plan.add_call('call', 'call', lambda layer: None)
+  plan.add_query('third', SQL.Query('select 3;'))
+  plan.add_cleanup_query('cleanup', SQL.Query('drop table if exists t;'))
+  return plan
+
+def test_consecutive_queries_fold_into_one_round_trip():
+  plan = call_plan()
+  assert [[s.name for s in b] for b in plan.batches] == [['first', 'second'], ['call'], ['third']]
+  assert plan.dictionary['round_trips'] == 3
+
+def test_folded_queries_keep_parameters_in_order():
+  query = fold_queries([SQL.Query('select %s', substitution_parameters=(1,)), SQL.Query('select 2;'), SQL.Query('select %s;', substitution_parameters=(3,))])
+  assert query.query == 'select %s;\nselect 2;\nselect %s;'
+  assert query.substitution_parameters == (1, 3)
+
+def test_folding_escapes_percent_signs_only_when_mixed_with_parameters():
+  literal = SQL.Query("select * from t where name like 'a%';")
+  assert fold_queries([literal, SQL.Query('select 1;')]).query == "select * from t where name like 'a%';\nselect 1;"
+  mixed = fold_queries([literal, SQL.Query('select %s;', substitution_parameters=(1,))])
+  assert mixed.query == "select * from t where name like 'a%%';\nselect %s;"
+  assert mixed.query.replace('%%', '').count('%s') == len(mixed.substitution_parameters)
+
+def test_plan_runs_batches_and_commits(database: any, session: any):
+  layer = session.connect()
+  call_plan().run(layer=layer)
+  assert database.queries == ['select 1;\nselect %s;', 'select 3;']
+  assert database.statements[0][1] == (2,)
+  assert layer.connection.commits == 1
+  assert layer.connection.rollbacks == 0
+
+def test_profiled_plan_times_each_query(database: any, session: any):
+  sink = RecordingSink()
+  call_plan().run(layer=session.connect(), tracer=Tracer(sinks=[sink]))
+  assert [r.name for r in sink.records] == ['first', 'second', 'third']
+  assert database.queries == ['select 1', 'select %s;', 'select 3;']
+
+def test_failed_transaction_plan_rolls_back_then_cleans_up(database: any, session: any):
+  layer = session.connect()
+  database.fail('select 3')
+  with pytest.raises(RuntimeError):
+    call_plan().run(layer=layer)
+  assert layer.connection.rollbacks == 1
+  assert database.queries[-1] == 'drop table if exists t;'
+  assert layer.connection.commits == 1
+
+def test_failed_plan_outside_a_transaction_rolls_back_open_blocks_then_cleans_up(database: any, session: any):
+  layer = session.connect()
+  database.fail('select 3')
+  with pytest.raises(RuntimeError):
+    call_plan(transaction=False).run(layer=layer)
+  assert database.queries[-2:] == ['rollback;', 'drop table if exists t;']
+  assert layer.connection.rollbacks == 0
+  assert layer.connection.commits == 0
@@ -0,0 +1,68 @@
+import pytest
+import pandas as pd
+
+from subir.entity import EntityType, BackupStrategy
+from subir.tag import backup_tags_query, restore_tags, upload_tags_plan
+
+entity = EntityType.ad
+
+def test_delta_backup_keeps_touched_rows_and_upload_keys():
+  query = backup_tags_query(schema='s', entity=entity, strategy=BackupStrategy.delta, upload_table_name='upload_tag_ads_run')
+  assert f'insert into s.{entity.restore_table_name}\nselect t.* from s.{entity.table_name} t' in query.query
+  assert 'from s.upload_tag_ads_run u' in query.query
+  assert f'create table s.{entity.restore_keys_table_name} as' in query.query
+  assert query.query.rstrip().endswith('from s.upload_tag_ads_run;')
+  assert not query.substitution_parameters
+
+def test_delta_backup_with_purge_keeps_rows_the_purge_deletes():
+  query = backup_tags_query(schema='s', entity=entity, strategy=BackupStrategy.delta, purge=True, upload_table_name='upload_tag_ads_run')
+  assert f'or t."{entity.value}_subtag" = %s' in query.query
+  assert query.substitution_parameters[-1] == ''
+  assert query.query.count('%s') == len(query.substitution_parameters)
+
+def test_full_backup_copies_the_table_without_keys():
+  query = backup_tags_query(schema='s', entity=entity, strategy=BackupStrategy.full)
+  assert f'insert into s.{entity.restore_table_name} select * from s.{entity.table_name};' in query.query
+  assert f'create table s.{entity.restore_keys_table_name}' not in query.query
+
+def test_no_backup_drops_previous_backups():
+  query = backup_tags_query(schema='s', entity=entity, strategy=BackupStrategy.none)
+  assert f'drop table if exists s.{entity.restore_keys_table_name};' in query.query
+  assert f'drop table if exists s.{entity.restore_table_name};' in query.query
+  assert 'create table' not in query.query
+
+@pytest.mark.parametrize('replace, backup_strategy, keys', [
+  (False, BackupStrategy.delta, True),
+  (True, BackupStrategy.delta, False),
+  (False, BackupStrategy.full, False),
+])
+def test_tag_upload_backs_up_before_merging(replace: bool, backup_strategy: BackupStrategy, keys: bool):
+  tags = pd.DataFrame({'a': [1]})
+  plan = upload_tags_plan(schema='s', entity=entity, tags=tags, replace=replace, backup_strategy=backup_strategy)
+  names = [s.name for s in plan.steps]
+  assert names.index('tag.lock') < names.index('tag.backup') < names.index('tag.merge')
+  backup = plan.step('tag.backup').query.query
+  assert (f'create table s.{entity.restore_keys_table_name}' in backup) == keys
+
+def test_restore_deletes_only_backed_up_keys_after_a_delta_backup(database: any, session: any):
+  database.respond('information_schema.tables', [(entity.restore_table_name,), (entity.restore_keys_table_name,)])
+  assert restore_tags(schema='s', entity=entity, session=session) is BackupStrategy.delta
+  assert database.queries[0] == f'lock table s.{entity.table_name};'
+  restore_query = database.queries[-1]
+  assert f'using s.{entity.restore_keys_table_name} k' in restore_query
+  assert f'using s.{entity.restore_table_name} r' in restore_query
+  assert f'delete from s.{entity.table_name};' not in restore_query
+  assert restore_query.rstrip().endswith(f'insert into s.{entity.table_name} select * from s.{entity.restore_table_name};')
+
+def test_restore_replaces_the_table_after_a_full_backup(database: any, session: any):
+  database.respond('information_schema.tables', [(entity.restore_table_name,)])
+  assert restore_tags(schema='s', entity=entity, session=session) is BackupStrategy.full
+  restore_query = database.queries[-1]
+  assert f'delete from s.{entity.table_name};' in restore_query
+  assert 'using' not in restore_query
+
+def test_restore_without_a_backup_fails(database: any, session: any):
+  database.respond('information_schema.tables', [])
+  with pytest.raises(ValueError):
+    restore_tags(schema='s', entity=entity, session=session)
+  assert not any(q.lstrip().startswith('delete') for q in database.queries)
@@ -0,0 +1,50 @@
+import time
+import asyncio
+import threading
+import pandas as pd
+
+from subir.session import Session, SessionPool
+from subir.upload import Uploader
+from tests.conftest import RecordingLayer
+
+def recording_pool(size: int) -> SessionPool:
+  return SessionPool(size=size, session_factory=lambda: Session(layer=RecordingLayer()))
+
+def test_async_calls_are_bounded_by_the_pool_size():
+  lock = threading.Lock()
+  running = [0, 0]
+  def work(session: Session) -> int:
+    with lock:
+      running[0] += 1
+      running[1] = max(running[1], running[0])
+    time.sleep(0.02)
+    with lock:
+      running[0] -= 1
+    return id(session)
+
+  async def run_all(pool: SessionPool) -> list:
+    return await asyncio.gather(*(pool.run_async(work) for _ in range(6)))
+
+  with recording_pool(size=2) as pool:
+    session_ids = asyncio.run(run_all(pool))
+    assert running[1] == 2
+    assert len(set(session_ids)) == len(pool.all_sessions) == 2
+    assert pool.executor._max_workers == 2
+  assert pool.executor is None
+
+def test_async_uploads_share_pooled_sessions(tmp_path: any, database: any, loader: any):
+  path = str(tmp_path / 'input.csv')
+  pd.DataFrame({'a': range(5)}).to_csv(path, index=False)
+  database.respond('information_schema.columns', [('a', 'bigint', None)])
+  uploader = Uploader(loader=loader)
+
+  async def upload_all(pool: SessionPool) -> list:
+    return await asyncio.gather(*(
+      uploader.upload_async(pool=pool, schema_name='s', table_name='t', merge_column_names=[], csv_stream=path)
+      for _ in range(3)
+    ))
+
+  with recording_pool(size=2) as pool:
+    assert asyncio.run(upload_all(pool)) == [5, 5, 5]
+    assert len(pool.all_sessions) <= 2
+  assert len(loader.loaded) == 3
@@ -0,0 +1,9 @@
+import pytest
+
+from benchmark.startup import import_lines, heavy_imports, subcommands
+
+@pytest.mark.parametrize('subcommand', subcommands)
+def test_help_does_not_import_heavy_packages(subcommand: str):
+  lines = import_lines(subcommand=subcommand)
+  assert heavy_imports(modules=(m for m, _, _ in lines)) == []
+  assert sum(t for _, t, depth in lines if not depth) < 2000000
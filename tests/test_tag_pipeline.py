@@ -0,0 +1,105 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from subir import tag
+from subir.tag import EntityType, convert_id_columns, strip_empty_tags
+from benchmark.generate import tag_frame
+from benchmark.tag_pipeline import legacy_convert_id_columns, legacy_strip_empty_tags
+from benchmark.drop_duplicates import legacy_drop_duplicates, prepared_tags
+
+def random_ids(count: int, seed: int) -> pd.Series:
+  random = np.random.default_rng(seed)
+  samples = [
+    '0', '-0', '7', '-42', '123456789012345678', '1234567890123456789012', '1.5', '-2e3', 'true', 'false', 'null',
+    '""', '"abc"', '"12"', '" padded "', '"esc\\"aped"', '"\\u00e9t\\u00e9"', '"été"', '"tab\\tbed"', ' 12', '12 ', '[1]', '{"a": 1}',
+  ]
+  ids = pd.Series(random.choice(samples, count), dtype='object')
+  ids[random.random(count) < 0.05] = np.nan
+  return ids
+
+@pytest.mark.parametrize('seed', range(50))
+def test_convert_id_columns_matches_legacy(seed: int):
+  entity = EntityType.ad
+  df = tag_frame(rows=200, entity=entity, seed=seed)
+  df['ad_id'] = random_ids(count=len(df), seed=seed)
+  legacy_df = df.copy()
+  legacy_convert_id_columns(legacy_df, entity.id_column_names)
+  convert_id_columns(df, entity.id_column_names)
+  pd.testing.assert_frame_equal(legacy_df, df)
+  assert list(legacy_df['ad_id'].map(type)) == list(df['ad_id'].map(type))
+
+@pytest.mark.parametrize('seed', range(50))
+def test_strip_empty_tags_matches_legacy(seed: int):
+  entity = EntityType.ad
+  df = tag_frame(rows=200, entity=entity, empty_rate=0.2, seed=seed)
+  df.loc[df.index[::7], 'ad_tag'] = '  padded tag  '
+  df.loc[df.index[::11], 'ad_subtag'] = '   '
+  legacy_df = df.copy()
+  legacy_strip_empty_tags(legacy_df, entity.tag_column_names)
+  strip_empty_tags(df, entity.tag_column_names)
+  pd.testing.assert_frame_equal(legacy_df, df)
+
+def drop_duplicates_outputs(monkeypatch: any, df: pd.DataFrame, original_df: pd.DataFrame, entity: EntityType, resolution: str) -> dict:
+  outputs = {}
+  monkeypatch.setattr(tag, 'write_output', lambda df, file_name, description: outputs.__setitem__('non_conflicting' if 'non_conflicting' in file_name else 'conflicting', df))
+  monkeypatch.setattr(tag.click, 'prompt', lambda *args, **kwargs: resolution)
+  tag.drop_duplicates(df=df, original_df=original_df, entity=entity, output_prefix='test', interactive=original_df is not None)
+  return outputs
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('resolution', ['f', 'l', 's'])
+def test_interactive_drop_duplicates_matches_legacy(monkeypatch: any, seed: int, resolution: str):
+  entity = EntityType.ad
+  df, original_df = prepared_tags(rows=500, entity=entity, seed=seed)
+  legacy_df = df.copy()
+  legacy_outputs = {}
+  legacy_drop_duplicates(df=legacy_df, original_df=original_df, entity=entity, outputs=legacy_outputs, resolution=resolution)
+  outputs = drop_duplicates_outputs(monkeypatch=monkeypatch, df=df, original_df=original_df, entity=entity, resolution=resolution)
+  pd.testing.assert_frame_equal(legacy_df, df)
+  for name in ['conflicting', 'non_conflicting']:
+    pd.testing.assert_frame_equal(legacy_outputs[name], outputs[name])
+
+@pytest.mark.parametrize('seed', range(10))
+def test_batch_drop_duplicates_keeps_last(monkeypatch: any, seed: int):
+  entity = EntityType.ad
+  df, _ = prepared_tags(rows=500, entity=entity, seed=seed)
+  legacy_df = df.copy()
+  legacy_drop_duplicates(df=legacy_df, original_df=None, entity=entity, outputs={}, resolution='l')
+  outputs = drop_duplicates_outputs(monkeypatch=monkeypatch, df=df, original_df=None, entity=entity, resolution='l')
+  pd.testing.assert_frame_equal(legacy_df, df)
+  assert not outputs
+
+@pytest.mark.parametrize('purge', [False, True])
+def test_incremental_upload_into_an_empty_table_matches_full_upload(tmp_path: any, database: any, session: any, loader: any, purge: bool):
+  path = str(tmp_path / 'tags.csv')
+  pd.DataFrame({
+    'company': 'c',
+    'app': 'a',
+    'channel': 'Facebook',
+    'ad_id': ['1', '2', '3'],
+    'ad_tag': ['tag', None, None],
+    'ad_subtag': [None, None, 'subtag'],
+  }).to_csv(path, index=False)
+  tagger = tag.Tagger(loader=loader, session=session)
+  uploads = []
+  for incremental in [False, True]:
+    tagger.apply_tags(schema_name='s', entity_name='ad', should_drop=False, should_purge=purge, csv_stream=path, file_name=path, incremental=incremental)
+    uploads.append(list(loader.loaded[-1].ad_id))
+  assert uploads[0] == [1, 2, 3]
+  assert uploads[1] == ([1, 3] if purge else [1, 2, 3])
+
+@pytest.mark.parametrize('failing_step', ['load', 'merge'])
+def test_failed_tag_upload_drops_its_staging_table(database: any, session: any, loader: any, failing_step: str):
+  tags = pd.DataFrame({'channel': ['Facebook'], 'ad_id': ['1'], 'ad_tag': ['tag'], 'ad_subtag': [None]})
+  plan = tag.upload_tags_plan(schema='s', entity=EntityType.ad, tags=tags, loader=loader)
+  upload_table_name = plan.step('tag.prepare').query.query.split()[2]
+  if failing_step == 'load':
+    loader.failures.append(0)
+  else:
+    database.fail('merge')
+  layer = session.connect()
+  with pytest.raises(RuntimeError):
+    plan.run(layer=layer)
+  assert layer.connection.rollbacks == 1
+  assert database.queries[-1] == f'drop table if exists {upload_table_name};'
@@ -0,0 +1,69 @@
+import os
+import pandas as pd
+
+from subir.typed import TypedColumn, TypedReader, row_column, errors_column
+
+def converted(result: str, values: list) -> tuple:
+  series, is_invalid = TypedColumn(name='c', result=result).convert(values=pd.Series(values, dtype='object'))
+  return list(series), list(is_invalid)
+
+def test_integers_respect_column_bounds():
+  values, is_invalid = converted(result='integer', values=['1', '-2147483648', '2147483648', None])
+  assert values[:2] == [1, -2147483648]
+  assert is_invalid == [False, False, True, False]
+  assert pd.isna(values[3])
+
+def test_integers_parse_text_with_commas_and_overflow():
+  values, is_invalid = converted(result='bigint', values=['1,000', ' 7 ', '9223372036854775807', '9223372036854775808', '1.5', 'x'])
+  assert values[:3] == [1000, 7, 9223372036854775807]
+  assert is_invalid == [False, False, False, True, True, True]
+
+def test_decimals_parse_commas():
+  values, is_invalid = converted(result='double precision', values=['1.5', '1,234.5', 'x', None])
+  assert values[:2] == [1.5, 1234.5]
+  assert is_invalid == [False, False, True, False]
+
+def test_booleans_accept_common_spellings():
+  values, is_invalid = converted(result='boolean', values=['True', ' y ', '0', 'F', 'maybe', None])
+  assert values[:4] == [True, True, False, False]
+  assert is_invalid == [False, False, False, False, True, False]
+
+def test_dates_accept_mixed_formats():
+  values, is_invalid = converted(result='date', values=['2020-01-31', '01/02/2020', 'not a date', None])
+  assert values[:2] == [pd.Timestamp('2020-01-31'), pd.Timestamp('2020-01-02')]
+  assert is_invalid == [False, False, True, False]
+
+def test_varchar_lengths_are_counted_in_bytes():
+  _, is_invalid = converted(result='character varying(4)', values=['abcd', 'abcde', 'éé', 'ééé', None])
+  assert is_invalid == [False, True, False, True, False]
+
+def test_read_dtype_matches_sanitized_column_names():
+  reader = TypedReader(column_results={'a b': 'bigint', 'c': 'double precision'}, bad_rows_path='unused.csv')
+  assert reader.read_dtype(column_names=['A B', 'c', 'unknown']) == {'A B': 'object'}
+  assert reader.read_dtype(column_names=None) == 'object'
+
+def test_bad_rows_are_numbered_across_chunks(tmp_path: any):
+  reader = TypedReader.for_table(column_results={'a': 'integer', 'b': 'character varying(2)'}, schema_name='s', table_name='t', directory=str(tmp_path))
+  assert reader.bad_rows_path == os.path.join(str(tmp_path), 's_t_bad_rows.csv')
+  first = reader.convert(pd.DataFrame({'a': ['1', 'x', '3'], 'b': ['ok', 'ok', 'long']}, dtype='object'))
+  second = reader.convert(pd.DataFrame({'a': ['4', 'y'], 'b': ['ok', 'long']}, dtype='object'))
+  assert list(first.a) == [1] and list(second.a) == [4]
+  assert (reader.rows, reader.bad_rows) == (5, 3)
+  bad_rows = pd.read_csv(reader.bad_rows_path, dtype='object')
+  assert list(bad_rows.columns) == [row_column, 'a', 'b', errors_column]
+  assert list(bad_rows[row_column]) == ['2', '3', '5']
+  assert list(bad_rows[errors_column]) == [
+    'a is not a valid integer',
+    'b exceeds character varying(2)',
+    'a is not a valid integer; b exceeds character varying(2)',
+  ]
+
+def test_stale_bad_rows_are_removed_by_a_new_read(tmp_path: any):
+  column_results = {'a': 'integer'}
+  reader = TypedReader.for_table(column_results=column_results, schema_name='s', table_name='t', directory=str(tmp_path))
+  reader.convert(pd.DataFrame({'a': ['x']}, dtype='object'))
+  assert os.path.exists(reader.bad_rows_path)
+  reader = TypedReader.for_table(column_results=column_results, schema_name='s', table_name='t', directory=str(tmp_path))
+  reader.convert(pd.DataFrame({'a': ['1']}, dtype='object'))
+  assert not os.path.exists(reader.bad_rows_path)
+  assert reader.bad_rows == 0